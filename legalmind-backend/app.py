@@ -15,25 +15,37 @@ sys.path.insert(0, str(Path(__file__).parent))
 os.environ.setdefault("PORT", "7860")
 os.environ.setdefault("HOST", "0.0.0.0")
 
-# Import the FastAPI app
-from main import app
+# API worker processes; with more than one, job state must live in the shared store
+WORKERS = int(os.getenv("API_WORKERS", "1"))
+if WORKERS > 1:
+    os.environ.setdefault("JOB_STORE", "sqlite")
+else:
+    # Import the FastAPI app
+    from main import app
 
 def main():
     """Start the FastAPI server"""
     port = int(os.getenv("PORT", 7860))
     host = os.getenv("HOST", "0.0.0.0")
     
+    if WORKERS > 1 and os.getenv("JOB_STORE") != "sqlite":
+        raise SystemExit("API_WORKERS > 1 needs JOB_STORE=sqlite (jobs must be visible to every worker)")
+    
     print(f"\n{'='*70}")
     print("🚀 LEGALMIND BACKEND - HUGGINGFACE SPACES")
     print(f"{'='*70}")
     print(f"Host: {host}")
     print(f"Port: {port}")
+    print(f"Workers: {WORKERS}")
     print(f"{'='*70}\n")
     
+    # Each worker process imports main itself (models load per worker) and
+    # runs its share of JOB_WORKERS pipelines
     uvicorn.run(
-        app,
+        "main:app",
         host=host,
         port=port,
+        workers=WORKERS,
         log_level="info"
     )
 
@@ -1,6 +1,6 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Header
+from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 import os
@@ -10,14 +10,33 @@ from datetime import datetime
 from pathlib import Path
 import json
 from dotenv import load_dotenv
-import tempfile
+import threading
+import asyncio
+import hmac
 import jwt
 
-from ml_pipeline.Document_loader import IngestionPipeline, PipelineConfig
 from ml_pipeline.risk_detector import RiskDetectionPipeline
-from ml_pipeline.LLM_advisory import AdvisoryPipeline, EnhancedRAGSystem
-from ml_pipeline.chatbot import get_chatbot
+from ml_pipeline.LLM_advisory import EnhancedRAGSystem
+from ml_pipeline.chatbot import LegalMindChatbot, get_chatbot
+from ml_pipeline.embedding_cache import get_query_embeddings
+from ml_pipeline.llm_client import get_llm_gateway
+from ml_pipeline.llm_router import get_router_metrics
 from ml_pipeline.supabase_manager import get_supabase_manager
+from ml_pipeline.report_renderer import FORMATS, get_report_cache, report_etag
+from ml_pipeline.rag_cache import get_rag_cache
+from ml_pipeline.vector_store_cache import get_vector_store_cache
+from ml_pipeline.user_index import get_user_index_manager
+from ml_pipeline.answer_cache import get_answer_cache
+from ml_pipeline.lexical_index import BM25Index, LexicalConfig
+from ml_pipeline.conversation_memory import get_conversation_memory
+from ml_pipeline.risk_digest import DigestConfig, RiskDigest
+from ml_pipeline.job_queue import WorkerPool, get_job_queue
+from ml_pipeline.job_store import JobStoreConfig, get_job_store
+from ml_pipeline.job_events import JobEventsConfig, StageProgress, get_job_events
+from ml_pipeline.upload_stream import UploadRejected, file_sha256, stream_pdf_upload, stream_pdf_uploads
+from ml_pipeline.admission import AdmissionConfig, AdmissionController, pipeline_workers
+from ml_pipeline.pipeline_artifacts import get_memory_vector_stores, keep_artifact, transient_artifacts
+from ml_pipeline.pipeline_components import get_pipeline_components, pipeline_snapshot, reconfigure_pipeline
 
 load_dotenv()
 
@@ -43,6 +62,14 @@ def get_user_id_from_token(authorization: Optional[str]) -> Optional[str]:
         return None
 
 
+def conversation_owner(authorization: Optional[str], session_id: Optional[str]) -> Optional[str]:
+    """Who a chat conversation belongs to (keys its cached history summary)"""
+    user_id = get_user_id_from_token(authorization)
+    if user_id:
+        return f"user:{user_id}"
+    return f"session:{session_id}" if session_id else None
+
+
 print("\n" + "="*70)
 print("[STARTUP] LEGALIND BACKEND INITIALIZATION")
 print("="*70 + "\n")
@@ -58,14 +85,17 @@ except Exception as e:
 
 # Create singleton instance to cache model
 _risk_pipeline_cache = None
+_risk_pipeline_lock = threading.Lock()  # Worker threads may ask for it at the same time
 
 def get_risk_pipeline():
     """Get or create cached RiskDetectionPipeline instance"""
     global _risk_pipeline_cache
     if _risk_pipeline_cache is None:
-        print("Initializing risk detection model...")
-        _risk_pipeline_cache = RiskDetectionPipeline()
-        print("[OK] Risk detection model ready!\n")
+        with _risk_pipeline_lock:
+            if _risk_pipeline_cache is None:
+                print("Initializing risk detection model...")
+                _risk_pipeline_cache = RiskDetectionPipeline()
+                print("[OK] Risk detection model ready!\n")
     return _risk_pipeline_cache
 
 # Pre-load model on startup (comment out if you want lazy loading)
@@ -75,6 +105,23 @@ except Exception as e:
     print(f"⚠️  Model pre-load failed: {e}")
     print("Model will be loaded on first upload instead.\n")
 
+# Build the shared ingestion/advisory components (embedding and LLM clients) once
+try:
+    get_pipeline_components()
+except Exception as e:
+    print(f"⚠️  Pipeline components pre-load failed: {e}")
+    print("They will be built on first upload instead.\n")
+
+def prewarm_query_embeddings():
+    """Pre-embed the suggested chat questions (runs in the background)"""
+    try:
+        added = get_query_embeddings().prewarm(LegalMindChatbot.SUGGESTED_QUESTIONS)
+        print(f"[OK] Pre-embedded {added} suggested questions")
+    except Exception as e:
+        print(f"⚠️  Could not pre-embed suggested questions: {e}")
+
+threading.Thread(target=prewarm_query_embeddings, daemon=True).start()
+
 print("="*70)
 print("[OK] SERVER READY")
 print("="*70 + "\n")
@@ -83,8 +130,12 @@ print("="*70 + "\n")
 class Config:
     UPLOAD_DIR = "uploads"
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+    MAX_BATCH_FILES = int(os.getenv("BATCH_MAX_DOCUMENTS", "50"))
     ALLOWED_EXTENSIONS = {".pdf"}
     
+    # Admin endpoints are disabled unless a token is set
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+    
     # Supabase
     SUPABASE_URL = os.getenv("SUPABASE_URL")
     SUPABASE_KEY = os.getenv("SUPABASE_KEY")
@@ -109,7 +160,7 @@ app.add_middleware(
 )
 
 
-jobs = {}  # {job_id: {status, progress, result}}
+jobs = get_job_store()  # job_id -> {status, stage, progress, error, result}; shared across workers
 
 class JobStatus:
     PENDING = "pending"
@@ -118,6 +169,65 @@ class JobStatus:
     FAILED = "failed"
 
 
+def update_job(job_id: str, **fields):
+    """Update job state and push the change to progress subscribers"""
+    jobs.update(job_id, **fields)
+    get_job_events().publish(job_id, {k: v for k, v in fields.items() if k != "result"})
+
+
+def stage_progress(job_id: str, stage: str, start: int, end: int, unit: str) -> StageProgress:
+    """Progress callback for one pipeline stage, spanning start..end percent"""
+    return StageProgress(
+        lambda progress, detail: update_job(job_id, progress=progress, stage=stage, detail=detail),
+        start, end, unit
+    )
+
+
+def _invalidate_user_caches(user_id: str):
+    get_rag_cache().invalidate_user(user_id)
+    get_memory_vector_stores().invalidate_user(user_id)
+    get_vector_store_cache().invalidate_user(user_id)
+    get_answer_cache().invalidate_user(user_id)
+    get_user_index_manager().remove_user(user_id)
+
+
+def _invalidate_rag_caches(document_id: str):
+    get_rag_cache().invalidate(document_id)
+    get_vector_store_cache().invalidate(document_id)
+    get_memory_vector_stores().invalidate(document_id)
+
+
+CACHE_INVALIDATORS = {
+    "answers": lambda document_id: get_answer_cache().invalidate(document_id),
+    "rag": _invalidate_rag_caches,
+    "report": lambda document_id: get_report_cache().invalidate(document_id),
+    "user": _invalidate_user_caches,
+}
+
+
+def invalidate_caches(kind: str, key: str):
+    """Drop cached entries in this process and (through the job store) in the other API workers"""
+    CACHE_INVALIDATORS[kind](key)
+    jobs.broadcast(kind, key)
+
+
+def forget_document(document_id: str):
+    """Drop the job record and every cached copy of a document deleted from Supabase"""
+    jobs.delete(document_id)
+    for kind in ("rag", "report", "answers"):
+        invalidate_caches(kind, document_id)
+
+
+def apply_remote_invalidations(stop: threading.Event):
+    """Apply invalidations broadcast by other API worker processes until stopped"""
+    while not stop.wait(JobStoreConfig.INVALIDATION_POLL_SECONDS):
+        try:
+            for kind, key in jobs.invalidations():
+                CACHE_INVALIDATORS[kind](key)
+        except Exception as e:
+            print(f"⚠️  Could not apply cache invalidations: {e}")
+
+
 # ============================================================================
 # HEALTH CHECK ENDPOINT (For HuggingFace Spaces)
 # ============================================================================
@@ -131,6 +241,60 @@ def health_check():
     }
 
 
+@app.get("/api/v1/metrics", tags=["Health"])
+def get_metrics():
+    """Runtime metrics (LLM calls, per-model latency, caches)"""
+    return {
+        "llm": get_llm_gateway().metrics.snapshot(),
+        "llm_routes": get_router_metrics().snapshot(),
+        "rag_sessions": get_rag_cache().snapshot(),
+        "memory_vector_stores": get_memory_vector_stores().snapshot(),
+        "query_embeddings": get_query_embeddings().cache.snapshot(),
+        "vector_store_cache": get_vector_store_cache().snapshot(),
+        "user_indexes": get_user_index_manager().snapshot(),
+        "answer_cache": get_answer_cache().snapshot(),
+        "conversation_memory": get_conversation_memory().snapshot(),
+        "job_workers": worker_pool.snapshot(),
+        "admission": admission.snapshot(),
+        "job_store": jobs.snapshot(),
+        "job_events": get_job_events().snapshot(),
+        "pipeline": pipeline_snapshot(),
+    }
+
+
+def require_admin(token: Optional[str]):
+    """Check the X-Admin-Token header against ADMIN_TOKEN"""
+    if not Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled (set ADMIN_TOKEN)")
+    if not token or not hmac.compare_digest(token, Config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/api/v1/admin/pipeline", tags=["Admin"])
+def get_pipeline_settings(x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """Current settings of the shared pipeline components"""
+    require_admin(x_admin_token)
+    return pipeline_snapshot()
+
+
+@app.post("/api/v1/admin/pipeline", tags=["Admin"])
+def update_pipeline_settings(
+    changes: Dict,
+    x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token")
+):
+    """
+    Change pipeline settings without a restart (applies to this process)
+    
+    New jobs use the rebuilt components; running jobs finish on the old ones.
+    """
+    require_admin(x_admin_token)
+    try:
+        reconfigure_pipeline(**changes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return pipeline_snapshot()
+
+
 @app.get("/", tags=["Root"])
 def root():
     """Root endpoint with API information"""
@@ -145,6 +309,25 @@ class UploadResponse(BaseModel):
     job_id: str
     status: str
     message: str
+    queue_position: Optional[int] = None
+
+class BatchUploadResponse(BaseModel):
+    batch_id: str
+    status: str
+    message: str
+    documents: List[Dict]  # [{"job_id", "file_name"}]
+    queue_position: Optional[int] = None
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str
+    status: str
+    progress: int
+    stage: str
+    documents: List[Dict]  # [{"job_id", "file_name", "status", "progress", "stage", "error"}]
+    completed: int
+    failed: int
+    queue_position: Optional[int] = None
+    detail: Optional[Dict] = None
 
 class JobStatusResponse(BaseModel):
     job_id: str
@@ -153,11 +336,15 @@ class JobStatusResponse(BaseModel):
     stage: str
     result: Optional[Dict] = None
     error: Optional[str] = None
+    queue_position: Optional[int] = None
+    detail: Optional[Dict] = None  # {"unit": "pages"|"chunks"|"clauses", "done": n, "total": m}
+    persistence: Optional[Dict] = None  # Per-write timings of the Supabase save stage
 
 class ChatRequest(BaseModel):
     document_id: str
     message: str
     chat_history: Optional[List[Dict]] = None
+    session_id: Optional[str] = None  # Client conversation id (for signed-out users)
 
 class ChatResponse(BaseModel):
     response: str
@@ -167,12 +354,204 @@ class ChatbotRequest(BaseModel):
     message: str
     chat_history: Optional[List[Dict]] = None
     document_id: Optional[str] = None
+    session_id: Optional[str] = None
 
 class ChatbotResponse(BaseModel):
     response: str
     timestamp: str
     suggestions: Optional[List[str]] = None
 
+class SearchRequest(BaseModel):
+    query: str
+    k: int = 10
+
+
+def complete_document_analysis(
+    job_id: str,
+    file_path: str,
+    user_id: Optional[str],
+    ingest_result: Dict,
+    risk_result: Dict,
+    supabase_manager,
+    components=None
+):
+    """
+    Pipeline stages after risk detection, for one document:
+    3. LLM Advisory (Generate report + Enable chat)
+    4. Save to Supabase (database + storage)
+    5. Delete temporary files and store the job result
+    """
+    update_job(
+        job_id,
+        progress=70,
+        stage="Generating legal advisory",
+        detail=None
+    )
+    
+    # STAGE 3: Advisory Generation (on the in-memory chunks; advisories are attached to the risky ones)
+    analysis = (components or get_pipeline_components()).advisory.analyze(
+        risk_result['risky_chunks'],
+        risk_result['safe_chunks'],
+        ingest_result['doc_name'],
+        progress=stage_progress(job_id, "Generating legal advisory", 70, 85, "clauses"),
+        save_report=keep_artifact("report")
+    )
+    
+    # Calculate risk score
+    total = risk_result['total_chunks']
+    risky = risk_result['risky_count']
+    risk_score = int((risky / total) * 100) if total > 0 else 0
+    
+    # Structured report
+    report_data = analysis['report_data']
+    report_version = get_report_cache().put_report(job_id, report_data)
+    
+    # Compact risk digest, stored with the vector store so it travels with it
+    risk_digest = analysis['risk_digest']
+    vector_store = ingest_result['vector_store']
+    vector_store.add_json(DigestConfig.DIGEST_FILE, risk_digest.to_dict())
+    if ingest_result['vector_db_path']:
+        risk_digest.save(ingest_result['vector_db_path'])
+    else:
+        # Not written locally (zero-disk): chat builds its RAG system from memory
+        get_memory_vector_stores().put(job_id, vector_store, user_id)
+    
+    # Kept risk results get the advisories too
+    if risky > 0 and risk_result['risky_chunks_file'] and not transient_artifacts():
+        with open(risk_result['risky_chunks_file'], 'w', encoding='utf-8') as f:
+            json.dump(risk_result['risky_chunks'], f, indent=2, ensure_ascii=False)
+    
+    # Fresh analysis: answers cached for any earlier analysis are stale
+    invalidate_caches("answers", job_id)
+    
+    # ================================================================
+    # SAVE TO SUPABASE (if configured)
+    # ================================================================
+    update_job(
+        job_id,
+        progress=85,
+        stage="Saving results to cloud",
+        detail=None
+    )
+    
+    if supabase_manager and user_id:
+        # Metadata (then risky chunks), vector store and report in parallel;
+        # the vector store is serialized from memory, not zipped from disk
+        persistence = supabase_manager.save_analysis_results(
+            user_id=user_id,
+            document_id=job_id,
+            filename=Path(file_path).name,
+            risk_score=risk_score,
+            risky_chunks_count=risky,
+            total_chunks=total,
+            risky_chunks=risk_result['risky_chunks'],
+            vector_store_path=ingest_result['vector_db_path'],
+            report_data=report_data,
+            vector_store_archive=vector_store.to_archive()
+        )
+        update_job(job_id, persistence=persistence)
+    
+        failed = [name for name, write in persistence["writes"].items() if not write["ok"]]
+        if failed:
+            # Continue even if Supabase fails
+            print(f"⚠️  Error saving to Supabase ({', '.join(failed)})")
+        else:
+            print(f"✓ Document {job_id} saved to Supabase in {persistence['wall_seconds']:.2f}s")
+    
+    # Add to the user's cross-document search index
+    if user_id:
+        try:
+            get_user_index_manager().add_document_from_store(
+                user_id, job_id, vector_store.store, Path(file_path).name
+            )
+        except Exception as e:
+            print(f"⚠️  Could not add document to user index: {e}")
+    
+    # ================================================================
+    # CLEANUP TEMPORARY FILES (Memory Optimization)
+    # ================================================================
+    update_job(
+        job_id,
+        progress=95,
+        stage="Cleaning up temporary files"
+    )
+    
+    # Delete the upload and, unless they were explicitly kept (zero-disk mode),
+    # the intermediate files (but NOT the vector DB path since we might need it for chat)
+    cleanup_files = [file_path]  # Original PDF
+    if transient_artifacts():
+        cleanup_files += [
+            ingest_result.get('chunks_path'),  # Raw chunks
+            risk_result.get('risky_chunks_file'),  # Risky chunks JSON
+            risk_result.get('safe_chunks_file'),  # Safe chunks JSON
+            analysis['report_path'],  # Report data (already saved to Supabase)
+        ]
+    
+    for file_to_delete in cleanup_files:
+        if file_to_delete and os.path.exists(file_to_delete):
+            try:
+                if os.path.isdir(file_to_delete):
+                    shutil.rmtree(file_to_delete)
+                else:
+                    os.remove(file_to_delete)
+                print(f"✓ Deleted: {file_to_delete}")
+            except Exception as e:
+                print(f"⚠️  Could not delete {file_to_delete}: {e}")
+    
+    # Success!
+    result = {
+        "document_id": job_id,
+        "user_id": user_id,
+        "file_name": Path(file_path).name,
+        "upload_date": datetime.now().isoformat(),
+        "status": "completed",
+        "risk_score": risk_score,
+        "total_chunks": total,
+        "risky_chunks": risky,
+        "safe_chunks": risk_result['safe_count'],
+        "report_data": report_data,
+        "report_etag": report_version,
+        "risk_digest": risk_digest.to_dict() if risk_digest else None,
+        "risky_chunks_data": risk_result['risky_chunks'],
+        "safe_chunks_data": risk_result['safe_chunks'],
+        "vector_db_path": ingest_result.get('vector_db_path'),
+    }
+    # Status and result in one write so no reader sees one without the other
+    update_job(
+        job_id,
+        status=JobStatus.COMPLETED,
+        progress=100,
+        stage="Analysis complete",
+        detail=None,
+        result=result
+    )
+    
+    print(f"✓ Pipeline completed for {job_id}")
+
+
+def fail_document(job_id: str, error: Exception, supabase_manager=None):
+    """Mark a document's job (and its Supabase row) failed"""
+    update_job(
+        job_id,
+        status=JobStatus.FAILED,
+        error=str(error)
+    )
+    
+    # Update Supabase with error status
+    if supabase_manager:
+        try:
+            supabase_manager.update_document_status(
+                job_id,
+                "failed",
+                error_message=str(error)
+            )
+        except:
+            pass
+    
+    print(f"❌ Error processing {job_id}: {error}")
+    import traceback
+    traceback.print_exception(type(error), error, error.__traceback__)
+
 
 def process_document_pipeline(
     job_id: str, 
@@ -188,7 +567,6 @@ def process_document_pipeline(
     5. Delete temporary files (memory optimization)
     """
     supabase_manager = None
-    temp_dir = None
     
     try:
         # Initialize Supabase manager
@@ -199,13 +577,14 @@ def process_document_pipeline(
             print(f"⚠️  Continuing without cloud storage. Check your environment variables!")
             supabase_manager = None
         
-        # Create temporary directory for processing
-        temp_dir = tempfile.mkdtemp()
-        
         # Update status
-        jobs[job_id]["status"] = JobStatus.PROCESSING
-        jobs[job_id]["stage"] = "Extracting text from PDF"
-        jobs[job_id]["progress"] = 10
+        update_job(
+            job_id,
+            status=JobStatus.PROCESSING,
+            stage="Extracting text from PDF",
+            progress=10,
+            detail=None
+        )
         
         # If Supabase configured, update status in database
         if supabase_manager and user_id:
@@ -218,195 +597,281 @@ def process_document_pipeline(
                 print(f"⚠️  Could not update status in Supabase: {e}")
         
         # STAGE 1: Document Loading
-        config = PipelineConfig(
-            chunk_size=1000,
-            chunk_overlap=200,
-            embedding_model="google/embeddinggemma-300m"
+        components = get_pipeline_components()  # Kept for the whole job, even if reconfigured meanwhile
+        ingestion = components.ingestion
+        ingest_result = ingestion.ingest_document(
+            file_path,
+            page_progress=stage_progress(job_id, "Extracting text from PDF", 10, 25, "pages"),
+            embed_progress=stage_progress(job_id, "Embedding document chunks", 25, 40, "chunks")
         )
-        ingestion = IngestionPipeline(config)
-        ingest_result = ingestion.ingest_document(file_path)
         
-        jobs[job_id]["progress"] = 40
-        jobs[job_id]["stage"] = "Detecting risks with AI model"
+        update_job(
+            job_id,
+            progress=40,
+            stage="Detecting risks with AI model",
+            detail=None
+        )
         
         # STAGE 2: Risk Detection
         risk_pipeline = get_risk_pipeline()
-        risk_result = risk_pipeline.process_chunks(ingest_result['chunks_path'])
-        
-        jobs[job_id]["progress"] = 70
-        jobs[job_id]["stage"] = "Generating legal advisory"
-        
-        # STAGE 3: Advisory Generation
-        advisory = AdvisoryPipeline()
-        report_path = advisory.process(
-            risky_file=risk_result['risky_chunks_file'],
-            safe_file=risk_result['safe_chunks_file'],
-            vector_db_path=ingest_result['vector_db_path'],
-            enable_chat=False
+        risk_result = risk_pipeline.detect(
+            ingest_result['chunks'],
+            ingest_result['doc_name'],
+            progress=stage_progress(job_id, "Detecting risks with AI model", 40, 70, "chunks"),
+            save=keep_artifact("risk_results")
         )
         
-        # Calculate risk score
-        total = risk_result['total_chunks']
-        risky = risk_result['risky_count']
-        risk_score = int((risky / total) * 100) if total > 0 else 0
-        
-        # Read report content
-        with open(report_path, 'r', encoding='utf-8') as f:
-            report_content = f.read()
-        
-        # Load risky chunks for saving to Supabase
-        risky_chunks_data = []
-        if risky > 0:
-            with open(risk_result['risky_chunks_file'], 'r', encoding='utf-8') as f:
-                risky_chunks_data = json.load(f)
-        
-        # ================================================================
-        # SAVE TO SUPABASE (if configured)
-        # ================================================================
-        jobs[job_id]["progress"] = 85
-        jobs[job_id]["stage"] = "Saving results to cloud"
+        # STAGES 3-5: Advisory, save, cleanup
+        complete_document_analysis(
+            job_id, file_path, user_id, ingest_result, risk_result, supabase_manager, components
+        )
         
+    except Exception as e:
+        fail_document(job_id, e, supabase_manager)
+
+
+def process_batch_pipeline(
+    batch_id: str,
+    documents: List[Dict],
+    user_id: Optional[str] = None
+):
+    """
+    Run the pipeline for a batch of documents as one job
+    
+    Text is extracted per document; embedding and risk classification run
+    once over the pooled chunks of every document, so the models see full
+    batches; advisory, save and cleanup then run per document. Each document
+    keeps its own job (status, result, report, chat) and a failure only
+    fails that document. documents: [{"job_id", "file_path"}, ...]
+    """
+    try:
+        supabase_manager = get_supabase_manager()
+    except Exception as e:
+        print(f"⚠️  Supabase initialization failed: {e}")
+        supabase_manager = None
+    
+    update_job(
+        batch_id,
+        status=JobStatus.PROCESSING,
+        stage="Extracting text from PDFs",
+        progress=5,
+        detail=None
+    )
+    for doc in documents:
+        update_job(
+            doc["job_id"],
+            status=JobStatus.PROCESSING,
+            stage="Extracting text from PDF",
+            progress=10,
+            detail=None
+        )
         if supabase_manager and user_id:
             try:
-                # 1. Save document metadata
-                supabase_manager.save_document_metadata(
-                    user_id=user_id,
-                    filename=Path(file_path).name,
-                    document_id=job_id,
-                    risk_score=risk_score,
-                    risky_chunks_count=risky,
-                    total_chunks=total,
-                    status="completed"
-                )
-                
-                # 2. Save risky chunks to database
-                if risky_chunks_data:
-                    supabase_manager.save_risky_chunks_batch(
-                        document_id=job_id,
-                        chunks=risky_chunks_data
-                    )
-                
-                # 3. Upload vector store to storage
-                supabase_manager.upload_vector_store(
-                    document_id=job_id,
-                    user_id=user_id,
-                    vector_store_path=ingest_result['vector_db_path']
-                )
-                
-                # 4. Upload report to storage
-                supabase_manager.upload_report(
-                    document_id=job_id,
-                    user_id=user_id,
-                    report_content=report_content
-                )
-                
-                print(f"✓ Document {job_id} saved to Supabase")
-                
+                supabase_manager.update_document_status(doc["job_id"], "processing")
             except Exception as e:
-                print(f"⚠️  Error saving to Supabase: {e}")
-                # Continue even if Supabase fails
-        
-        # ================================================================
-        # PRESERVE NECESSARY DATA BEFORE CLEANUP
-        # ================================================================
-        jobs[job_id]["progress"] = 90
-        jobs[job_id]["stage"] = "Saving analysis data"
-        
-        # Load risky and safe chunks into memory BEFORE deleting files
-        risky_chunks_for_memory = []
-        safe_chunks_for_memory = []
-        
-        try:
-            if os.path.exists(risk_result.get('risky_chunks_file', '')):
-                with open(risk_result['risky_chunks_file'], 'r', encoding='utf-8') as f:
-                    risky_chunks_for_memory = json.load(f)
-        except Exception as e:
-            print(f"⚠️  Could not load risky chunks: {e}")
-        
+                print(f"⚠️  Could not update status in Supabase: {e}")
+    
+    live = list(documents)  # Documents that have not failed
+    try:
+        # STAGE 1: Document Loading (embeddings pooled across documents)
+        components = get_pipeline_components()  # Kept for the whole job, even if reconfigured meanwhile
+        ingestion = components.ingestion
+        ingest_results = ingestion.ingest_batch(
+            [doc["file_path"] for doc in live],
+            page_progress=[
+                stage_progress(doc["job_id"], "Extracting text from PDF", 10, 25, "pages") for doc in live
+            ],
+            embed_progress=stage_progress(batch_id, "Embedding document chunks", 10, 40, "chunks")
+        )
+        for doc, ingest_result in zip(live, ingest_results):
+            doc["ingest_result"] = ingest_result
+            if "error" in ingest_result:
+                fail_document(doc["job_id"], RuntimeError(ingest_result["error"]), supabase_manager)
+        live = [doc for doc in live if "error" not in doc["ingest_result"]]
+        
+        # STAGE 2: Risk Detection (classifier batches pooled across documents)
+        for doc in live:
+            update_job(doc["job_id"], progress=40, stage="Detecting risks with AI model", detail=None)
+        risk_results = get_risk_pipeline().detect_batch(
+            [(doc["ingest_result"]["doc_name"], doc["ingest_result"]["chunks"]) for doc in live],
+            progress=stage_progress(batch_id, "Detecting risks with AI model", 40, 70, "chunks"),
+            save=keep_artifact("risk_results")
+        )
+        for doc, risk_result in zip(live, risk_results):
+            doc["risk_result"] = risk_result
+    
+    except Exception as e:
+        # A pooled stage failed: no document of the batch can continue
+        for doc in live:
+            fail_document(doc["job_id"], e, supabase_manager)
+        live = []
+    
+    # STAGES 3-5 per document
+    for i, doc in enumerate(live):
+        update_job(
+            batch_id,
+            progress=70 + int(30 * i / len(live)),
+            stage=f"Generating legal advisory ({i + 1}/{len(live)})",
+            detail=None
+        )
         try:
-            if os.path.exists(risk_result.get('safe_chunks_file', '')):
-                with open(risk_result['safe_chunks_file'], 'r', encoding='utf-8') as f:
-                    safe_chunks_for_memory = json.load(f)
+            complete_document_analysis(
+                doc["job_id"], doc["file_path"], user_id,
+                doc["ingest_result"], doc["risk_result"], supabase_manager, components
+            )
         except Exception as e:
-            print(f"⚠️  Could not load safe chunks: {e}")
-        
-        # ================================================================
-        # CLEANUP TEMPORARY FILES (Memory Optimization)
-        # ================================================================
-        jobs[job_id]["progress"] = 95
-        jobs[job_id]["stage"] = "Cleaning up temporary files"
-        
-        # Delete temporary files (but NOT the vector DB path since we might need it for chat)
-        cleanup_files = [
-            file_path,  # Original PDF
-            ingest_result.get('chunks_path'),  # Raw chunks
-            risk_result.get('risky_chunks_file'),  # Risky chunks JSON
-            risk_result.get('safe_chunks_file'),  # Safe chunks JSON
-            report_path,  # Report text (already saved to Supabase)
-        ]
-        
-        for file_to_delete in cleanup_files:
-            if file_to_delete and os.path.exists(file_to_delete):
-                try:
-                    if os.path.isdir(file_to_delete):
-                        shutil.rmtree(file_to_delete)
-                    else:
-                        os.remove(file_to_delete)
-                    print(f"✓ Deleted: {file_to_delete}")
-                except Exception as e:
-                    print(f"⚠️  Could not delete {file_to_delete}: {e}")
-        
-        # Success!
-        jobs[job_id]["status"] = JobStatus.COMPLETED
-        jobs[job_id]["progress"] = 100
-        jobs[job_id]["stage"] = "Analysis complete"
-        jobs[job_id]["result"] = {
-            "document_id": job_id,
+            fail_document(doc["job_id"], e, supabase_manager)
+    
+    statuses = [(jobs.get(doc["job_id"]) or {}).get("status") for doc in documents]
+    completed = statuses.count(JobStatus.COMPLETED)
+    update_job(
+        batch_id,
+        status=JobStatus.COMPLETED if completed else JobStatus.FAILED,
+        progress=100,
+        stage="Batch complete",
+        detail=None,
+        completed=completed,
+        failed=len(documents) - completed,
+        error=None if completed else "No document in the batch could be analysed"
+    )
+    print(f"✓ Batch {batch_id} finished: {completed}/{len(documents)} documents analysed")
+
+
+
+# ============================================================================
+# JOB WORKERS
+# ============================================================================
+
+def _upload_usable(job_id: str, file_path: str, sha256: Optional[str]) -> bool:
+    """Fail the job if its uploaded file is gone or no longer matches its hash"""
+    if not os.path.exists(file_path):
+        update_job(
+            job_id,
+            status=JobStatus.FAILED,
+            error="Uploaded file is no longer available. Please upload it again."
+        )
+        return False
+    
+    # Hash taken while the upload streamed in: catch truncated or altered files
+    if sha256 and file_sha256(file_path) != sha256:
+        update_job(
+            job_id,
+            status=JobStatus.FAILED,
+            error="Uploaded file is corrupted. Please upload it again."
+        )
+        return False
+    return True
+
+
+def run_queued_job(job_id: str, payload: Dict):
+    """Worker body: run the pipeline for a job leased from the durable queue"""
+    if payload.get("batch"):
+        run_queued_batch(job_id, payload)
+        return
+    
+    # Jobs recovered after a restart may be missing from an in-process store
+    jobs.setdefault(job_id, {
+        "status": JobStatus.PENDING,
+        "progress": 0,
+        "stage": "Queued",
+        "file_name": payload.get("file_name"),
+        "user_id": payload.get("user_id"),
+        "created_at": payload.get("created_at"),
+    })
+    
+    file_path = payload["file_path"]
+    if not _upload_usable(job_id, file_path, payload.get("sha256")):
+        return
+    
+    process_document_pipeline(job_id, file_path, payload.get("user_id"))
+
+
+def run_queued_batch(batch_id: str, payload: Dict):
+    """Worker body for a batch upload: one pooled pipeline run for all its documents"""
+    user_id = payload.get("user_id")
+    jobs.setdefault(batch_id, {
+        "status": JobStatus.PENDING,
+        "progress": 0,
+        "stage": "Queued",
+        "kind": "batch",
+        "documents": [{"job_id": d["job_id"], "file_name": d["file_name"]} for d in payload["documents"]],
+        "user_id": user_id,
+        "created_at": payload.get("created_at"),
+    })
+    
+    documents = []
+    for doc in payload["documents"]:
+        jobs.setdefault(doc["job_id"], {
+            "status": JobStatus.PENDING,
+            "progress": 0,
+            "stage": "Queued",
+            "file_name": doc["file_name"],
+            "batch_id": batch_id,
             "user_id": user_id,
-            "file_name": Path(file_path).name,
-            "upload_date": datetime.now().isoformat(),
-            "status": "completed",
-            "risk_score": risk_score,
-            "total_chunks": total,
-            "risky_chunks": risky,
-            "safe_chunks": risk_result['safe_count'],
-            "report_content": report_content,
-            "risky_chunks_data": risky_chunks_for_memory,
-            "safe_chunks_data": safe_chunks_for_memory,
-            "vector_db_path": ingest_result.get('vector_db_path'),
-        }
-        
-        print(f"✓ Pipeline completed for {job_id}")
-        
-    except Exception as e:
-        jobs[job_id]["status"] = JobStatus.FAILED
-        jobs[job_id]["error"] = str(e)
-        
-        # Update Supabase with error status
-        if supabase_manager:
-            try:
-                supabase_manager.update_document_status(
-                    job_id,
-                    "failed",
-                    error_message=str(e)
-                )
-            except:
-                pass
-        
-        print(f"❌ Error processing {job_id}: {e}")
-        import traceback
-        traceback.print_exc()
+            "created_at": payload.get("created_at"),
+        })
+        if _upload_usable(doc["job_id"], doc["file_path"], doc.get("sha256")):
+            documents.append({"job_id": doc["job_id"], "file_path": doc["file_path"]})
     
-    finally:
-        # Cleanup temporary directory
-        if temp_dir and os.path.exists(temp_dir):
-            try:
-                shutil.rmtree(temp_dir)
-                print(f"✓ Cleaned temporary directory: {temp_dir}")
-            except Exception as e:
-                print(f"⚠️  Could not delete temp dir: {e}")
+    if not documents:
+        update_job(
+            batch_id,
+            status=JobStatus.FAILED,
+            stage="Failed",
+            error="None of the uploaded files are available. Please upload them again."
+        )
+        return
+    
+    process_batch_pipeline(batch_id, documents, user_id)
+
+
+def find_inflight_duplicate(user_id: str, content_sha256: str) -> Optional[str]:
+    """A pending or processing job of this user for the same file content"""
+    for job_id in jobs.jobs_for_user(user_id):
+        job = jobs.get(job_id)
+        if job and job.get("content_sha256") == content_sha256 \
+                and job.get("status") in (JobStatus.PENDING, JobStatus.PROCESSING):
+            return job_id
+    return None
+
+
+def abandon_queued_job(job_id: str, payload: Dict):
+    """A job whose worker kept dying is given up on"""
+    for doc_job_id in [job_id] + [doc["job_id"] for doc in payload.get("documents", [])]:
+        update_job(
+            doc_job_id,
+            status=JobStatus.FAILED,
+            stage="Failed",
+            error="Processing was interrupted repeatedly. Please upload the document again."
+        )
 
 
+worker_pool = WorkerPool(
+    get_job_queue(),
+    run_queued_job,
+    size=pipeline_workers(),
+    on_abandoned=abandon_queued_job,
+    user_max_running=AdmissionConfig.USER_MAX_RUNNING
+)
+admission = AdmissionController(get_job_queue(), worker_pool)
+
+
+invalidation_stop = threading.Event()
+
+
+@app.on_event("startup")
+def start_job_workers():
+    worker_pool.start()
+    threading.Thread(
+        target=apply_remote_invalidations, args=(invalidation_stop,), name="cache-invalidations", daemon=True
+    ).start()
+
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    invalidation_stop.set()
+    worker_pool.stop()
+
 
 # ============================================================================
 # API ENDPOINTS
@@ -417,70 +882,97 @@ def read_root():
     """Health check"""
     return {"status": "healthy", "service": "LegalMind API"}
 
+async def admit_upload(request: Request, user_id: Optional[str]):
+    """Admission check for an upload: (user_key, None) or (user_key, 429 response)"""
+    # Anonymous uploads are limited per client address
+    user_key = user_id or f"ip:{request.client.host if request.client else 'unknown'}"
+    decision = await asyncio.to_thread(admission.check, user_key)
+    if decision.admitted:
+        return user_key, None
+    return user_key, JSONResponse(
+        status_code=429,
+        content={"detail": decision.reason, "retry_after": decision.retry_after, "limit": decision.limit},
+        headers={"Retry-After": str(decision.retry_after)}
+    )
+
+
 @app.post("/api/v1/upload", response_model=UploadResponse)
 async def upload_document(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
+    request: Request,
     user_id: Optional[str] = Header(None)
 ):
     """
-    Upload PDF for analysis
+    Upload PDF for analysis (multipart/form-data, field "file")
     Returns job_id for tracking progress
     
+    The body is streamed to disk as it arrives: size limit, PDF header check
+    and content hash happen in the same pass.
+    
+    Over the global or per-user queue limit the upload is refused with 429
+    and a Retry-After hint, before the body is read.
+    
     Headers:
         user-id: Optional Supabase user ID for cloud storage
     """
     
+    user_key, rejection = await admit_upload(request, user_id)
+    if rejection:
+        return rejection
+    
     try:
-        # Validate file exists
-        if not file or not file.filename:
-            raise HTTPException(400, "No file provided")
-        
-        # Validate file format
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(400, "Only PDF files allowed. File must end with .pdf")
-        
-        # Check file size
-        file.file.seek(0, 2)  # Seek to end
-        file_size = file.file.tell()
-        file.file.seek(0)  # Reset
-        
-        if file_size == 0:
-            raise HTTPException(400, "File is empty. Please upload a valid PDF")
-        
-        if file_size > Config.MAX_FILE_SIZE:
-            max_mb = Config.MAX_FILE_SIZE // 1024 // 1024
-            raise HTTPException(400, f"File too large. Max {max_mb}MB allowed")
-        
         # Generate unique job ID
         job_id = str(uuid.uuid4())
-        
-        # Save uploaded file to temporary location
         file_path = os.path.join(Config.UPLOAD_DIR, f"{job_id}.pdf")
+        
         try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-        except Exception as e:
+            upload = await stream_pdf_upload(request, file_path, Config.MAX_FILE_SIZE)
+        except UploadRejected as e:
+            raise HTTPException(e.status_code, e.message)
+        except OSError as e:
             raise HTTPException(400, f"Failed to save file: {str(e)}")
         
+        # Same document already queued or running for this user (e.g. a double submit)
+        if user_id:
+            duplicate = await asyncio.to_thread(find_inflight_duplicate, user_id, upload.sha256)
+            if duplicate:
+                os.remove(file_path)
+                print(f"✓ Duplicate upload of {upload.filename} joined job {duplicate}")
+                return UploadResponse(
+                    job_id=duplicate,
+                    status="pending",
+                    message="Identical document is already being processed."
+                )
+        
         # Create job
-        jobs[job_id] = {
+        created_at = datetime.now().isoformat()
+        await asyncio.to_thread(jobs.create, job_id, {
             "status": JobStatus.PENDING,
             "progress": 0,
             "stage": "Queued",
-            "file_name": file.filename,
-            "created_at": datetime.now().isoformat()
-        }
+            "file_name": upload.filename,
+            "file_size": upload.size,
+            "content_sha256": upload.sha256,
+            "user_id": user_id,
+            "created_at": created_at
+        })
         
-        # Add to background tasks (pass user_id if provided)
-        background_tasks.add_task(process_document_pipeline, job_id, file_path, user_id)
+        # Queue for the worker pool (durable: survives a restart)
+        await asyncio.to_thread(get_job_queue().enqueue, job_id, {
+            "file_path": file_path,
+            "user_id": user_id,
+            "file_name": upload.filename,
+            "sha256": upload.sha256,
+            "created_at": created_at,
+        }, user_key)
+        position = await asyncio.to_thread(get_job_queue().position, job_id)
         
-        print(f"✓ Upload request received: {file.filename} ({job_id})")
+        print(f"✓ Upload request received: {upload.filename} ({job_id}, {upload.size} bytes)")
         
         return UploadResponse(
             job_id=job_id,
             status="pending",
-            message="Document uploaded successfully. Processing started."
+            message="Document uploaded successfully. Queued for processing.",
+            queue_position=position
         )
     
     except HTTPException:
@@ -489,24 +981,222 @@ async def upload_document(
         print(f"❌ Unexpected upload error: {e}")
         raise HTTPException(400, f"Upload failed: {str(e)}")
 
+@app.post("/api/v1/upload/batch", response_model=BatchUploadResponse)
+async def upload_batch(
+    request: Request,
+    user_id: Optional[str] = Header(None)
+):
+    """
+    Upload several PDFs for analysis as one batch (multipart/form-data, repeated field "files")
+    
+    Each document gets its own job_id (status, report and chat work as for a
+    single upload); the batch_id tracks them together. The batch runs as one
+    queued job whose embedding and risk classification are pooled across
+    documents.
+    
+    Headers:
+        user-id: Optional Supabase user ID for cloud storage
+    """
+    user_key, rejection = await admit_upload(request, user_id)
+    if rejection:
+        return rejection
+    
+    try:
+        batch_id = str(uuid.uuid4())
+        doc_ids: List[str] = []
+        
+        def path_for(index: int) -> str:
+            doc_ids.append(str(uuid.uuid4()))
+            return os.path.join(Config.UPLOAD_DIR, f"{doc_ids[index]}.pdf")
+        
+        try:
+            uploads = await stream_pdf_uploads(
+                request, path_for, Config.MAX_FILE_SIZE, Config.MAX_BATCH_FILES, field_name="files"
+            )
+        except UploadRejected as e:
+            raise HTTPException(e.status_code, e.message)
+        except OSError as e:
+            raise HTTPException(400, f"Failed to save files: {str(e)}")
+        
+        created_at = datetime.now().isoformat()
+        documents = [
+            {"job_id": doc_id, "file_name": upload.filename} for doc_id, upload in zip(doc_ids, uploads)
+        ]
+        
+        def create_jobs():
+            for doc_id, upload in zip(doc_ids, uploads):
+                jobs.create(doc_id, {
+                    "status": JobStatus.PENDING,
+                    "progress": 0,
+                    "stage": "Queued",
+                    "file_name": upload.filename,
+                    "file_size": upload.size,
+                    "content_sha256": upload.sha256,
+                    "batch_id": batch_id,
+                    "user_id": user_id,
+                    "created_at": created_at
+                })
+            jobs.create(batch_id, {
+                "status": JobStatus.PENDING,
+                "progress": 0,
+                "stage": "Queued",
+                "kind": "batch",
+                "documents": documents,
+                "user_id": user_id,
+                "created_at": created_at
+            })
+        
+        await asyncio.to_thread(create_jobs)
+        
+        # One queue entry for the whole batch
+        await asyncio.to_thread(get_job_queue().enqueue, batch_id, {
+            "batch": True,
+            "documents": [
+                {"job_id": doc_id, "file_path": upload.path, "file_name": upload.filename, "sha256": upload.sha256}
+                for doc_id, upload in zip(doc_ids, uploads)
+            ],
+            "user_id": user_id,
+            "created_at": created_at,
+        }, user_key)
+        position = await asyncio.to_thread(get_job_queue().position, batch_id)
+        
+        print(f"✓ Batch upload received: {len(uploads)} documents ({batch_id})")
+        
+        return BatchUploadResponse(
+            batch_id=batch_id,
+            status="pending",
+            message=f"{len(uploads)} documents uploaded successfully. Queued for processing.",
+            documents=documents,
+            queue_position=position
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Unexpected batch upload error: {e}")
+        raise HTTPException(400, f"Upload failed: {str(e)}")
+
+
+@app.get("/api/v1/batch/{batch_id}", response_model=BatchStatusResponse)
+def get_batch_status(batch_id: str):
+    """Status of a batch upload with a sub-status per document"""
+    batch = jobs.get(batch_id)
+    if batch is None or batch.get("kind") != "batch":
+        raise HTTPException(404, "Batch not found")
+    
+    documents = []
+    for doc in batch.get("documents", []):
+        job = jobs.get(doc["job_id"]) or {}
+        documents.append({
+            "job_id": doc["job_id"],
+            "file_name": doc["file_name"],
+            "status": job.get("status", JobStatus.FAILED),
+            "progress": job.get("progress", 0),
+            "stage": job.get("stage", "Unknown"),
+            "error": job.get("error"),
+        })
+    
+    return BatchStatusResponse(
+        batch_id=batch_id,
+        status=batch["status"],
+        progress=batch.get("progress", 0),
+        stage=batch.get("stage", "Unknown"),
+        documents=documents,
+        completed=sum(1 for doc in documents if doc["status"] == JobStatus.COMPLETED),
+        failed=sum(1 for doc in documents if doc["status"] == JobStatus.FAILED),
+        queue_position=get_job_queue().position(batch_id) if batch["status"] == JobStatus.PENDING else None,
+        detail=batch.get("detail")
+    )
+
+
 @app.get("/api/v1/job/{job_id}", response_model=JobStatusResponse)
 def get_job_status(job_id: str):
     """
     Get processing status of uploaded document
     Frontend polls this endpoint
     """
-    if job_id not in jobs:
+    job = jobs.get(job_id)
+    if job is None:
         raise HTTPException(404, "Job not found")
     
-    job = jobs[job_id]
-    
     return JobStatusResponse(
         job_id=job_id,
         status=job["status"],
         progress=job.get("progress", 0),
         stage=job.get("stage", "Unknown"),
         result=job.get("result"),
-        error=job.get("error")
+        error=job.get("error"),
+        queue_position=get_job_queue().position(job.get("batch_id") or job_id) if job["status"] == JobStatus.PENDING else None,
+        detail=job.get("detail"),
+        persistence=job.get("persistence")
+    )
+
+
+def _job_event_state(job_id: str, job: Dict) -> Dict:
+    """Fields pushed to progress subscribers (no result payload)"""
+    state = {
+        "job_id": job_id,
+        "status": job.get("status"),
+        "progress": job.get("progress", 0),
+        "stage": job.get("stage", "Unknown"),
+        "detail": job.get("detail"),
+        "error": job.get("error"),
+    }
+    if state["status"] == JobStatus.PENDING:
+        state["queue_position"] = get_job_queue().position(job.get("batch_id") or job_id)
+    return state
+
+
+@app.get("/api/v1/job/{job_id}/events")
+async def stream_job_status(job_id: str):
+    """
+    Push job progress (Server-Sent Events); GET /api/v1/job/{job_id} remains for polling
+    
+    Events:
+        progress:  {"status", "progress", "stage", "detail", "error", ...} on every change
+        completed: final state once the job succeeds (fetch the result with GET /api/v1/job/{job_id})
+        failed:    final state with "error"
+    """
+    job = await asyncio.to_thread(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    
+    async def event_stream():
+        events = get_job_events()
+        async with events.subscribe(job_id) as queue:
+            # Read the state only after subscribing so no change is missed
+            current = _job_event_state(job_id, await asyncio.to_thread(jobs.get, job_id) or job)
+            yield _sse("progress", current)
+            last_sent = asyncio.get_running_loop().time()
+            
+            while current["status"] not in (JobStatus.COMPLETED, JobStatus.FAILED):
+                try:
+                    event = await asyncio.wait_for(queue.get(), JobEventsConfig.STORE_POLL_SECONDS)
+                    updated = {**current, **{k: v for k, v in event.items() if k in current}}
+                except asyncio.TimeoutError:
+                    # Job may be running in another worker process: re-read the shared store
+                    stored = await asyncio.to_thread(jobs.get, job_id)
+                    if stored is None:
+                        yield _sse("failed", {**current, "status": JobStatus.FAILED, "error": "Job no longer exists"})
+                        return
+                    updated = _job_event_state(job_id, stored)
+                
+                now = asyncio.get_running_loop().time()
+                if updated != current:
+                    current = updated
+                    last_sent = now
+                    if current["status"] not in (JobStatus.COMPLETED, JobStatus.FAILED):
+                        yield _sse("progress", current)
+                elif now - last_sent >= JobEventsConfig.KEEPALIVE_SECONDS:
+                    last_sent = now
+                    yield ": keep-alive\n\n"
+            
+            yield _sse("completed" if current["status"] == JobStatus.COMPLETED else "failed", current)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 @app.get("/api/v1/documents")
@@ -585,6 +1275,7 @@ def check_document_exists(document_id: str, authorization: Optional[str] = Heade
         
         if not response.data:
             print(f"⚠️  Document not found: {document_id}")
+            forget_document(document_id)
             return {"exists": False, "message": "Document not found"}
         
         doc = response.data
@@ -598,6 +1289,8 @@ def check_document_exists(document_id: str, authorization: Optional[str] = Heade
         status = doc.get("status")
         if status in ["deleted", "failed"]:
             print(f"⚠️  Document unavailable (status={status}): {document_id}")
+            if status == "deleted":
+                forget_document(document_id)
             return {"exists": False, "message": "Document unavailable"}
         
         return {
@@ -610,6 +1303,26 @@ def check_document_exists(document_id: str, authorization: Optional[str] = Heade
         print(f"❌ Error checking document existence: {e}")
         return {"exists": False, "message": f"Error: {str(e)}"}
 
+@app.delete("/api/v1/document/{document_id}")
+async def document_deleted(document_id: str, authorization: Optional[str] = Header(None, alias="Authorization")):
+    """
+    Forget a document the frontend deleted from Supabase
+    Drops its job record, RAG session, vector stores, report and cached answers in every API worker
+    """
+    user_id = get_user_id_from_token(authorization)
+    if not user_id:
+        raise HTTPException(401, "Unauthorized: No valid token provided")
+    
+    job = await asyncio.to_thread(jobs.get, document_id)
+    if job is not None:
+        job_user_id = job.get("user_id") or (job.get("result") or {}).get("user_id")
+        if job_user_id and job_user_id != user_id:
+            raise HTTPException(403, "Unauthorized: Document belongs to another user")
+    
+    await asyncio.to_thread(forget_document, document_id)
+    return {"status": "success", "document_id": document_id}
+
+
 @app.get("/api/v1/document/{document_id}")
 def get_document_details(document_id: str, authorization: Optional[str] = Header(None, alias="Authorization")):
     """
@@ -617,44 +1330,48 @@ def get_document_details(document_id: str, authorization: Optional[str] = Header
     Loads from jobs dict (if in memory) OR Supabase (if persisted)
     """
     # Try jobs dict first (for documents still being processed)
-    if document_id in jobs:
-        job = jobs[document_id]
+    job = jobs.get(document_id)
+    if job is not None:
         if job["status"] != JobStatus.COMPLETED:
             raise HTTPException(400, "Document not fully processed yet")
         
+        # Result may be None (spilled result purged); the owner is kept in the job state too
+        result = job.get("result") or {}
+        
         # Check user authorization
         user_id = get_user_id_from_token(authorization)
-        job_user_id = job.get("result", {}).get("user_id")
+        job_user_id = job.get("user_id") or result.get("user_id")
         if user_id and job_user_id and job_user_id != user_id:
             raise HTTPException(403, "Unauthorized: Document belongs to another user")
-        
-        result = job["result"]
-        risky_chunks = result.get("risky_chunks_data", [])
-        
-        # Format findings
-        findings = []
-        for chunk in risky_chunks[:10]:  # Top 10
-            findings.append({
-                "id": chunk.get("chunk_id", ""),
-                "type": chunk.get("prediction", {}).get("label", "unknown"),
-                "severity": "high" if chunk.get("prediction", {}).get("confidence", 0) > 0.85 else "medium",
-                "clause": chunk.get("text", "")[:500],  # Truncate
-                "confidence": chunk.get("prediction", {}).get("confidence", 0)
-            })
-        
-        return {
-            "document_id": result.get("document_id"),
-            "file_name": result.get("file_name"),
-            "upload_date": result.get("upload_date"),
-            "status": result.get("status"),
-            "risk_score": result.get("risk_score"),
-            "total_chunks": result.get("total_chunks"),
-            "risky_chunks": result.get("risky_chunks"),
-            "safe_chunks": result.get("safe_chunks"),
-            "findings": findings
-        }
+        # A purged result is served from Supabase below
+        if result:
+            risky_chunks = result.get("risky_chunks_data", [])
+            
+            # Format findings
+            findings = []
+            distinct_chunks = [c for c in risky_chunks if c.get("duplicate_of") is None]
+            for chunk in distinct_chunks[:10]:  # Top 10
+                findings.append({
+                    "id": chunk.get("chunk_id", ""),
+                    "type": chunk.get("prediction", {}).get("label", "unknown"),
+                    "severity": "high" if chunk.get("prediction", {}).get("confidence", 0) > 0.85 else "medium",
+                    "clause": chunk.get("text", "")[:500],  # Truncate
+                    "confidence": chunk.get("prediction", {}).get("confidence", 0)
+                })
+            
+            return {
+                "document_id": result.get("document_id"),
+                "file_name": result.get("file_name"),
+                "upload_date": result.get("upload_date"),
+                "status": result.get("status"),
+                "risk_score": result.get("risk_score"),
+                "total_chunks": result.get("total_chunks"),
+                "risky_chunks": result.get("risky_chunks"),
+                "safe_chunks": result.get("safe_chunks"),
+                "findings": findings
+            }
     
-    # Fallback to Supabase for persisted documents
+    # Fallback to Supabase for persisted documents (and purged job results)
     try:
         user_id = get_user_id_from_token(authorization)
         supabase_manager = get_supabase_manager()
@@ -688,50 +1405,76 @@ def get_document_details(document_id: str, authorization: Optional[str] = Header
         print(f"❌ Error getting document from Supabase: {e}")
         raise HTTPException(404, "Document not found")
 
-@app.post("/api/v1/chat", response_model=ChatResponse)
-def chat_with_document(request: ChatRequest, authorization: Optional[str] = Header(None, alias="Authorization")):
+def get_document_rag(document_id: str, authorization: Optional[str]) -> EnhancedRAGSystem:
     """
-    Chat about a specific document using RAG
+    Get the (cached) RAG system for a document the caller may access
     Loads from jobs dict (if in memory) OR Supabase (if persisted)
     """
     # Try jobs dict first (for documents still being processed)
-    if request.document_id in jobs:
-        job = jobs[request.document_id]
+    job = jobs.get(document_id)
+    if job is not None:
         if job["status"] != JobStatus.COMPLETED:
             raise HTTPException(400, "Document not processed yet")
         
+        # Result may be None (spilled result purged); the owner is kept in the job state too
+        result = job.get("result") or {}
+        
         # Check user authorization
         user_id = get_user_id_from_token(authorization)
-        job_user_id = job.get("result", {}).get("user_id")
+        job_user_id = job.get("user_id") or result.get("user_id")
         if user_id and job_user_id and job_user_id != user_id:
             raise HTTPException(403, "Unauthorized: Document belongs to another user")
         
-        result = job["result"]
-        
-        # Load advisories from stored memory data
-        risky_chunks = result.get("risky_chunks_data", [])
-        
-        # Get vector_db_path
-        vector_db_path = result.get("vector_db_path")
-        if not vector_db_path or not os.path.exists(vector_db_path):
-            raise HTTPException(400, "Vector database not available for this document")
-        
-        # Initialize RAG system (in production, cache this)
-        rag = EnhancedRAGSystem(
-            vector_db_path=vector_db_path,
-            advisories=risky_chunks,
-            doc_name=result.get("file_name", "document")
-        )
-        
-        # Get response
-        response_text = rag.chat(request.message, request.chat_history)
-        
-        return ChatResponse(
-            response=response_text,
-            timestamp=datetime.now().isoformat()
-        )
+        # A purged result is served from Supabase below
+        if result:
+            # Load advisories from stored memory data
+            risky_chunks = result.get("risky_chunks_data", [])
+            
+            # Get vector_db_path
+            vector_db_path = result.get("vector_db_path")
+            doc_name = result.get("file_name", "document")
+            version = result.get("report_etag")
+            
+            bundle = None if vector_db_path else get_memory_vector_stores().get(document_id)
+            
+            if vector_db_path and os.path.exists(vector_db_path):
+                factory = lambda: EnhancedRAGSystem(
+                    vector_db_path=vector_db_path,
+                    advisories=risky_chunks,
+                    doc_name=doc_name,
+                    document_id=document_id,
+                    analysis_version=version,
+                    user_id=job_user_id,
+                    risk_digest=RiskDigest.from_dict(result.get("risk_digest"))
+                )
+            elif bundle is not None:
+                # Zero-disk job: the vector store never left memory
+                factory = lambda: EnhancedRAGSystem(
+                    vector_db_path=None,
+                    advisories=risky_chunks,
+                    doc_name=doc_name,
+                    document_id=document_id,
+                    analysis_version=version,
+                    user_id=job_user_id,
+                    risk_digest=RiskDigest.from_dict(result.get("risk_digest")),
+                    vector_store=bundle.store,
+                    lexical_index=BM25Index.from_dict(bundle.json(LexicalConfig.INDEX_FILE))
+                )
+            elif job_user_id:
+                # Local copy is gone: hydrate from Supabase storage
+                factory = lambda: _load_persisted_rag(document_id, job_user_id, risky_chunks, doc_name, version)
+            else:
+                raise HTTPException(400, "Vector database not available for this document")
+            
+            # Reuse the document's RAG system across messages
+            return get_rag_cache().get_or_create(
+                document_id,
+                factory,
+                version=version,
+                user_id=job_user_id
+            )
     
-    # Fallback to Supabase for persisted documents
+    # Fallback to Supabase for persisted documents (and purged job results)
     try:
         user_id = get_user_id_from_token(authorization)
         supabase_manager = get_supabase_manager()
@@ -739,7 +1482,7 @@ def chat_with_document(request: ChatRequest, authorization: Optional[str] = Head
         # First verify document exists in Supabase
         doc_response = supabase_manager.client.table("documents") \
             .select("*") \
-            .eq("id", request.document_id) \
+            .eq("id", document_id) \
             .single() \
             .execute()
         
@@ -749,66 +1492,218 @@ def chat_with_document(request: ChatRequest, authorization: Optional[str] = Head
         if user_id and doc.get("user_id") != user_id:
             raise HTTPException(403, "Unauthorized: Document belongs to another user")
         
-        # Try to load vector store from Supabase storage
-        # For now, return a helpful message
-        raise HTTPException(400, "Document vector store not available. This document needs to be reprocessed.")
+        owner_id = doc.get("user_id")
+        
+        # Load vector store from the local disk cache (downloaded from Supabase on first use)
+        return get_rag_cache().get_or_create(
+            document_id,
+            lambda: _load_persisted_rag(
+                document_id,
+                owner_id,
+                _risky_chunks_from_rows(supabase_manager.get_risky_chunks(document_id)),
+                doc.get("filename", "document")
+            ),
+            user_id=owner_id
+        )
     
     except HTTPException:
         raise
     except:
         raise HTTPException(404, "Document not found")
 
+
+def _load_persisted_rag(document_id: str, user_id: str, risky_chunks: List[Dict], doc_name: str,
+                        analysis_version: Optional[str] = None) -> EnhancedRAGSystem:
+    """Build a RAG system from the locally cached copy of a persisted vector store"""
+    rag = get_vector_store_cache().load(
+        document_id,
+        user_id,
+        lambda path: EnhancedRAGSystem(
+            vector_db_path=path,
+            advisories=risky_chunks,
+            doc_name=doc_name,
+            document_id=document_id,
+            analysis_version=analysis_version,
+            user_id=user_id
+        )
+    )
+    if rag is None:
+        raise HTTPException(400, "Document vector store not available. This document needs to be reprocessed.")
+    return rag
+
+
+def _risky_chunks_from_rows(rows: List[Dict]) -> List[Dict]:
+    """Convert risky_chunks table rows to the in-memory risky chunk format"""
+    chunks = []
+    for row in rows:
+        chunk = {
+            "chunk_id": row.get("chunk_id"),
+            "text": row.get("chunk_text", ""),
+            "prediction": {
+                "label": row.get("risk_label", "Unknown"),
+                "confidence": row.get("confidence_score") or 0.0,
+            },
+        }
+        if row.get("llm_analysis"):
+            chunk["llm_analysis"] = row["llm_analysis"]
+        chunks.append(chunk)
+    return chunks
+
+
+@app.post("/api/v1/chat", response_model=ChatResponse)
+async def chat_with_document(request: ChatRequest, authorization: Optional[str] = Header(None, alias="Authorization")):
+    """
+    Chat about a specific document using RAG
+    Loads from jobs dict (if in memory) OR Supabase (if persisted)
+    """
+    # Cache hits return at once; a FAISS load on a miss runs off the event loop
+    rag = await asyncio.to_thread(get_document_rag, request.document_id, authorization)
+    
+    # Get response
+    response_text = await rag.achat(
+        request.message, request.chat_history, conversation_owner(authorization, request.session_id)
+    )
+    
+    return ChatResponse(
+        response=response_text,
+        timestamp=datetime.now().isoformat()
+    )
+
+
+def _sse(event: str, data: Dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/v1/chat/stream")
+async def stream_chat_with_document(request: ChatRequest, authorization: Optional[str] = Header(None, alias="Authorization")):
+    """
+    Streaming variant of /api/v1/chat (Server-Sent Events)
+    
+    Events:
+        token: {"token": "..."} for each generated piece of text
+        done:  {"response": "<full message>", "timestamp": "..."} - save this to history
+        error: {"error": "..."} if generation fails part-way
+    """
+    # Resolve the document first so auth/404 errors are normal HTTP errors
+    rag = await asyncio.to_thread(get_document_rag, request.document_id, authorization)
+    
+    async def event_stream():
+        pieces = []
+        try:
+            owner = conversation_owner(authorization, request.session_id)
+            async for token in rag.astream_chat(request.message, request.chat_history, owner):
+                pieces.append(token)
+                yield _sse("token", {"token": token})
+        except Exception as e:
+            print(f"❌ Streaming chat error: {e}")
+            yield _sse("error", {"error": str(e)})
+            return
+        
+        yield _sse("done", {
+            "response": "".join(pieces),
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header covers the given ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _report_response(version: str, report_data: Dict, fmt: str, if_none_match: Optional[str]):
+    """Render (or revalidate) a report with validation headers"""
+    etag = f'"{version}-{fmt}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
+    report = get_report_cache().render(version, report_data, fmt)
+    return JSONResponse({"report": report, "format": fmt}, headers=headers)
+
+
 @app.get("/api/v1/report/{document_id}")
-def download_report(document_id: str, authorization: Optional[str] = Header(None, alias="Authorization")):
+async def download_report(
+    document_id: str,
+    format: str = "markdown",
+    authorization: Optional[str] = Header(None, alias="Authorization"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
     """
     Download analysis report
     Loads from jobs dict (if in memory) OR Supabase storage (if persisted)
+    
+    Query:
+        format: markdown (default), html or text
     """
+    if format not in FORMATS:
+        raise HTTPException(400, f"Unsupported format. Use one of: {', '.join(FORMATS)}")
+    
+    report_cache = get_report_cache()
+    
     # Try jobs dict first (for documents still being processed)
-    if document_id in jobs:
-        job = jobs[document_id]
+    job = await asyncio.to_thread(jobs.get, document_id)
+    if job is not None:
         if job["status"] != JobStatus.COMPLETED:
             raise HTTPException(400, "Document not processed yet")
         
+        # Result may be None (spilled result purged); the owner is kept in the job state too
+        result = job.get("result") or {}
+        
         # Check user authorization
         user_id = get_user_id_from_token(authorization)
-        job_user_id = job.get("result", {}).get("user_id")
+        job_user_id = job.get("user_id") or result.get("user_id")
         if user_id and job_user_id and job_user_id != user_id:
             raise HTTPException(403, "Unauthorized: Document belongs to another user")
+        report_data = result.get("report_data")
         
-        result = job["result"]
-        report_content = result.get("report_content", "")
-        
-        if not report_content:
-            raise HTTPException(400, "Report not available for this document")
-        
-        return {"report": report_content}
+        if report_data:
+            version = result.get("report_etag") or report_etag(report_data)
+            return _report_response(version, report_data, format, if_none_match)
     
-    # Fallback to Supabase storage for persisted documents
+    # Fallback to Supabase storage for persisted documents (and purged job results)
     try:
         user_id = get_user_id_from_token(authorization)
         supabase_manager = get_supabase_manager()
         
         # First verify document exists in Supabase
-        doc_response = supabase_manager.client.table("documents") \
-            .select("id, user_id") \
-            .eq("id", document_id) \
-            .single() \
-            .execute()
-        
-        doc = doc_response.data
+        doc = await supabase_manager.aget_document(document_id, "id, user_id")
+        if not doc:
+            raise HTTPException(404, "Report not found")
         
         # Verify user owns document
         if user_id and doc.get("user_id") != user_id:
             raise HTTPException(403, "Unauthorized: Document belongs to another user")
         
-        # Download report from Supabase storage
-        report_content = supabase_manager.get_report(document_id, doc.get("user_id"))
+        # Reports never change once generated: reuse the cached copy if we have one
+        cached = report_cache.get_report(document_id)
+        if cached:
+            version, report_data = cached
+            return _report_response(version, report_data, format, if_none_match)
+        
+        # Download structured report from Supabase storage
+        report_data = await supabase_manager.aget_report_data(document_id, doc.get("user_id"))
+        if report_data:
+            version = report_cache.put_report(document_id, report_data)
+            return _report_response(version, report_data, format, if_none_match)
+        
+        # Legacy documents only have a pre-rendered markdown report
+        report_content = await supabase_manager.aget_report(document_id, doc.get("user_id"))
         
         if not report_content:
             raise HTTPException(400, "Report not available for this document")
         
-        return {"report": report_content}
+        return {"report": report_content, "format": "markdown"}
     
     except HTTPException:
         raise
@@ -816,12 +1711,63 @@ def download_report(document_id: str, authorization: Optional[str] = Header(None
         print(f"❌ Error getting report from Supabase: {e}")
         raise HTTPException(404, "Report not found")
 
+@app.post("/api/v1/search")
+async def search_documents(request: SearchRequest, authorization: Optional[str] = Header(None, alias="Authorization")):
+    """
+    Search across all of the current user's documents
+    
+    Returns matching chunks tagged with their document, plus the matching
+    documents ranked by their best hit.
+    """
+    user_id = get_user_id_from_token(authorization)
+    if not user_id:
+        raise HTTPException(401, "Unauthorized: No valid token provided")
+    if not request.query.strip():
+        raise HTTPException(400, "Query must not be empty")
+    
+    k = max(1, min(request.k, 50))
+    user_indexes = get_user_index_manager()
+    
+    documents = await get_supabase_manager().alist_documents(user_id, "id, filename")
+    if documents is None:
+        raise HTTPException(503, "Could not list your documents, please retry")
+    document_ids = {doc["id"] for doc in documents}
+    
+    # Documents deleted in Supabase (the frontend deletes there directly) leave the index
+    for document_id in await asyncio.to_thread(user_indexes.prune, user_id, document_ids):
+        await asyncio.to_thread(forget_document, document_id)
+    
+    # Documents processed before the user index existed are indexed in the background
+    pending = await asyncio.to_thread(user_indexes.backfill, user_id, documents)
+    
+    query_vector = await get_query_embeddings().aembed_query(request.query)
+    hits = await asyncio.to_thread(user_indexes.search, user_id, query_vector, k)
+    # Only documents from the listing (another worker may have changed the index since)
+    hits = [hit for hit in hits if hit["document_id"] in document_ids]
+    
+    ranked_documents = {}
+    for hit in hits:
+        entry = ranked_documents.setdefault(hit["document_id"], {
+            "document_id": hit["document_id"],
+            "file_name": hit["document_name"],
+            "best_distance": hit["distance"],
+            "hits": 0,
+        })
+        entry["hits"] += 1
+    
+    return {
+        "query": request.query,
+        "hits": hits,
+        "documents": list(ranked_documents.values()),
+        "pending_documents": pending,
+    }
+
 # ============================================================================
 # CHATBOT ENDPOINTS
 # ============================================================================
 
 @app.post("/api/v1/chatbot", response_model=ChatbotResponse)
-def chat_with_assistant(request: ChatbotRequest):
+async def chat_with_assistant(request: ChatbotRequest, authorization: Optional[str] = Header(None, alias="Authorization")):
     """
     Chat with LegalMind AI Assistant
     Can be used with or without a specific document context
@@ -833,31 +1779,28 @@ def chat_with_assistant(request: ChatbotRequest):
         document_context = None
         document_name = None
         
-        if request.document_id and request.document_id in jobs:
-            job = jobs[request.document_id]
+        job = await asyncio.to_thread(jobs.get, request.document_id) if request.document_id else None
+        if job is not None:
             if job["status"] == JobStatus.COMPLETED:
-                result = job["result"]
+                result = job.get("result") or {}
                 document_name = result.get("file_name")
-                # Load risky chunks for context
-                try:
-                    with open(result["risky_file"], 'r', encoding='utf-8') as f:
-                        risky_chunks = json.load(f)
-                        # Create brief context
-                        risk_summary = f"Document: {document_name}\n"
-                        risk_summary += f"Risk Score: {result.get('risk_score')}%\n"
-                        risk_summary += f"Risky Clauses: {result.get('risky_chunks')} / {result.get('total_chunks')}\n"
-                        if risky_chunks:
-                            risk_summary += f"Key Risks: {', '.join([c.get('prediction', {}).get('label', 'Unknown') for c in risky_chunks[:3]])}"
-                        document_context = risk_summary
-                except:
-                    pass
+                # Risky chunks are kept in memory with the job result (no file read)
+                risky_chunks = result.get("risky_chunks_data", [])
+                # Create brief context
+                risk_summary = f"Document: {document_name}\n"
+                risk_summary += f"Risk Score: {result.get('risk_score')}%\n"
+                risk_summary += f"Risky Clauses: {result.get('risky_chunks')} / {result.get('total_chunks')}\n"
+                if risky_chunks:
+                    risk_summary += f"Key Risks: {', '.join([c.get('prediction', {}).get('label', 'Unknown') for c in risky_chunks[:3]])}"
+                document_context = risk_summary
         
         # Get response from chatbot
-        response_text = chatbot.chat(
+        response_text = await chatbot.achat(
             user_message=request.message,
             chat_history=request.chat_history,
             document_context=document_context,
-            document_name=document_name
+            document_name=document_name,
+            conversation_owner=conversation_owner(authorization, request.session_id)
         )
         
         # Get suggestions if no document context
@@ -884,10 +1827,10 @@ def get_chatbot_suggestions(document_id: Optional[str] = None):
         chatbot = get_chatbot()
         
         doc_name = "your contract"
-        if document_id and document_id in jobs:
-            job = jobs[document_id]
+        job = jobs.get(document_id) if document_id else None
+        if job is not None:
             if job["status"] == JobStatus.COMPLETED:
-                doc_name = job["result"].get("file_name", "your contract")
+                doc_name = (job.get("result") or {}).get("file_name", "your contract")
         
         suggestions = chatbot.suggest_questions(doc_name)
         return {"suggestions": suggestions}
@@ -1004,13 +1947,13 @@ async def delete_account(authorization: Optional[str] = Header(None, alias="Auth
             raise HTTPException(status_code=401, detail="Unauthorized: No valid token provided")
         
         # Delete all documents belonging to this user from memory
-        documents_to_delete = []
-        for job_id, job in jobs.items():
-            if job.get("result", {}).get("user_id") == user_id:
-                documents_to_delete.append(job_id)
+        documents_to_delete = await asyncio.to_thread(jobs.jobs_for_user, user_id)
         
         for job_id in documents_to_delete:
-            del jobs[job_id]
+            await asyncio.to_thread(jobs.delete, job_id)
+            await asyncio.to_thread(invalidate_caches, "report", job_id)
+        # Every API worker drops the user's RAG sessions, vector stores, answers and index
+        await asyncio.to_thread(invalidate_caches, "user", user_id)
         
         # Call Supabase Manager to handle full deletion (DB + Storage + Auth)
         try:
@@ -14,14 +14,18 @@ import platform
 import re
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEndpointEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 from dotenv import load_dotenv
+
+from ml_pipeline.embedding_cache import get_embedding_model
+from ml_pipeline.job_events import ProgressCallback, report_progress
+from ml_pipeline.lexical_index import BM25Index, LexicalConfig
+from ml_pipeline.pipeline_artifacts import VectorStoreBundle
 from tqdm import tqdm
 
 load_dotenv()
@@ -50,6 +54,11 @@ class PipelineConfig:
     # Embeddings
     embedding_model: str = "google/embeddinggemma-300m"
     embedding_task: str = "feature-extraction"
+    embedding_batch_size: int = 32  # Chunks per embedding request (progress is reported per batch)
+    
+    # Local artifacts (results always carry them in memory as well)
+    save_vector_store: bool = True
+    save_chunks: bool = True
     
     def __post_init__(self):
         """Initialize separators and create only necessary directories"""
@@ -57,8 +66,10 @@ class PipelineConfig:
             self.chunk_separators = ["\n\n\n", "\n\n", "\n", ". ", "; ", ", ", " ", ""]
         
         # Create only essential directories
-        os.makedirs(self.vector_db_dir, exist_ok=True)
-        os.makedirs(self.raw_chunks_dir, exist_ok=True)
+        if self.save_vector_store:
+            os.makedirs(self.vector_db_dir, exist_ok=True)
+        if self.save_chunks:
+            os.makedirs(self.raw_chunks_dir, exist_ok=True)
 
 
 # ============================================================================
@@ -89,7 +100,7 @@ class PDFExtractor:
         self.config = config
         setup_tesseract()
     
-    def extract_text(self, pdf_path: str) -> Tuple[str, int]:
+    def extract_text(self, pdf_path: str, progress: Optional[ProgressCallback] = None) -> Tuple[str, int]:
         """Extract text from PDF, return (text, page_count)"""
         print(f"\n{'='*70}")
         print("STAGE 1: PDF TEXT EXTRACTION")
@@ -114,6 +125,7 @@ class PDFExtractor:
                     pass
             
             all_text.append(text)
+            report_progress(progress, page_num + 1, total_pages)
         
         doc.close()
         
@@ -159,7 +171,8 @@ class LegalDocumentChunker:
             chunk_size=config.chunk_size,
             chunk_overlap=config.chunk_overlap,
             separators=config.chunk_separators,
-            length_function=len
+            length_function=len,
+            add_start_index=True
         )
         
         print(f"{'='*70}")
@@ -175,6 +188,7 @@ class LegalDocumentChunker:
         for i, doc in enumerate(chunks):
             doc.metadata = {
                 'chunk_id': i,
+                'start_index': doc.metadata.get('start_index'),
                 'source': filename,
                 'timestamp': datetime.now().isoformat()
             }
@@ -201,11 +215,8 @@ class EmbeddingGenerator:
         if not hf_token:
             raise ValueError("HF_TOKEN not found in .env file!")
         
-        self.embeddings = HuggingFaceEndpointEmbeddings(
-            repo_id=config.embedding_model,
-            task=config.embedding_task,
-            huggingfacehub_api_token=hf_token
-        )
+        # Shared client: every pipeline (and chat retrieval) reuses its connections
+        self.embeddings = get_embedding_model(config.embedding_model, config.embedding_task)
         
         print("✓ Embedding model loaded\n")
     
@@ -218,30 +229,57 @@ class EmbeddingGenerator:
 # ============================================================================
 
 class VectorStoreManager:
-    """Create and save FAISS vector store"""
+    """Create and save FAISS vector store (plus its BM25 index)"""
     
     def __init__(self, config: PipelineConfig):
         self.config = config
     
-    def create_and_save(self, documents: List[Document], embeddings, doc_name: str) -> str:
-        """Create FAISS index and save"""
+    def embed(self, texts: List[str], embeddings, progress: Optional[ProgressCallback] = None) -> List[List[float]]:
+        """Embed texts in batches of embedding_batch_size (progress is reported per batch)"""
+        vectors = []
+        batch_size = self.config.embedding_batch_size
+        for start in range(0, len(texts), batch_size):
+            vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+            report_progress(progress, min(start + batch_size, len(texts)), len(texts))
+        return vectors
+    
+    def create(self, documents: List[Document], embeddings,
+               progress: Optional[ProgressCallback] = None,
+               vectors: Optional[List[List[float]]] = None) -> VectorStoreBundle:
+        """Create FAISS index (plus BM25 index) in memory (vectors: precomputed embeddings, e.g. from a batch)"""
         print(f"{'='*70}")
         print("STAGE 4: VECTOR STORE")
         print(f"{'='*70}")
         print(f"Creating FAISS index for {len(documents)} chunks...\n")
         
+        texts = [doc.page_content for doc in documents]
+        if vectors is None:
+            vectors = self.embed(texts, embeddings, progress)
+        
         # Create vector store
-        vector_store = FAISS.from_documents(
-            documents=documents,
-            embedding=embeddings
+        vector_store = FAISS.from_embeddings(
+            text_embeddings=list(zip(texts, vectors)),
+            embedding=embeddings,
+            metadatas=[doc.metadata for doc in documents]
         )
         
-        # Save to disk
+        # BM25 index travels with the vector store (same directory / archive)
+        bundle = VectorStoreBundle(vector_store)
+        bundle.add_json(LexicalConfig.INDEX_FILE, BM25Index.build(texts).to_dict())
+        return bundle
+    
+    def save(self, bundle: VectorStoreBundle, doc_name: str) -> str:
+        """Write a vector store (with its BM25 index) to vector_db_dir"""
         save_path = os.path.join(self.config.vector_db_dir, f"{doc_name}_faiss_index")
-        vector_store.save_local(save_path)
-        
-        print(f"✓ Vector store saved: {save_path}\n")
+        bundle.save(save_path)
+        print(f"✓ Vector store saved: {save_path} (with BM25 index)\n")
         return save_path
+    
+    def create_and_save(self, documents: List[Document], embeddings, doc_name: str,
+                        progress: Optional[ProgressCallback] = None,
+                        vectors: Optional[List[List[float]]] = None) -> str:
+        """Create FAISS index and save"""
+        return self.save(self.create(documents, embeddings, progress, vectors), doc_name)
 
 
 # ============================================================================
@@ -260,16 +298,63 @@ class IngestionPipeline:
         self.embedding_generator = EmbeddingGenerator(self.config)
         self.vector_store_manager = VectorStoreManager(self.config)
     
-    def ingest_document(self, pdf_path: str) -> Dict:
-        """Process PDF: extract → clean → chunk → embed → save"""
+    def ingest_document(self, pdf_path: str, page_progress: Optional[ProgressCallback] = None,
+                        embed_progress: Optional[ProgressCallback] = None) -> Dict:
+        """
+        Process PDF: extract → clean → chunk → embed → save
+        
+        page_progress / embed_progress receive (done, total) per page / per embedded chunk batch.
+        """
         print(f"\n{'#'*70}")
         print("LEGAL CONTRACT RAG INGESTION")
         print(f"{'#'*70}\n")
         
-        doc_name = Path(pdf_path).stem
+        documents = self._chunk_pdf(pdf_path, page_progress)
+        return self._save_document(pdf_path, documents, embed_progress=embed_progress)
+    
+    def ingest_batch(self, pdf_paths: List[str], page_progress: Optional[List[ProgressCallback]] = None,
+                     embed_progress: Optional[ProgressCallback] = None) -> List[Dict]:
+        """
+        Ingest several PDFs, embedding the chunks of all of them in shared batches
+        
+        Returns one entry per PDF, in order: the ingest_document() result, or
+        {"error": message} if that PDF could not be processed.
+        """
+        print(f"\n{'#'*70}")
+        print(f"LEGAL CONTRACT RAG INGESTION (BATCH OF {len(pdf_paths)})")
+        print(f"{'#'*70}\n")
         
+        results: List[Optional[Dict]] = [None] * len(pdf_paths)
+        chunked = []  # (index, documents)
+        for i, pdf_path in enumerate(pdf_paths):
+            try:
+                documents = self._chunk_pdf(pdf_path, page_progress[i] if page_progress else None)
+                chunked.append((i, documents))
+            except Exception as e:
+                print(f"❌ Could not read {pdf_path}: {e}")
+                results[i] = {"error": str(e)}
+        
+        # One pass over the pooled chunks: full embedding batches across documents
+        texts = [doc.page_content for _, documents in chunked for doc in documents]
+        embeddings = self.embedding_generator.get_embeddings_model()
+        vectors = self.vector_store_manager.embed(texts, embeddings, embed_progress)
+        
+        offset = 0
+        for i, documents in chunked:
+            doc_vectors = vectors[offset:offset + len(documents)]
+            offset += len(documents)
+            try:
+                results[i] = self._save_document(pdf_paths[i], documents, vectors=doc_vectors)
+            except Exception as e:
+                print(f"❌ Could not index {pdf_paths[i]}: {e}")
+                results[i] = {"error": str(e)}
+        
+        return results
+    
+    def _chunk_pdf(self, pdf_path: str, page_progress: Optional[ProgressCallback] = None) -> List[Document]:
+        """Extract → clean → chunk"""
         # Extract text
-        raw_text, total_pages = self.pdf_extractor.extract_text(pdf_path)
+        raw_text, total_pages = self.pdf_extractor.extract_text(pdf_path, page_progress)
         
         # Clean text (in-place, no extra storage)
         cleaned_text = self.text_cleaner.clean(raw_text)
@@ -278,41 +363,61 @@ class IngestionPipeline:
         # Chunk text
         documents = self.chunker.chunk_document(cleaned_text, Path(pdf_path).name)
         del cleaned_text  # Free memory
+        return documents
+    
+    def _save_document(self, pdf_path: str, documents: List[Document],
+                       embed_progress: Optional[ProgressCallback] = None,
+                       vectors: Optional[List[List[float]]] = None) -> Dict:
+        """
+        Embed (unless vectors are given) → vector store and raw chunks
+        
+        Both are returned in memory ('vector_store', 'chunks'); they are also
+        written locally unless the config turns that off, in which case the
+        corresponding path is None.
+        """
+        doc_name = Path(pdf_path).stem
         
         # Get embeddings
         embeddings = self.embedding_generator.get_embeddings_model()
         
-        # Create and save vector store
-        vector_db_path = self.vector_store_manager.create_and_save(
-            documents, embeddings, doc_name
-        )
+        # Create vector store (and save it, if configured)
+        vector_store = self.vector_store_manager.create(documents, embeddings, embed_progress, vectors=vectors)
+        vector_db_path = None
+        if self.config.save_vector_store:
+            vector_db_path = self.vector_store_manager.save(vector_store, doc_name)
         
         # Save raw chunks (for risk detection)
         chunks_data = [
             {
                 'chunk_id': doc.metadata['chunk_id'],
+                'start_index': doc.metadata.get('start_index'),
                 'text': doc.page_content
             }
             for doc in documents
         ]
         
-        chunks_path = os.path.join(
-            self.config.raw_chunks_dir,
-            f"{doc_name}_chunks.json"
-        )
-        
-        with open(chunks_path, 'w', encoding='utf-8') as f:
-            json.dump(chunks_data, f, indent=2, ensure_ascii=False)
+        chunks_path = None
+        if self.config.save_chunks:
+            chunks_path = os.path.join(
+                self.config.raw_chunks_dir,
+                f"{doc_name}_chunks.json"
+            )
+            
+            with open(chunks_path, 'w', encoding='utf-8') as f:
+                json.dump(chunks_data, f, indent=2, ensure_ascii=False)
         
         # Summary
         print(f"{'='*70}")
         print("✅ INGESTION COMPLETE")
         print(f"{'='*70}")
-        print(f"Vector DB: {vector_db_path}")
-        print(f"Chunks: {chunks_path}")
+        print(f"Vector DB: {vector_db_path or 'in memory'}")
+        print(f"Chunks: {chunks_path or 'in memory'}")
         print(f"Total: {len(documents)} chunks\n")
         
         return {
+            'doc_name': doc_name,
+            'vector_store': vector_store,
+            'chunks': chunks_data,
             'vector_db_path': vector_db_path,
             'chunks_path': chunks_path,
             'total_chunks': len(documents)
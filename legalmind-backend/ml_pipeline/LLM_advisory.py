@@ -4,19 +4,29 @@ LLM_advisory.py - Stage 3 (FIXED RISK RETRIEVAL)
 Now properly retrieves and displays detected risks first
 """
 
+import asyncio
 import json
 import os
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 from dotenv import load_dotenv
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEndpointEmbeddings
 from langchain_core.documents import Document
 
+from ml_pipeline.answer_cache import get_answer_cache
+from ml_pipeline.clause_dedup import attach_advisories, collapse_near_duplicates
+from ml_pipeline.conversation_memory import ConversationContext, get_conversation_memory
+from ml_pipeline.embedding_cache import get_query_embeddings
+from ml_pipeline.job_events import ProgressCallback, report_progress
+from ml_pipeline.lexical_index import BM25Index, HybridRetriever, exact_terms
+from ml_pipeline.llm_router import LLMRouter, run_on_llm_loop
+from ml_pipeline.prompt_budget import BudgetConfig, PromptBudget, PromptItem, get_token_counter
+from ml_pipeline.report_renderer import build_report_data, render_report
+from ml_pipeline.risk_digest import RiskDigest
+
 load_dotenv()
 
 
@@ -38,6 +48,9 @@ class Config:
     OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1")
     LLM_MODEL = os.getenv("LLM_MODEL", "xiaomi/mimo-v2-flash:free")
     
+    # Advisories generated concurrently per document (hedged async LLM calls)
+    ADVISORY_CONCURRENCY = int(os.getenv("ADVISORY_CONCURRENCY", "4"))
+    
     # Embeddings
     EMBEDDING_MODEL = "google/embeddinggemma-300m"
     HF_TOKEN = os.getenv("HF_TOKEN")
@@ -54,24 +67,21 @@ class Config:
 class AdvisoryGenerator:
     """Generate LLM advisory for risky clauses"""
     
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            model=Config.LLM_MODEL,
-            openai_api_key=Config.OPENAI_API_KEY,
-            openai_api_base=Config.OPENAI_API_BASE,
-            temperature=0.7,
-            max_tokens=800
+    def __init__(self, temperature: float = 0.7, max_tokens: int = 800):
+        self.llm = LLMRouter(
+            api_key=Config.OPENAI_API_KEY,
+            api_base=Config.OPENAI_API_BASE,
+            temperature=temperature,
+            max_tokens=max_tokens
         )
     
-    def analyze_risk(self, chunk: Dict) -> Dict:
-        """Analyze risky clause"""
+    def _prompt(self, chunk: Dict) -> tuple:
+        """(clause text, prompt) for a risky clause"""
         risk_type = chunk['prediction']['label']
         confidence = chunk['prediction']['confidence']
-        clause_text = chunk['text']
         
-        # Truncate long clauses
-        if len(clause_text) > 1000:
-            clause_text = clause_text[:1000] + "..."
+        # Truncate long clauses to the advisory token budget
+        clause_text = get_token_counter().truncate(chunk['text'], BudgetConfig.ADVISORY_CLAUSE_TOKENS)
         
         prompt = f"""You are an expert legal advisor. Analyze this risky contract clause.
 
@@ -104,40 +114,73 @@ Provide analysis using ONLY bullet points (no long sentences):
 • Replace with approach 1
 • Implement alternative 2
 • Consider option 3"""
-        
+        return clause_text, prompt
+    
+    @staticmethod
+    def _advisory(chunk: Dict, clause_text: str, analysis: Optional[str] = None,
+                  error: Optional[Exception] = None) -> Dict:
+        advisory = {
+            'chunk_id': chunk['chunk_id'],
+            'original_clause': clause_text,
+            'risk_detection': {
+                'risk_type': chunk['prediction']['label'],
+                'confidence': chunk['prediction']['confidence']
+            }
+        }
+        if error is not None:
+            advisory['error'] = str(error)
+        else:
+            advisory['llm_analysis'] = analysis.strip()
+            advisory['timestamp'] = datetime.now().isoformat()
+        return advisory
+    
+    def analyze_risk(self, chunk: Dict) -> Dict:
+        """Analyze risky clause"""
+        clause_text, prompt = self._prompt(chunk)
         try:
             response = self.llm.invoke([HumanMessage(content=prompt)])
-            
-            return {
-                'chunk_id': chunk['chunk_id'],
-                'original_clause': clause_text,
-                'risk_detection': {
-                    'risk_type': risk_type,
-                    'confidence': confidence
-                },
-                'llm_analysis': response.content.strip(),
-                'timestamp': datetime.now().isoformat()
-            }
         except Exception as e:
-            return {
-                'chunk_id': chunk['chunk_id'],
-                'error': str(e),
-                'original_clause': clause_text,
-                'risk_detection': {
-                    'risk_type': risk_type,
-                    'confidence': confidence
-                }
-            }
+            return self._advisory(chunk, clause_text, error=e)
+        return self._advisory(chunk, clause_text, response.content)
     
-    def generate_advisories(self, risky_chunks: List[Dict]) -> List[Dict]:
-        """Generate advisories for all risky chunks"""
+    async def aanalyze_risk(self, chunk: Dict) -> Dict:
+        """Async analyze_risk() (hedged across routes; losing requests are cancelled)"""
+        clause_text, prompt = self._prompt(chunk)
+        try:
+            response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        except Exception as e:
+            return self._advisory(chunk, clause_text, error=e)
+        return self._advisory(chunk, clause_text, response.content)
+    
+    async def agenerate_advisories(self, risky_chunks: List[Dict],
+                                   progress: Optional[ProgressCallback] = None) -> List[Dict]:
+        """Generate advisories ADVISORY_CONCURRENCY at a time (results keep the input order)"""
+        limiter = asyncio.Semaphore(max(Config.ADVISORY_CONCURRENCY, 1))
+        total = len(risky_chunks)
+        done = 0
+        
+        async def one(i: int, chunk: Dict) -> Dict:
+            nonlocal done
+            async with limiter:
+                print(f"[{i}/{total}] Analyzing {chunk['prediction']['label']}...")
+                advisory = await self.aanalyze_risk(chunk)
+            done += 1
+            report_progress(progress, done, total)
+            return advisory
+        
+        return list(await asyncio.gather(*(one(i, chunk) for i, chunk in enumerate(risky_chunks, 1))))
+    
+    def generate_advisories(self, risky_chunks: List[Dict],
+                            progress: Optional[ProgressCallback] = None) -> List[Dict]:
+        """
+        Generate advisories for all risky chunks (progress gets (done, total) per advisory)
+        
+        Calls run on the shared LLM loop so they are hedged like chat calls;
+        call from a worker thread, not from inside an event loop.
+        """
         print(f"\nGenerating LLM advisories for {len(risky_chunks)} risky chunks...\n")
         
-        advisories = []
-        for i, chunk in enumerate(risky_chunks, 1):
-            print(f"[{i}/{len(risky_chunks)}] Analyzing {chunk['prediction']['label']}...")
-            advisory = self.analyze_risk(chunk)
-            advisories.append(advisory)
+        advisories = run_on_llm_loop(self.agenerate_advisories(risky_chunks, progress))
         
         print(f"\n✓ Generated {len(advisories)} advisories\n")
         return advisories
@@ -150,74 +193,243 @@ Provide analysis using ONLY bullet points (no long sentences):
 class EnhancedRAGSystem:
     """RAG system that ALWAYS shows detected risks first"""
     
-    def __init__(self, vector_db_path: str, advisories: List[Dict], doc_name: str):
+    def __init__(self, vector_db_path: Optional[str], advisories: List[Dict], doc_name: str,
+                 document_id: str = None, analysis_version: str = None, user_id: str = None,
+                 risk_digest: RiskDigest = None, vector_store=None, lexical_index: BM25Index = None):
         print("\nInitializing Enhanced RAG system...")
         
         # LLM
-        self.llm = ChatOpenAI(
-            model=Config.LLM_MODEL,
-            openai_api_key=Config.OPENAI_API_KEY,
-            openai_api_base=Config.OPENAI_API_BASE,
+        self.llm = LLMRouter(
+            api_key=Config.OPENAI_API_KEY,
+            api_base=Config.OPENAI_API_BASE,
             temperature=0.7
         )
         
-        # Embeddings
-        self.embeddings = HuggingFaceEndpointEmbeddings(
-            repo_id=Config.EMBEDDING_MODEL,
-            task="feature-extraction",
-            huggingfacehub_api_token=Config.HF_TOKEN
-        )
+        # Embeddings (shared query-embedding cache across documents)
+        self.embeddings = get_query_embeddings()
         
-        # Load vector store
-        print("✓ Loading vector database...")
-        self.vectorstore = FAISS.load_local(
-            vector_db_path,
-            self.embeddings,
-            allow_dangerous_deserialization=True
-        )
+        if vector_store is not None:
+            # Store still in memory (zero-disk job): share its index, embed queries as usual
+            self.vectorstore = FAISS(
+                embedding_function=self.embeddings,
+                index=vector_store.index,
+                docstore=vector_store.docstore,
+                index_to_docstore_id=vector_store.index_to_docstore_id
+            )
+        else:
+            print("✓ Loading vector database...")
+            self.vectorstore = FAISS.load_local(
+                vector_db_path,
+                self.embeddings,
+                allow_dangerous_deserialization=True
+            )
+            lexical_index = BM25Index.load(vector_db_path)
+        
+        # Hybrid lexical + vector retrieval (older stores get a BM25 index built here)
+        self.retriever = HybridRetriever(self.vectorstore, lexical_index)
         
         # Store advisories in memory (CRITICAL FIX)
         self.detected_risks = advisories
         self.doc_name = doc_name
         
+        # Compact ranked digest for risk questions (persisted with the vector store;
+        # built here only for stores analysed before digests existed)
+        self.risk_digest = risk_digest or (vector_db_path and RiskDigest.load(vector_db_path)) \
+            or RiskDigest.build(advisories)
+        
+        # Semantic answer cache (only when the document is identifiable)
+        self.document_id = document_id
+        self.analysis_version = analysis_version
+        self.user_id = user_id
+        self.answer_cache = get_answer_cache()
+        
         print(f"✓ Stored {len(advisories)} detected risks in memory")
         print("✓ Enhanced RAG system ready\n")
     
-    def chat(self, user_query: str, chat_history: List = None) -> str:
+    def memory_footprint(self) -> int:
+        """Approximate bytes held by this RAG system (index + texts + risks)"""
+        index = self.vectorstore.index
+        size = index.ntotal * index.d * 4  # float32 vectors
+        docstore = getattr(self.vectorstore.docstore, "_dict", {})
+        size += sum(len(doc.page_content) for doc in docstore.values())
+        size += len(json.dumps(self.detected_risks, default=str))
+        size += self.retriever.lexical_index.memory_footprint()
+        return size
+    
+    def chat(self, user_query: str, chat_history: List = None, conversation_owner: str = None) -> str:
         """Chat that ALWAYS prioritizes detected risks"""
+        vector = None
+        if self._answer_cacheable(user_query, chat_history):
+            vector = self.embeddings.embed_query(user_query)
+            cached = self.answer_cache.lookup(self.document_id, self.analysis_version, vector)
+            if cached is not None:
+                return cached
+        
+        messages = self._build_messages(user_query, chat_history, conversation_owner)
+        
+        # Get response
+        response = self.llm.invoke(messages)
+        self._remember_answer(user_query, vector, response.content)
+        return response.content
+    
+    def stream_chat(self, user_query: str, chat_history: List = None, conversation_owner: str = None):
+        """Same as chat(), but yields the answer text as it is generated"""
+        vector = None
+        if self._answer_cacheable(user_query, chat_history):
+            vector = self.embeddings.embed_query(user_query)
+            cached = self.answer_cache.lookup(self.document_id, self.analysis_version, vector)
+            if cached is not None:
+                yield cached
+                return
+        
+        messages = self._build_messages(user_query, chat_history, conversation_owner)
+        
+        pieces = []
+        for chunk in self.llm.stream(messages):
+            if chunk.content:
+                pieces.append(chunk.content)
+                yield chunk.content
+        self._remember_answer(user_query, vector, "".join(pieces))
+    
+    async def achat(self, user_query: str, chat_history: List = None, conversation_owner: str = None) -> str:
+        """Async chat(): retrieval and the LLM call run on async I/O"""
+        vector = None
+        if self._answer_cacheable(user_query, chat_history):
+            vector = await self.embeddings.aembed_query(user_query)
+            cached = self.answer_cache.lookup(self.document_id, self.analysis_version, vector)
+            if cached is not None:
+                return cached
+        
+        messages = await self._abuild_messages(user_query, chat_history, conversation_owner)
+        response = await self.llm.ainvoke(messages)
+        self._remember_answer(user_query, vector, response.content)
+        return response.content
+    
+    async def astream_chat(self, user_query: str, chat_history: List = None, conversation_owner: str = None):
+        """Async stream_chat()"""
+        vector = None
+        if self._answer_cacheable(user_query, chat_history):
+            vector = await self.embeddings.aembed_query(user_query)
+            cached = self.answer_cache.lookup(self.document_id, self.analysis_version, vector)
+            if cached is not None:
+                yield cached
+                return
+        
+        messages = await self._abuild_messages(user_query, chat_history, conversation_owner)
+        
+        pieces = []
+        async for chunk in self.llm.astream(messages):
+            if chunk.content:
+                pieces.append(chunk.content)
+                yield chunk.content
+        self._remember_answer(user_query, vector, "".join(pieces))
+    
+    def _answer_cacheable(self, user_query: str, chat_history: List = None) -> bool:
+        """
+        Only first-turn questions are answered from the cache: with history the
+        answer depends on the conversation. Exact clause references are skipped
+        too, since "Section 9.2" and "Section 9.3" embed almost identically.
+        """
+        return self.document_id is not None and not chat_history and not exact_terms(user_query)
+    
+    def _remember_answer(self, user_query: str, vector, answer: str):
+        if vector is not None and answer:
+            self.answer_cache.store(
+                self.document_id, self.analysis_version, user_query, vector, answer, user_id=self.user_id
+            )
+    
+    def _build_messages(self, user_query: str, chat_history: List = None, conversation_owner: str = None) -> List:
+        """Retrieve context and build the budgeted prompt messages"""
+        
+        # Retrieve contract context
+        contract_docs = self.retriever.search(user_query, k=4)
+        conversation = get_conversation_memory().prepare(
+            chat_history, scope=self._memory_scope(), owner=conversation_owner
+        )
+        return self._assemble_messages(user_query, conversation, contract_docs)
+    
+    async def _abuild_messages(self, user_query: str, chat_history: List = None,
+                               conversation_owner: str = None) -> List:
+        """Async _build_messages() (query embedding, if needed, is awaited)"""
+        contract_docs = await self.retriever.asearch(user_query, k=4)
+        conversation = await get_conversation_memory().aprepare(
+            chat_history, scope=self._memory_scope(), owner=conversation_owner
+        )
+        return self._assemble_messages(user_query, conversation, contract_docs)
+    
+    def _memory_scope(self) -> str:
+        return f"document:{self.document_id or self.doc_name}"
+    
+    def _assemble_messages(self, user_query: str, conversation: ConversationContext,
+                           contract_docs: List) -> List:
+        """Build the budgeted prompt messages from retrieved contract context"""
         
         # Check if asking about risks
         risk_keywords = ['risk', 'risky', 'danger', 'problem', 'issue', 'concern', 'warning']
         is_risk_query = any(keyword in user_query.lower() for keyword in risk_keywords)
         
-        # Retrieve contract context
-        contract_docs = self.vectorstore.similarity_search(user_query, k=4)
-        contract_context = "\n\n".join([doc.page_content for doc in contract_docs])
+        # Candidate prompt content, fitted to the token budget below
+        risk_items = self._risk_items(user_query) if is_risk_query else []
+        context_items = [
+            PromptItem(text=doc.page_content, priority=-rank)
+            for rank, doc in enumerate(contract_docs)
+        ]
+        # Older turns arrive folded into a summary; recent turns stay verbatim
+        summary_message = conversation.summary_message()
+        history = list(conversation.recent)
+        
+        risks_text, context_text, history = self._fit_to_budget(
+            user_query, risk_items, context_items, history,
+            summary=summary_message.content if summary_message else ""
+        )
         
         # Build prompt based on query type
-        if is_risk_query and self.detected_risks:
-            # Build detected risks summary
-            detected_risks_text = []
-            for i, adv in enumerate(self.detected_risks, 1):
-                if "error" in adv:
-                    continue
+        if risks_text:
+            system_msg = self._risk_system_prompt(risks_text, context_text)
+        else:
+            system_msg = self._context_system_prompt(context_text)
+        
+        # Add chat history
+        messages = [SystemMessage(content=system_msg)]
+        if summary_message:
+            messages.append(summary_message)
+        messages.extend(history)
+        messages.append(HumanMessage(content=user_query))
+        return messages
+    
+    def _risk_items(self, user_query: str) -> List[PromptItem]:
+        """Risk digest entries, plus the full text of any risk the query points at"""
+        items = self.risk_digest.prompt_items()
+        referenced = self.risk_digest.referenced(user_query)
+        if referenced:
+            top = max((item.priority for item in items), default=0.0) + 1
+            items = self._risk_detail_items(referenced, priority=top) + items
+        return items
+    
+    def _risk_detail_items(self, entries: List, priority: float) -> List[PromptItem]:
+        """Full clause and analysis blocks for the given digest entries"""
+        by_chunk = {
+            str(adv.get("chunk_id", adv.get("id"))): adv
+            for adv in self.detected_risks
+            if "error" not in adv and adv.get("duplicate_of") is None
+        }
+        items = []
+        for entry in entries:
+            adv = by_chunk.get(str(entry.chunk_id))
+            if adv is None:
+                continue
+            
+            i = entry.rank
+            risk_type = entry.risk_type
+            confidence = entry.confidence
+            chunk_id = entry.chunk_id
+            original_clause = adv.get("original_clause") or adv.get("text", "N/A")
+            llm_analysis = adv.get(
+                "llm_analysis",
+                "No stored detailed advisory for this clause. Summarize why this clause is risky and what the parties should negotiate.",
+            )
 
-                # Support both full advisories (with 'risk_detection') and
-                # raw risky chunks (with 'prediction' + 'text')
-                risk_detection = adv.get("risk_detection") or {
-                    "risk_type": adv.get("prediction", {}).get("label", "Unknown"),
-                    "confidence": adv.get("prediction", {}).get("confidence", 0.0),
-                }
-                risk_type = risk_detection.get("risk_type", "Unknown")
-                confidence = risk_detection.get("confidence", 0.0)
-                chunk_id = adv.get("chunk_id", adv.get("id", "N/A"))
-                original_clause = adv.get("original_clause") or adv.get("text", "N/A")
-                llm_analysis = adv.get(
-                    "llm_analysis",
-                    "No stored detailed advisory for this clause. Summarize why this clause is risky and what the parties should negotiate.",
-                )
-
-                risk_summary = f"""
+            risk_summary = f"""
 ═══════════════════════════════════════════════════════════════════════
 MAJOR RISK #{i} (AI-DETECTED)
 ═══════════════════════════════════════════════════════════════════════
@@ -234,15 +446,60 @@ ORIGINAL RISKY CLAUSE:
 DETAILED ANALYSIS:
 {llm_analysis}
 """
-                detected_risks_text.append(risk_summary)
-            
-            system_msg = f"""You are an expert legal advisor analyzing a contract.
+            clause_excerpt = " ".join(str(original_clause).split())[:200]
+            short_summary = (
+                f"MAJOR RISK #{i} (AI-DETECTED): {risk_type} | Confidence: {confidence:.1%} | "
+                f"Chunk ID: {chunk_id} | Clause: {clause_excerpt}..."
+            )
+            items.append(PromptItem(text=risk_summary, priority=priority, summary=short_summary))
+        return items
+    
+    def _fit_to_budget(self, user_query: str, risk_items: List[PromptItem],
+                       context_items: List[PromptItem], history: List, summary: str = ""):
+        """Fit risks, context and history into the chat prompt budget"""
+        counter = get_token_counter()
+        budget = PromptBudget(BudgetConfig.CHAT_PROMPT_TOKENS, counter)
+        
+        # Fixed parts of the prompt are always sent
+        template = self._risk_system_prompt("", "") if risk_items else self._context_system_prompt("")
+        reserved = counter.count(template) + counter.count(user_query) + counter.count(summary)
+        
+        def demand(items):
+            return sum(counter.count(item.text) for item in items)
+        
+        history_costs = [counter.count(_message_text(msg)) for msg in history]
+        allocation = budget.allocate(
+            {
+                "risks": demand(risk_items),
+                "context": demand(context_items),
+                "history": sum(history_costs),
+            },
+            reserved=reserved
+        )
+        
+        risk_texts, omitted_risks = budget.fit_items(risk_items, allocation["risks"])
+        if omitted_risks:
+            risk_texts.append(f"({omitted_risks} lower-confidence risk(s) omitted for brevity)")
+        context_texts, _ = budget.fit_items(context_items, allocation["context"])
+        
+        # History keeps whole turns only: drop the oldest until it fits
+        kept_history = list(history)
+        while kept_history and sum(history_costs) > allocation["history"]:
+            kept_history.pop(0)
+            history_costs.pop(0)
+        
+        return "\n".join(risk_texts), "\n\n".join(context_texts), kept_history
+    
+    @staticmethod
+    def _risk_system_prompt(detected_risks_text: str, contract_context: str) -> str:
+        """System prompt for risk-focused questions"""
+        return f"""You are an expert legal advisor analyzing a contract.
 
 {'='*70}
 AI-DETECTED MAJOR RISKS (THESE MUST BE MENTIONED FIRST!)
 {'='*70}
 
-{chr(10).join(detected_risks_text)}
+{detected_risks_text}
 
 {'='*70}
 ADDITIONAL CONTRACT CONTEXT (For finding other potential risks)
@@ -256,9 +513,10 @@ INSTRUCTIONS FOR YOUR RESPONSE:
 When the user asks about risks, you MUST:
 
 1. **FIRST:** List ALL the MAJOR RISKS detected by the AI model above
-   - Include the risk type, confidence, and chunk ID
-   - Show the original risky clause
-   - Explain the analysis
+   - Include the risk number, risk type, confidence, and chunk ID
+   - Quote the clause (excerpt, or the full clause when it is given)
+   - Explain why it is risky
+   - Mention that the user can ask about "risk #N" for the full clause and analysis
 
 2. **THEN:** Analyze the additional contract context for any OTHER risks not detected by AI
    - Clearly label these as "Additional Potential Risks (Not AI-Detected)"
@@ -269,25 +527,23 @@ When the user asks about risks, you MUST:
    - "⚠️ ADDITIONAL POTENTIAL RISKS"
 
 Answer the user's question following these instructions:"""
-        
-        else:
-            # Normal query (not about risks)
-            system_msg = f"""You are an expert legal advisor analyzing a contract.
+    
+    @staticmethod
+    def _context_system_prompt(contract_context: str) -> str:
+        """System prompt for normal (non-risk) questions"""
+        return f"""You are an expert legal advisor analyzing a contract.
 
 Contract Context:
 {contract_context}
 
 Answer the user's question based on this context:"""
-        
-        # Add chat history
-        messages = [SystemMessage(content=system_msg)]
-        if chat_history:
-            messages.extend(chat_history[-6:])
-        messages.append(HumanMessage(content=user_query))
-        
-        # Get response
-        response = self.llm.invoke(messages)
-        return response.content
+
+
+def _message_text(message) -> str:
+    """Text content of a chat message (LangChain message or role/content dict)"""
+    if isinstance(message, dict):
+        return str(message.get("content", ""))
+    return str(getattr(message, "content", message))
 
 
 # ============================================================================
@@ -296,148 +552,12 @@ Answer the user's question based on this context:"""
 
 def generate_safe_report(total_chunks: int) -> str:
     """Generate safe contract report"""
-    return f"""## CONTRACT RISK ANALYSIS REPORT
-
-**Generated:** {datetime.now().strftime('%B %d, %Y at %I:%M %p')}  
-**Total Chunks Analyzed:** {total_chunks}
-
----
-
-## ✅ RESULT: SAFE CONTRACT
-
-### 🎉 Good News!
-
-No significant risks detected in this contract.
-
-### What This Means:
-
-- **No unilateral termination clauses** - Termination terms appear balanced
-- **No unlimited liability provisions** - Liability exposure is capped appropriately
-- **No excessive non-compete restrictions** - Restrictions are reasonable in scope
-
----
-
-### ⚖️ Disclaimer
-
-This is an AI-generated analysis based on automated risk detection models. While the system has high accuracy in identifying common legal risks, it is recommended to consult with a qualified legal professional for a complete review of this contract. AI analysis complements but does not replace professional legal advice.
-
----
-"""
+    return render_report(build_report_data([], total_chunks, ""), "markdown")
 
 
 def generate_risky_report(advisories: List[Dict], source_name: str) -> str:
     """Generate risky contract report with professional formatting using bullet points"""
-    lines = []
-    
-    # Header
-    lines.append("## CONTRACT RISK ANALYSIS REPORT")
-    # lines.append("")
-    # lines.append(f"**Document:** {source_name}")
-    lines.append(f"**Generated:** {datetime.now().strftime('%B %d, %Y at %I:%M %p')}")
-    lines.append(f"**Total Risks Found:** {len(advisories)}")
-    lines.append("")
-    lines.append("---")
-    lines.append("")
-    
-    # Risk Summary Section
-    lines.append("## 🚨 IDENTIFIED RISKS")
-    lines.append("")
-    lines.append(f"This contract contains **{len(advisories)} significant risk(s)** that require attention:")
-    lines.append("")
-    
-    # Risk listing with confidence levels
-    for i, advisory in enumerate(advisories, 1):
-        if 'error' not in advisory:
-            risk_type = advisory.get('risk_detection', {}).get('risk_type', 'Unknown Risk')
-            confidence = advisory.get('risk_detection', {}).get('confidence', 0.0)
-            
-            # Create risk summary line with bullet
-            risk_level = "HIGH" if confidence > 0.8 else "MEDIUM" if confidence > 0.6 else "ELEVATED"
-            lines.append(f"**{i}. {risk_type}** [{risk_level} CONFIDENCE: {confidence:.1%}]")
-    
-    lines.append("")
-    lines.append("---")
-    lines.append("")
-    
-    # Detailed Risk Analysis
-    lines.append("## 📋 DETAILED RISK ANALYSIS")
-    lines.append("")
-    
-    for i, advisory in enumerate(advisories, 1):
-        if 'error' in advisory:
-            lines.append(f"### Risk #{i}: {advisory['risk_detection']['risk_type']}")
-            lines.append("")
-            lines.append(f"⚠️ **Analysis Status:** {advisory['error']}")
-            lines.append("")
-            lines.append("---")
-            lines.append("")
-            continue
-        
-        risk_type = advisory['risk_detection']['risk_type']
-        confidence = advisory['risk_detection']['confidence']
-        chunk_id = advisory['chunk_id']
-        original_clause = advisory.get('original_clause', 'N/A')
-        llm_analysis = advisory['llm_analysis']
-        
-        # Risk header
-        lines.append(f"### Risk #{i}: {risk_type}")
-        lines.append("")
-        
-        # Confidence and ID
-        lines.append(f"**Confidence Level:** {confidence:.1%}")
-        lines.append(f"**Reference ID:** {chunk_id}")
-        lines.append("")
-        
-        # Original Clause Section
-        lines.append("#### 📄 Original Risky Clause")
-        lines.append("")
-        lines.append("```")
-        lines.append(original_clause)
-        lines.append("```")
-        lines.append("")
-        
-        # Analysis Section with bullet formatting
-        lines.append("#### 🔍 Detailed Analysis")
-        lines.append("")
-        
-        # Parse the LLM analysis to ensure proper bullet point formatting
-        analysis_lines = llm_analysis.strip().split('\n')
-        for line in analysis_lines:
-            # If line starts with a number followed by period or a bullet already, keep it
-            if line.strip().startswith(('1.', '2.', '3.', '4.', '5.', '•', '-')):
-                lines.append(line)
-            # If line contains ** (header), keep it
-            elif '**' in line:
-                lines.append(line)
-            # If line is already a bullet point format, keep it
-            elif line.strip() and not line.startswith(' '):
-                # Add bullet if not already present
-                if not line.strip().startswith('•'):
-                    lines.append(f"• {line.strip()}")
-                else:
-                    lines.append(line)
-            else:
-                lines.append(line)
-        
-        lines.append("")
-        lines.append("---")
-        lines.append("")
-    
-    # Conclusion
-    lines.append("## ⚖️ Important Disclaimer")
-    lines.append("")
-    lines.append("**This is an AI-generated legal analysis.** While the system has been trained on extensive legal documentation and achieves high accuracy in identifying common contract risks, it should not be considered a substitute for professional legal counsel.")
-    lines.append("")
-    lines.append("### Recommendations:")
-    lines.append("• Review with Legal Professional - Consult with a qualified attorney licensed in your jurisdiction")
-    lines.append("• Negotiate Key Terms - Use the identified risks as a starting point for negotiations")
-    lines.append("• Verify Compliance - Ensure all recommendations comply with applicable laws and regulations")
-    lines.append("• Consider Context - This analysis is automated and may not account for specific business relationships or industry practices")
-    lines.append("")
-    lines.append("---")
-    lines.append(f"**Report Generated:** {datetime.now().strftime('%B %d, %Y at %I:%M %p UTC')}")
-    
-    return "\n".join(lines)
+    return render_report(build_report_data(advisories, 0, source_name), "markdown")
 
 
 # ============================================================================
@@ -445,50 +565,37 @@ def generate_risky_report(advisories: List[Dict], source_name: str) -> str:
 # ============================================================================
 
 class AdvisoryPipeline:
-    """Complete advisory pipeline"""
+    """Complete advisory pipeline (stateless between documents, so one instance can serve every job)"""
     
-    def __init__(self):
+    def __init__(self, generator: Optional[AdvisoryGenerator] = None):
         Config.setup_directories()
+        self.generator = generator or AdvisoryGenerator()
     
     def process(self, risky_file: str, safe_file: str, 
-                vector_db_path: str, enable_chat: bool = False):
+                vector_db_path: str, enable_chat: bool = False,
+                progress: Optional[ProgressCallback] = None):
         """Process: analyze → report → chat"""
-        print(f"\n{'='*70}")
-        print("LEGAL ADVISORY PIPELINE")
-        print(f"{'='*70}\n")
-        
         # Load chunks
         with open(risky_file, 'r', encoding='utf-8') as f:
             risky_chunks = json.load(f)
         with open(safe_file, 'r', encoding='utf-8') as f:
             safe_chunks = json.load(f)
         
-        total_chunks = len(risky_chunks) + len(safe_chunks)
         doc_name = Path(risky_file).stem.replace('_risky_', '').split('_')[0]
+        analysis = self.analyze(risky_chunks, safe_chunks, doc_name, progress)
+        advisories = analysis['advisories']
+        report_path = analysis['report_path']
         
-        print(f"Risky: {len(risky_chunks)}")
-        print(f"Safe: {len(safe_chunks)}")
-        print(f"Total: {total_chunks}\n")
-        
-        # Generate report
-        advisories = []
-        if not risky_chunks:
-            report_content = generate_safe_report(total_chunks)
-        else:
-            generator = AdvisoryGenerator()
-            advisories = generator.generate_advisories(risky_chunks)
-            report_content = generate_risky_report(advisories, doc_name)
-        
-        # Save report
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        report_path = os.path.join(
-            Config.REPORTS_DIR,
-            f"{doc_name}_report_{timestamp}.txt"
-        )
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(report_content)
+        # Persist the attached advisories alongside the risky chunks
+        if risky_chunks:
+            with open(risky_file, 'w', encoding='utf-8') as f:
+                json.dump(risky_chunks, f, indent=2, ensure_ascii=False)
         
-        print(f"✓ Report saved: {report_path}\n")
+        # Risk digest for chat, saved with the vector store so it travels with it
+        if os.path.isdir(vector_db_path):
+            digest = analysis['risk_digest']
+            digest.save(vector_db_path)
+            print(f"✓ Risk digest saved ({len(digest.entries)}/{digest.total_risks} risks)\n")
         
         # Interactive chat
         if enable_chat:
@@ -517,6 +624,55 @@ class AdvisoryPipeline:
                 print(f"\nAssistant: {response}\n")
         
         return report_path
+    
+    def analyze(self, risky_chunks: List[Dict], safe_chunks: List[Dict], doc_name: str,
+                progress: Optional[ProgressCallback] = None, save_report: bool = True) -> Dict:
+        """
+        Advisories, report and risk digest for chunks already in memory
+        
+        Advisories are attached to risky_chunks in place. Returns
+        {'advisories', 'report_data', 'risk_digest', 'report_path'}; the
+        report is written to REPORTS_DIR only with save_report (else
+        report_path is None).
+        """
+        print(f"\n{'='*70}")
+        print("LEGAL ADVISORY PIPELINE")
+        print(f"{'='*70}\n")
+        
+        total_chunks = len(risky_chunks) + len(safe_chunks)
+        
+        print(f"Risky: {len(risky_chunks)}")
+        print(f"Safe: {len(safe_chunks)}")
+        print(f"Total: {total_chunks}\n")
+        
+        # Generate report (stored as structured data, rendered on demand)
+        advisories = []
+        if risky_chunks:
+            # One advisory per group of near-duplicate clauses
+            groups = collapse_near_duplicates(risky_chunks)
+            advisories = self.generator.generate_advisories([g.representative for g in groups], progress)
+            attach_advisories(groups, advisories)
+        report_data = build_report_data(advisories, total_chunks, doc_name)
+        
+        # Save report
+        report_path = None
+        if save_report:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            report_path = os.path.join(
+                Config.REPORTS_DIR,
+                f"{doc_name}_report_{timestamp}.json"
+            )
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(report_data, f, separators=(',', ':'), ensure_ascii=False)
+            
+            print(f"✓ Report saved: {report_path}\n")
+        
+        return {
+            'advisories': advisories,
+            'report_data': report_data,
+            'risk_digest': RiskDigest.build(advisories),
+            'report_path': report_path
+        }
 
 
 # ============================================================================
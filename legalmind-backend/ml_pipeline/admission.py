@@ -0,0 +1,164 @@
+"""
+admission.py
+============
+Admission control for document uploads
+Caps how much work the node accepts: the worker pool bounds running pipelines
+(sized from the measured memory cost of one job when configured), a global
+cap bounds the queue, and per-user caps bound how many jobs one user may have
+queued and running. Uploads over a limit are refused with a retry hint based
+on measured job durations.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from ml_pipeline.job_queue import DurableJobQueue, JobQueueConfig, QueueStatus, WorkerPool
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class AdmissionConfig:
+    """Upload admission settings (from .env)"""
+
+    # Jobs waiting in the queue, all users together
+    MAX_QUEUED_JOBS = int(os.getenv("JOB_MAX_QUEUED", "100"))
+
+    # Per user (or per client address for anonymous uploads)
+    USER_MAX_RUNNING = int(os.getenv("JOB_USER_MAX_RUNNING", "1"))
+    USER_MAX_QUEUED = int(os.getenv("JOB_USER_MAX_QUEUED", "5"))
+
+    # API worker processes on the node (app.py); JOB_WORKERS and the memory
+    # budget below are node totals, split between them
+    API_WORKERS = max(int(os.getenv("API_WORKERS", "1")), 1)
+
+    # Measured peak memory of one pipeline and the memory set aside for
+    # pipelines; when both are set they bound the worker count
+    JOB_MEMORY_MB = float(os.getenv("JOB_MEMORY_MB", "0"))
+    PIPELINE_MEMORY_MB = float(os.getenv("PIPELINE_MEMORY_MB", "0"))
+
+    # Retry hint before any job duration has been measured
+    DEFAULT_JOB_SECONDS = 120.0
+    MIN_RETRY_SECONDS = 5
+    MAX_RETRY_SECONDS = 3600
+
+
+def pipeline_workers() -> int:
+    """
+    Concurrent pipelines in this process
+
+    JOB_WORKERS, lowered to fit the memory budget, is the node total; every
+    API worker process runs its share of it (at least one).
+    """
+    workers = JobQueueConfig.WORKERS
+    if AdmissionConfig.JOB_MEMORY_MB > 0 and AdmissionConfig.PIPELINE_MEMORY_MB > 0:
+        fit = int(AdmissionConfig.PIPELINE_MEMORY_MB // AdmissionConfig.JOB_MEMORY_MB)
+        workers = min(workers, fit)
+    if workers < AdmissionConfig.API_WORKERS:
+        print(f"⚠️  {workers} pipeline worker(s) for {AdmissionConfig.API_WORKERS} API workers: "
+              f"running one per API worker")
+    return max(workers // AdmissionConfig.API_WORKERS, 1)
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # KB on Linux
+
+
+@dataclass
+class AdmissionDecision:
+    admitted: bool
+    reason: str = ""
+    retry_after: int = 0   # Seconds
+    limit: Optional[int] = None
+
+
+# ============================================================================
+# ADMISSION CONTROLLER
+# ============================================================================
+
+class AdmissionController:
+    """
+    Decide whether an upload may join the queue
+
+    Checks read the durable queue, so they hold across API workers. Two
+    requests racing past a check can overshoot a cap by one each; the caps
+    are load limits, not quotas.
+    """
+
+    def __init__(
+        self,
+        queue: DurableJobQueue,
+        pool: WorkerPool,
+        max_queued: int = AdmissionConfig.MAX_QUEUED_JOBS,
+        user_max_queued: int = AdmissionConfig.USER_MAX_QUEUED
+    ):
+        self.queue = queue
+        self.pool = pool
+        self.max_queued = max_queued
+        self.user_max_queued = user_max_queued
+        self.lock = threading.Lock()
+        self.stats = {"admitted": 0, "rejected_global": 0, "rejected_user": 0}
+
+    def _job_seconds(self) -> float:
+        return self.pool.avg_job_seconds or AdmissionConfig.DEFAULT_JOB_SECONDS
+
+    def _retry_after(self, jobs_ahead: int, parallel: int) -> int:
+        seconds = self._job_seconds() * max(jobs_ahead, 1) / max(parallel, 1)
+        return int(min(max(seconds, AdmissionConfig.MIN_RETRY_SECONDS), AdmissionConfig.MAX_RETRY_SECONDS))
+
+    def check(self, user_key: Optional[str]) -> AdmissionDecision:
+        queued = self.queue.counts().get(QueueStatus.QUEUED, 0)
+        if queued >= self.max_queued:
+            with self.lock:
+                self.stats["rejected_global"] += 1
+            return AdmissionDecision(
+                admitted=False,
+                reason=f"Server is busy ({queued} documents waiting). Please retry later.",
+                retry_after=self._retry_after(queued - self.max_queued + 1, self.pool.size),
+                limit=self.max_queued
+            )
+
+        if user_key:
+            user_queued = self.queue.counts_for(user_key).get(QueueStatus.QUEUED, 0)
+            if user_queued >= self.user_max_queued:
+                with self.lock:
+                    self.stats["rejected_user"] += 1
+                running_slots = min(self.pool.user_max_running or self.pool.size, self.pool.size)
+                return AdmissionDecision(
+                    admitted=False,
+                    reason=f"You already have {user_queued} documents waiting "
+                           f"(limit {self.user_max_queued}). Please retry when one has started.",
+                    retry_after=self._retry_after(user_queued - self.user_max_queued + 1, running_slots),
+                    limit=self.user_max_queued
+                )
+
+        with self.lock:
+            self.stats["admitted"] += 1
+        return AdmissionDecision(admitted=True)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            stats = dict(self.stats)
+        return {
+            **stats,
+            "max_queued": self.max_queued,
+            "user_max_queued": self.user_max_queued,
+            "user_max_running": self.pool.user_max_running,
+            "workers": self.pool.size,
+            "job_memory_mb": AdmissionConfig.JOB_MEMORY_MB or None,
+            "peak_rss_mb": _peak_rss_mb(),
+        }
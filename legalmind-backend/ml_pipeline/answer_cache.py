@@ -0,0 +1,158 @@
+"""
+answer_cache.py
+===============
+Per-document semantic answer cache for document chat
+A first-turn question whose embedding is close enough to one already answered
+for the same document (and the same analysis version) gets the stored answer
+instead of retrieval plus a full LLM generation.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class AnswerCacheConfig:
+    """Semantic answer cache settings (from .env)"""
+
+    SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))  # Cosine
+    MAX_ENTRIES_PER_DOCUMENT = int(os.getenv("ANSWER_CACHE_PER_DOCUMENT", "64"))
+    MAX_DOCUMENTS = int(os.getenv("ANSWER_CACHE_MAX_DOCUMENTS", "256"))
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+@dataclass
+class _Answer:
+    query: str
+    vector: List[float]   # Unit length
+    answer: str
+    created_at: float
+    hits: int = 0
+
+
+@dataclass
+class _DocumentAnswers:
+    version: Optional[str]
+    user_id: Optional[str]
+    answers: List[_Answer] = field(default_factory=list)
+
+
+class SemanticAnswerCache:
+    """Thread-safe cache of answers keyed by document and query embedding"""
+
+    def __init__(
+        self,
+        threshold: float = AnswerCacheConfig.SIMILARITY_THRESHOLD,
+        max_entries_per_document: int = AnswerCacheConfig.MAX_ENTRIES_PER_DOCUMENT,
+        max_documents: int = AnswerCacheConfig.MAX_DOCUMENTS
+    ):
+        self.threshold = threshold
+        self.max_entries_per_document = max_entries_per_document
+        self.max_documents = max_documents
+        self.documents: "OrderedDict[str, _DocumentAnswers]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    def _current(self, document_id: str, version: Optional[str]) -> Optional[_DocumentAnswers]:
+        entry = self.documents.get(document_id)
+        if entry is not None and entry.version != version:
+            # Analysis changed: every stored answer may be stale
+            del self.documents[document_id]
+            self.stats["invalidations"] += 1
+            return None
+        return entry
+
+    def lookup(self, document_id: str, version: Optional[str], vector: List[float]) -> Optional[str]:
+        """Stored answer for the most similar cached query, if within the threshold"""
+        vector = _normalize(vector)
+        with self.lock:
+            entry = self._current(document_id, version)
+            best, best_score = None, self.threshold
+            for answer in entry.answers if entry else ():
+                score = sum(a * b for a, b in zip(answer.vector, vector))
+                if score >= best_score:
+                    best, best_score = answer, score
+
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            best.hits += 1
+            self.stats["hits"] += 1
+            self.documents.move_to_end(document_id)
+            return best.answer
+
+    def store(self, document_id: str, version: Optional[str], query: str, vector: List[float],
+              answer: str, user_id: Optional[str] = None):
+        with self.lock:
+            entry = self._current(document_id, version)
+            if entry is None:
+                entry = self.documents[document_id] = _DocumentAnswers(version=version, user_id=user_id)
+            entry.answers.append(_Answer(query=query, vector=_normalize(vector), answer=answer, created_at=time.time()))
+            if len(entry.answers) > self.max_entries_per_document:
+                # Keep the most reused answers
+                entry.answers.sort(key=lambda a: (a.hits, a.created_at), reverse=True)
+                del entry.answers[self.max_entries_per_document:]
+            self.documents.move_to_end(document_id)
+            while len(self.documents) > self.max_documents:
+                self.documents.popitem(last=False)
+            self.stats["stores"] += 1
+
+    def invalidate(self, document_id: str):
+        """Drop a document's answers (e.g. document re-analysed or deleted)"""
+        with self.lock:
+            if self.documents.pop(document_id, None) is not None:
+                self.stats["invalidations"] += 1
+
+    def invalidate_user(self, user_id: str):
+        with self.lock:
+            for document_id in [d for d, e in self.documents.items() if e.user_id == user_id]:
+                del self.documents[document_id]
+                self.stats["invalidations"] += 1
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "documents": len(self.documents),
+                "answers": sum(len(e.answers) for e in self.documents.values()),
+            }
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_singleton_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Get or create the semantic answer cache"""
+    global _answer_cache
+    if _answer_cache is None:
+        with _singleton_lock:
+            if _answer_cache is None:
+                _answer_cache = SemanticAnswerCache()
+    return _answer_cache
@@ -4,9 +4,9 @@ Powered by LangChain and OpenRouter
 """
 
 import os
+import threading
 from typing import Optional, List, Dict
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import (
     HumanMessage,
     SystemMessage,
@@ -15,6 +15,10 @@ from langchain_core.messages import (
 )
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
+from ml_pipeline.conversation_memory import ConversationContext, get_conversation_memory
+from ml_pipeline.llm_client import LLMUnavailableError
+from ml_pipeline.llm_router import LLMRouter, RouterConfig
+
 load_dotenv()
 
 
@@ -52,26 +56,43 @@ When discussing risks:
 
 Remember: You're here to empower users with information, not to replace legal professionals."""
 
+    # Also pre-embedded at startup so clicking a suggestion skips the embedding call
+    SUGGESTED_QUESTIONS = [
+        "What are the key risks in this contract?",
+        "Explain the liability clause",
+        "Is the termination clause fair?",
+        "What should I negotiate?",
+        "What are my obligations under this contract?",
+        "Are there any hidden fees or charges?",
+        "What happens if I want to cancel?",
+        "Is this contract favorable to both parties?",
+    ]
+
+    BUSY_REPLY = "I'm handling a lot of requests right now. Please try again in a moment."
+    ERROR_REPLY = "I apologize, but I encountered an error. Please try again."
+
     def __init__(self):
         """Initialize the LegalMind Chatbot with OpenRouter API"""
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.api_base = os.getenv("OPENAI_API_BASE")
-        self.model = os.getenv("LLM_MODEL", "xiaomi/mimo-v2-flash:free")
+        self.routes = RouterConfig.ROUTES
         
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY not set in environment variables")
         if not self.api_base:
             raise ValueError("OPENAI_API_BASE not set in environment variables")
         
-        # Initialize ChatOpenAI with OpenRouter
-        self.chat_model = ChatOpenAI(
-            model=self.model,
-            openai_api_key=self.api_key,
-            openai_api_base=self.api_base,
+        # Initialize ChatOpenAI with OpenRouter (rate limited, retried, hedged)
+        self.chat_model = LLMRouter(
+            routes=self.routes,
+            api_key=self.api_key,
+            api_base=self.api_base,
             temperature=0.7,
             max_tokens=500,
         )
         
+        self.model = self.chat_model.model
+        
         print(f"✅ LegalMind Chatbot initialized with model: {self.model}")
 
     def get_system_message(self, document_context: Optional[str] = None) -> SystemMessage:
@@ -89,6 +110,7 @@ Remember: You're here to empower users with information, not to replace legal pr
         chat_history: Optional[List[Dict[str, str]]] = None,
         document_context: Optional[str] = None,
         document_name: Optional[str] = None,
+        conversation_owner: Optional[str] = None,
     ) -> str:
         """
         Send a message to the chatbot and get a response
@@ -98,36 +120,76 @@ Remember: You're here to empower users with information, not to replace legal pr
             chat_history: Previous chat messages (list of {"role": "user"/"assistant", "content": "..."})
             document_context: Optional context about the current document
             document_name: Optional name of the current document
+            conversation_owner: User id or client session id (keys the cached history summary)
             
         Returns:
             The assistant's response
         """
         try:
-            # Build message history
-            messages: List[BaseMessage] = []
-            
-            # Add system message
-            messages.append(self.get_system_message(document_context))
-            
-            # Add previous chat history
-            if chat_history:
-                for msg in chat_history:
-                    if msg["role"] == "user":
-                        messages.append(HumanMessage(content=msg["content"]))
-                    elif msg["role"] == "assistant":
-                        messages.append(AIMessage(content=msg["content"]))
-            
-            # Add current user message
-            messages.append(HumanMessage(content=user_message))
+            # Older turns are folded into a running summary to bound the prompt
+            conversation = get_conversation_memory().prepare(
+                chat_history, scope=self._memory_scope(document_name), owner=conversation_owner
+            )
+            messages = self._build_messages(user_message, conversation, document_context)
             
             # Get response from model
             response = self.chat_model.invoke(messages)
             
             return response.content
             
+        except LLMUnavailableError as e:
+            print(f"Chatbot LLM unavailable: {e}")
+            return self.BUSY_REPLY
         except Exception as e:
             print(f"Error in chatbot: {e}")
-            return "I apologize, but I encountered an error. Please try again."
+            return self.ERROR_REPLY
+
+    async def achat(
+        self,
+        user_message: str,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        document_context: Optional[str] = None,
+        document_name: Optional[str] = None,
+        conversation_owner: Optional[str] = None,
+    ) -> str:
+        """Async version of chat() (non-blocking LLM call)"""
+        try:
+            conversation = await get_conversation_memory().aprepare(
+                chat_history, scope=self._memory_scope(document_name), owner=conversation_owner
+            )
+            messages = self._build_messages(user_message, conversation, document_context)
+            response = await self.chat_model.ainvoke(messages)
+            return response.content
+            
+        except LLMUnavailableError as e:
+            print(f"Chatbot LLM unavailable: {e}")
+            return self.BUSY_REPLY
+        except Exception as e:
+            print(f"Error in chatbot: {e}")
+            return self.ERROR_REPLY
+
+    @staticmethod
+    def _memory_scope(document_name: Optional[str]) -> str:
+        return f"assistant:{document_name or ''}"
+
+    def _build_messages(
+        self,
+        user_message: str,
+        conversation: ConversationContext,
+        document_context: Optional[str],
+    ) -> List[BaseMessage]:
+        """System prompt, conversation summary, recent turns and the new user message"""
+        messages: List[BaseMessage] = []
+        
+        # Add system message
+        messages.append(self.get_system_message(document_context))
+        
+        # Add earlier-conversation summary and recent turns
+        messages.extend(conversation.messages())
+        
+        # Add current user message
+        messages.append(HumanMessage(content=user_message))
+        return messages
 
     def get_app_guidance(self, topic: str) -> str:
         """Get guidance on using specific LegalMind features"""
@@ -150,28 +212,21 @@ Remember: You're here to empower users with information, not to replace legal pr
 
     def suggest_questions(self, document_name: str) -> List[str]:
         """Suggest questions the user might ask about a document"""
-        suggestions = [
-            "What are the key risks in this contract?",
-            "Explain the liability clause",
-            "Is the termination clause fair?",
-            "What should I negotiate?",
-            "What are my obligations under this contract?",
-            "Are there any hidden fees or charges?",
-            "What happens if I want to cancel?",
-            "Is this contract favorable to both parties?",
-        ]
-        return suggestions
+        return list(self.SUGGESTED_QUESTIONS)
 
 
 # Initialize global chatbot instance
 _chatbot_instance: Optional[LegalMindChatbot] = None
+_chatbot_lock = threading.Lock()
 
 
 def get_chatbot() -> LegalMindChatbot:
     """Get or create the chatbot instance (singleton)"""
     global _chatbot_instance
     if _chatbot_instance is None:
-        _chatbot_instance = LegalMindChatbot()
+        with _chatbot_lock:
+            if _chatbot_instance is None:
+                _chatbot_instance = LegalMindChatbot()
     return _chatbot_instance
 
 
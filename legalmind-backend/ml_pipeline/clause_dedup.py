@@ -0,0 +1,267 @@
+"""
+clause_dedup.py
+===============
+Near-duplicate risky clause collapsing (between risk detection and advisory)
+Adjacent chunks overlap, so one risky clause is often flagged twice. Groups are
+found by offset overlap and MinHash similarity; only one representative per
+group is sent to the LLM and its advisory is attached to every member.
+Direct neighbours are grouped in pairs when the span they share holds the
+risky content (the risk detector classifies that span and marks the later
+chunk); adjacency alone never groups, so a run of risky chunks cannot chain
+into one clause.
+"""
+
+import hashlib
+import random
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class DedupConfig:
+    """Near-duplicate detection settings"""
+
+    SHINGLE_SIZE = 5           # Words per shingle
+    NUM_PERMUTATIONS = 64      # MinHash signature length
+    LSH_BANDS = 16             # NUM_PERMUTATIONS must be divisible by this
+    JACCARD_THRESHOLD = 0.8    # Estimated similarity to count as duplicate
+    MIN_OVERLAP_CHARS = 100    # Shared characters for overlapping chunks
+    MAX_GROUP_SIZE = 4         # Chunks per group
+    MAX_MERGED_CHARS = 3000    # Longest stitched representative text
+    SEED = 1337
+
+    _PRIME = (1 << 61) - 1
+
+
+# ============================================================================
+# MINHASH
+# ============================================================================
+
+def _shingles(text: str, size: int = DedupConfig.SHINGLE_SIZE) -> set:
+    """Hashed word shingles of normalised text"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        words_list = [" ".join(words)] if words else []
+    else:
+        words_list = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return {
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+        for s in words_list
+    }
+
+
+class MinHasher:
+    """MinHash signatures with LSH banding for candidate pairs"""
+
+    def __init__(self, num_perm: int = DedupConfig.NUM_PERMUTATIONS, seed: int = DedupConfig.SEED):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.params = [
+            (rng.randrange(1, DedupConfig._PRIME), rng.randrange(0, DedupConfig._PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, shingles: set) -> List[int]:
+        if not shingles:
+            return [DedupConfig._PRIME] * self.num_perm
+        return [
+            min((a * s + b) % DedupConfig._PRIME for s in shingles)
+            for a, b in self.params
+        ]
+
+    @staticmethod
+    def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+        """Estimated Jaccard similarity"""
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+    def candidate_pairs(self, signatures: List[List[int]], bands: int = DedupConfig.LSH_BANDS):
+        """Index pairs that share at least one LSH band"""
+        rows = self.num_perm // bands
+        pairs = set()
+        for band in range(bands):
+            buckets = defaultdict(list)
+            for idx, sig in enumerate(signatures):
+                buckets[tuple(sig[band * rows:(band + 1) * rows])].append(idx)
+            for members in buckets.values():
+                for i in range(len(members)):
+                    for j in range(i + 1, len(members)):
+                        pairs.add((members[i], members[j]))
+        return pairs
+
+
+# ============================================================================
+# GROUPING
+# ============================================================================
+
+@dataclass
+class ClauseGroup:
+    """Risky chunks that describe the same clause"""
+
+    representative: Dict
+    members: List[Dict] = field(default_factory=list)
+
+    @property
+    def chunk_ids(self) -> List:
+        return [member.get('chunk_id') for member in self.members]
+
+
+def _label(chunk: Dict) -> str:
+    return chunk.get('prediction', {}).get('label', '')
+
+
+def _confidence(chunk: Dict) -> float:
+    return chunk.get('prediction', {}).get('confidence', 0.0)
+
+
+def overlap_text(a: Dict, b: Dict) -> Optional[str]:
+    """Text of [max(start), min(end)) shared by two neighbouring chunks (needs offsets)"""
+    if a.get('start_index') is None or b.get('start_index') is None:
+        return None
+    first, second = sorted((a, b), key=lambda c: c['start_index'])
+    start = second['start_index']
+    end = min(first['start_index'] + len(first.get('text', '')), start + len(second.get('text', '')))
+    if end - start < DedupConfig.MIN_OVERLAP_CHARS:
+        return None
+    return first['text'][start - first['start_index']:end - first['start_index']]
+
+
+def _neighbours(chunks: List[Dict]) -> List[Tuple[Dict, Dict]]:
+    """(previous, next) pairs of chunks whose ids are consecutive"""
+    ordered = sorted(chunks, key=lambda c: c.get('chunk_id', 0))
+    return [(a, b) for a, b in zip(ordered, ordered[1:])
+            if a.get('chunk_id') is not None and b.get('chunk_id') == a['chunk_id'] + 1]
+
+
+def mark_shared_overlaps(risky_chunks: List[Dict], classify: Callable[[List[str]], List[Dict]],
+                         threshold: float):
+    """
+    Classify the span shared by each pair of risky neighbours with the same label
+    and, when the span alone carries that label, mark the later chunk
+    (prediction['overlap_label']): the clause was flagged twice because it
+    sits in the overlap.
+    """
+    pairs = []
+    for a, b in _neighbours(risky_chunks):
+        if _label(a) != _label(b):
+            continue
+        text = overlap_text(a, b)
+        if text and text.strip():
+            pairs.append((b, text))
+    if not pairs:
+        return
+    for (later, _), result in zip(pairs, classify([text for _, text in pairs])):
+        if result['label'] == _label(later) and result['confidence'] >= threshold:
+            later['prediction']['overlap_label'] = result['label']
+
+
+def _merged_text(members: List[Dict]) -> Optional[str]:
+    """Stitch overlapping members back into one span (needs offsets; None if too long)"""
+    if any(m.get('start_index') is None for m in members):
+        return None
+    ordered = sorted(members, key=lambda m: m['start_index'])
+    text = ordered[0].get('text', '')
+    end = ordered[0]['start_index'] + len(text)
+    for member in ordered[1:]:
+        member_text = member.get('text', '')
+        if member['start_index'] > end:
+            return None  # Not contiguous
+        text += member_text[end - member['start_index']:]
+        end = max(end, member['start_index'] + len(member_text))
+        if len(text) > DedupConfig.MAX_MERGED_CHARS:
+            return None
+    return text
+
+
+def collapse_near_duplicates(risky_chunks: List[Dict]) -> List[ClauseGroup]:
+    """Group near-duplicate risky chunks; groups keep the input order"""
+    n = len(risky_chunks)
+    if n == 0:
+        return []
+
+    parent = list(range(n))
+    size = [1] * n
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int):
+        root_i, root_j = find(i), find(j)
+        if root_i == root_j or size[root_i] + size[root_j] > DedupConfig.MAX_GROUP_SIZE:
+            return
+        parent[root_j] = root_i
+        size[root_i] += size[root_j]
+
+    hasher = MinHasher()
+    signatures = [hasher.signature(_shingles(chunk.get('text', ''))) for chunk in risky_chunks]
+
+    def similar(i: int, j: int) -> bool:
+        return hasher.similarity(signatures[i], signatures[j]) >= DedupConfig.JACCARD_THRESHOLD
+
+    # Direct neighbours whose shared span holds the risky clause, in pairs
+    # (a chunk joins at most one neighbour, so runs of risky chunks never chain)
+    index_of = {id(chunk): i for i, chunk in enumerate(risky_chunks)}
+    paired = set()
+    for a, b in _neighbours(risky_chunks):
+        i, j = index_of[id(a)], index_of[id(b)]
+        if i in paired or j in paired or _label(a) != _label(b):
+            continue
+        if b.get('prediction', {}).get('overlap_label') == _label(b) or similar(i, j):
+            union(i, j)
+            paired.update((i, j))
+
+    # Repeated clauses anywhere in the document (MinHash + LSH)
+    for i, j in sorted(hasher.candidate_pairs(signatures)):
+        if _label(risky_chunks[i]) == _label(risky_chunks[j]) and similar(i, j):
+            union(i, j)
+
+    members_by_root = defaultdict(list)
+    for i in range(n):
+        members_by_root[find(i)].append(risky_chunks[i])
+
+    groups = []
+    seen = set()
+    for i in range(n):
+        root = find(i)
+        if root in seen:
+            continue
+        seen.add(root)
+        members = members_by_root[root]
+        best = max(members, key=_confidence)
+        representative = dict(best)
+        if len(members) > 1:
+            merged = _merged_text(members)
+            if merged:
+                representative['text'] = merged
+        groups.append(ClauseGroup(representative=representative, members=members))
+
+    collapsed = n - len(groups)
+    if collapsed:
+        print(f"✓ Collapsed {collapsed} near-duplicate risky chunk(s) into {len(groups)} clause group(s)")
+    return groups
+
+
+def attach_advisories(groups: List[ClauseGroup], advisories: List[Dict]) -> List[Dict]:
+    """
+    Attach each group's advisory to all of its member chunks (in place)
+
+    Returns the advisories annotated with the chunk ids they cover.
+    """
+    for group, advisory in zip(groups, advisories):
+        rep_id = group.representative.get('chunk_id')
+        duplicates = [cid for cid in group.chunk_ids if cid != rep_id]
+        advisory['duplicate_chunk_ids'] = duplicates
+
+        for member in group.members:
+            if 'llm_analysis' in advisory:
+                member['llm_analysis'] = advisory['llm_analysis']
+            if member.get('chunk_id') != rep_id:
+                member['duplicate_of'] = rep_id
+    return advisories
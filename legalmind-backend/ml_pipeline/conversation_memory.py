@@ -0,0 +1,278 @@
+"""
+conversation_memory.py
+======================
+Bounded conversation memory for document chat and the assistant
+The most recent turns are kept verbatim; older turns are folded into a running
+summary that is updated incrementally and cached per conversation, and the
+whole history is held under a hard token ceiling. A conversation belongs to an
+owner (user id or client session id); without one its summary is not cached.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from ml_pipeline.llm_router import LLMRouter
+from ml_pipeline.prompt_budget import get_token_counter
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class MemoryConfig:
+    """Conversation memory settings (from .env)"""
+
+    # Messages (not turns) always kept verbatim
+    RECENT_MESSAGES = int(os.getenv("CHAT_RECENT_MESSAGES", "6"))
+
+    # Older messages are folded into the summary in batches of at least this size
+    FOLD_BATCH = int(os.getenv("CHAT_FOLD_BATCH", "4"))
+
+    # Hard ceiling for summary + verbatim history
+    HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "1200"))
+    SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+
+    # Per-message cap when feeding turns to the summarizer
+    FOLD_MESSAGE_TOKENS = 400
+
+    MAX_SESSIONS = int(os.getenv("CHAT_MEMORY_MAX_SESSIONS", "2048"))
+
+    SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+
+SUMMARIZER_PROMPT = """You maintain a running summary of a conversation between a user and a legal contract assistant.
+Update the summary with the new messages. Keep the user's goals, the clauses and risks discussed,
+figures and dates mentioned, and any conclusions or advice given. Drop greetings and repetition.
+Write at most {max_words} words of plain prose."""
+
+
+# ============================================================================
+# MESSAGES
+# ============================================================================
+
+def to_message(message) -> Optional[BaseMessage]:
+    """LangChain message from a message or a {role, content} dict"""
+    if isinstance(message, BaseMessage):
+        return message
+    if isinstance(message, dict):
+        role, content = message.get("role"), message.get("content")
+        if content is None:
+            return None
+        if role == "user":
+            return HumanMessage(content=content)
+        if role == "assistant":
+            return AIMessage(content=content)
+    return None
+
+
+def _role(message: BaseMessage) -> str:
+    if isinstance(message, HumanMessage):
+        return "User"
+    return "Context" if isinstance(message, SystemMessage) else "Assistant"
+
+
+def _digest(messages: List[BaseMessage]) -> str:
+    h = hashlib.sha1()
+    for message in messages:
+        h.update(_role(message).encode())
+        h.update(b"\x00")
+        h.update(str(message.content).encode("utf-8"))
+        h.update(b"\x01")
+    return h.hexdigest()
+
+
+@dataclass
+class ConversationContext:
+    """History to send: an optional summary plus recent verbatim messages"""
+
+    summary: Optional[str]
+    recent: List[BaseMessage]
+
+    def summary_message(self) -> Optional[SystemMessage]:
+        if not self.summary:
+            return None
+        return SystemMessage(content=f"{MemoryConfig.SUMMARY_PREFIX}\n{self.summary}")
+
+    def messages(self) -> List[BaseMessage]:
+        head = self.summary_message()
+        return ([head] if head else []) + list(self.recent)
+
+
+@dataclass
+class _Session:
+    folded_count: int
+    folded_digest: str
+    summary: str
+
+
+@dataclass
+class _Plan:
+    key: Optional[str]
+    older: List[BaseMessage]
+    recent: List[BaseMessage]
+    summary: Optional[str]
+    pending: List[BaseMessage]
+    fold: bool
+
+
+# ============================================================================
+# MEMORY
+# ============================================================================
+
+class ConversationMemory:
+    """Turn client-sent chat history into a bounded ConversationContext"""
+
+    def __init__(
+        self,
+        recent_messages: int = MemoryConfig.RECENT_MESSAGES,
+        fold_batch: int = MemoryConfig.FOLD_BATCH,
+        max_tokens: int = MemoryConfig.HISTORY_MAX_TOKENS,
+        summary_tokens: int = MemoryConfig.SUMMARY_MAX_TOKENS,
+        max_sessions: int = MemoryConfig.MAX_SESSIONS
+    ):
+        self.recent_messages = recent_messages
+        self.fold_batch = fold_batch
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.counter = get_token_counter()
+        self.stats = {"folds": 0, "fold_failures": 0, "summary_reuses": 0, "trimmed_messages": 0}
+        self._summarizer: Optional[LLMRouter] = None
+
+    @property
+    def summarizer(self) -> LLMRouter:
+        if self._summarizer is None:
+            self._summarizer = LLMRouter(temperature=0.2, max_tokens=self.summary_tokens)
+        return self._summarizer
+
+    def _plan(self, chat_history: Optional[List], scope: str, owner: Optional[str]) -> _Plan:
+        messages = [m for m in (to_message(raw) for raw in chat_history or []) if m is not None]
+        if len(messages) <= self.recent_messages:
+            return _Plan(None, [], messages, None, [], False)
+
+        older = messages[:-self.recent_messages]
+        recent = messages[-self.recent_messages:]
+        # A conversation is identified by its owner, scope and first message
+        # (without an owner, two callers' conversations could share a key)
+        key = f"{owner}:{scope}:{_digest(messages[:1])}" if owner else None
+
+        summary, folded = None, 0
+        with self.lock:
+            session = self.sessions.get(key) if key else None
+            if session:
+                self.sessions.move_to_end(key)
+        if session and session.folded_count <= len(older) and \
+                _digest(older[:session.folded_count]) == session.folded_digest:
+            summary, folded = session.summary, session.folded_count
+            with self.lock:
+                self.stats["summary_reuses"] += 1
+
+        pending = older[folded:]
+        return _Plan(key, older, recent, summary, pending, fold=len(pending) >= self.fold_batch)
+
+    def _fold_messages(self, plan: _Plan) -> List[BaseMessage]:
+        max_words = max(int(self.summary_tokens * 0.7), 50)
+        transcript = "\n".join(
+            f"{_role(m)}: {self.counter.truncate(str(m.content), MemoryConfig.FOLD_MESSAGE_TOKENS)}"
+            for m in plan.pending
+        )
+        return [
+            SystemMessage(content=SUMMARIZER_PROMPT.format(max_words=max_words)),
+            HumanMessage(content=f"Current summary:\n{plan.summary or '(none)'}\n\nNew messages:\n{transcript}"),
+        ]
+
+    def _finish(self, plan: _Plan, new_summary: Optional[str]) -> ConversationContext:
+        if new_summary:
+            summary = self.counter.truncate(new_summary.strip(), self.summary_tokens)
+            recent = list(plan.recent)
+            with self.lock:
+                if plan.key:
+                    self.sessions[plan.key] = _Session(len(plan.older), _digest(plan.older), summary)
+                    self.sessions.move_to_end(plan.key)
+                    while len(self.sessions) > self.max_sessions:
+                        self.sessions.popitem(last=False)
+                self.stats["folds"] += 1
+        else:
+            # Not enough new turns to fold yet (or folding failed): keep them verbatim
+            summary = plan.summary
+            recent = plan.pending + plan.recent
+        return self._enforce_ceiling(ConversationContext(summary, recent))
+
+    def _enforce_ceiling(self, context: ConversationContext) -> ConversationContext:
+        """Drop the oldest verbatim messages, then trim the summary, until under the ceiling"""
+        recent = list(context.recent)
+        costs = [self.counter.count(str(m.content)) for m in recent]
+        summary = context.summary
+        summary_cost = self.counter.count(summary) if summary else 0
+
+        dropped = 0
+        while recent and summary_cost + sum(costs) > self.max_tokens:
+            recent.pop(0)
+            costs.pop(0)
+            dropped += 1
+        if dropped:
+            with self.lock:
+                self.stats["trimmed_messages"] += dropped
+        if summary and summary_cost > self.max_tokens:
+            summary = self.counter.truncate(summary, self.max_tokens)
+        return ConversationContext(summary, recent)
+
+    def prepare(self, chat_history: Optional[List], scope: str, owner: Optional[str] = None) -> ConversationContext:
+        """Bounded history for a new turn (may make one small summarization call)"""
+        plan = self._plan(chat_history, scope, owner)
+        new_summary = None
+        if plan.fold:
+            try:
+                new_summary = self.summarizer.invoke(self._fold_messages(plan)).content
+            except Exception as e:
+                with self.lock:
+                    self.stats["fold_failures"] += 1
+                print(f"⚠️  Could not summarize conversation: {e}")
+        return self._finish(plan, new_summary)
+
+    async def aprepare(self, chat_history: Optional[List], scope: str,
+                       owner: Optional[str] = None) -> ConversationContext:
+        """Async prepare()"""
+        plan = self._plan(chat_history, scope, owner)
+        new_summary = None
+        if plan.fold:
+            try:
+                new_summary = (await self.summarizer.ainvoke(self._fold_messages(plan))).content
+            except Exception as e:
+                with self.lock:
+                    self.stats["fold_failures"] += 1
+                print(f"⚠️  Could not summarize conversation: {e}")
+        return self._finish(plan, new_summary)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {**self.stats, "sessions": len(self.sessions)}
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_conversation_memory: Optional[ConversationMemory] = None
+_singleton_lock = threading.Lock()
+
+
+def get_conversation_memory() -> ConversationMemory:
+    """Get or create the shared conversation memory"""
+    global _conversation_memory
+    if _conversation_memory is None:
+        with _singleton_lock:
+            if _conversation_memory is None:
+                _conversation_memory = ConversationMemory()
+    return _conversation_memory
@@ -0,0 +1,172 @@
+"""
+embedding_cache.py
+==================
+Shared query-embedding cache for chat retrieval
+Keyed on normalised query text and embedding model, bounded LRU with hit-rate stats
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEndpointEmbeddings
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class EmbeddingCacheConfig:
+    """Query embedding cache settings (from .env)"""
+
+    EMBEDDING_MODEL = "google/embeddinggemma-300m"
+    HF_TOKEN = os.getenv("HF_TOKEN") or os.getenv("HUGGINGFACE_API_TOKEN")
+    MAX_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+
+
+def normalize_query(text: str) -> str:
+    """Collapse whitespace and case so trivially different queries share an entry"""
+    return " ".join(text.split()).casefold()
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+class QueryEmbeddingCache:
+    """Thread-safe LRU of query vectors"""
+
+    def __init__(self, max_entries: int = EmbeddingCacheConfig.MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = (model, text)
+        with self.lock:
+            vector = self.entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def contains(self, model: str, text: str) -> bool:
+        with self.lock:
+            return (model, text) in self.entries
+
+    def put(self, model: str, text: str, vector: List[float]):
+        with self.lock:
+            self.entries[(model, text)] = vector
+            self.entries.move_to_end((model, text))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper that serves embed_query from the shared cache"""
+
+    def __init__(self, base: Embeddings, model_name: str, cache: QueryEmbeddingCache):
+        self.base = base
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        normalized = normalize_query(text)
+        vector = self.cache.get(self.model_name, normalized)
+        if vector is None:
+            vector = self.base.embed_query(normalized)
+            self.cache.put(self.model_name, normalized, vector)
+        return vector
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.base.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        normalized = normalize_query(text)
+        vector = self.cache.get(self.model_name, normalized)
+        if vector is None:
+            vector = await self.base.aembed_query(normalized)
+            self.cache.put(self.model_name, normalized, vector)
+        return vector
+
+    def prewarm(self, queries: Iterable[str]) -> int:
+        """Embed queries ahead of time (one batched call); return how many were added"""
+        pending = []
+        for query in queries:
+            normalized = normalize_query(query)
+            if normalized and normalized not in pending and \
+                    not self.cache.contains(self.model_name, normalized):
+                pending.append(normalized)
+        if not pending:
+            return 0
+        vectors = self.base.embed_documents(pending)
+        for normalized, vector in zip(pending, vectors):
+            self.cache.put(self.model_name, normalized, vector)
+        return len(pending)
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_query_embeddings: Optional[CachedQueryEmbeddings] = None
+_embedding_models: Dict[Tuple[str, str], HuggingFaceEndpointEmbeddings] = {}
+_singleton_lock = threading.Lock()
+
+
+def get_embedding_model(
+    model: str = EmbeddingCacheConfig.EMBEDDING_MODEL,
+    task: str = "feature-extraction"
+) -> HuggingFaceEndpointEmbeddings:
+    """Get or create the shared embedding endpoint client (used by ingestion and chat)"""
+    key = (model, task)
+    embeddings = _embedding_models.get(key)
+    if embeddings is None:
+        with _singleton_lock:
+            embeddings = _embedding_models.get(key)
+            if embeddings is None:
+                embeddings = HuggingFaceEndpointEmbeddings(
+                    repo_id=model,
+                    task=task,
+                    huggingfacehub_api_token=EmbeddingCacheConfig.HF_TOKEN
+                )
+                _embedding_models[key] = embeddings
+    return embeddings
+
+
+def get_query_embeddings() -> CachedQueryEmbeddings:
+    """Get or create the shared, cached query embedding model"""
+    global _query_embeddings
+    if _query_embeddings is None:
+        base = get_embedding_model()
+        with _singleton_lock:
+            if _query_embeddings is None:
+                _query_embeddings = CachedQueryEmbeddings(
+                    base,
+                    EmbeddingCacheConfig.EMBEDDING_MODEL,
+                    QueryEmbeddingCache()
+                )
+    return _query_embeddings
@@ -0,0 +1,160 @@
+"""
+job_events.py
+=============
+Push channel for job progress
+The pipeline publishes an event whenever job state changes (stage, overall
+progress, and per-page / per-chunk detail); SSE subscribers on the same
+process receive it immediately. Subscribers for jobs running in another
+worker process fall back to re-reading the shared job store.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# progress(done, total) reported by a pipeline stage
+ProgressCallback = Callable[[int, int], None]
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class JobEventsConfig:
+    """Job progress push settings (from .env)"""
+
+    # Minimum gap between detail (per-page / per-chunk) updates for one job
+    DETAIL_INTERVAL_SECONDS = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.5"))
+
+    # SSE: re-read the job store this often when no event arrives
+    # (covers jobs running in another worker process)
+    STORE_POLL_SECONDS = 1.0
+
+    # SSE keep-alive comment for proxies that close idle connections
+    KEEPALIVE_SECONDS = 15.0
+
+    # Events buffered per subscriber; older ones are dropped (state is cumulative)
+    SUBSCRIBER_BUFFER = 64
+
+
+# ============================================================================
+# EVENT BUS
+# ============================================================================
+
+class JobEventBus:
+    """In-process fan-out of job events from worker threads to asyncio subscribers"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self.lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+    def publish(self, job_id: str, event: Dict):
+        """Send an event to every subscriber of a job (callable from any thread)"""
+        with self.lock:
+            targets = list(self.subscribers.get(job_id, ()))
+            self.stats["published"] += 1
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                pass  # Subscriber's loop is closed
+
+    def _offer(self, queue: asyncio.Queue, event: Dict):
+        if queue.full():
+            queue.get_nowait()
+            with self.lock:
+                self.stats["dropped"] += 1
+        queue.put_nowait(event)
+        with self.lock:
+            self.stats["delivered"] += 1
+
+    @asynccontextmanager
+    async def subscribe(self, job_id: str):
+        """async with bus.subscribe(job_id) as queue: ... (await queue.get())"""
+        entry = (asyncio.get_running_loop(), asyncio.Queue(maxsize=JobEventsConfig.SUBSCRIBER_BUFFER))
+        with self.lock:
+            self.subscribers.setdefault(job_id, set()).add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self.lock:
+                subscribers = self.subscribers.get(job_id)
+                if subscribers is not None:
+                    subscribers.discard(entry)
+                    if not subscribers:
+                        del self.subscribers[job_id]
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                **self.stats,
+                "subscribed_jobs": len(self.subscribers),
+                "subscribers": sum(len(s) for s in self.subscribers.values()),
+            }
+
+
+# ============================================================================
+# STAGE PROGRESS
+# ============================================================================
+
+class StageProgress:
+    """
+    Map a stage's done/total onto a slice of the job's overall progress
+
+    Calls report(progress, detail) at most every DETAIL_INTERVAL_SECONDS (the
+    last unit of work is always reported).
+    """
+
+    def __init__(self, report: Callable[[int, Dict], None], start: int, end: int, unit: str,
+                 interval: float = JobEventsConfig.DETAIL_INTERVAL_SECONDS):
+        self.report = report
+        self.start = start
+        self.end = end
+        self.unit = unit
+        self.interval = interval
+        self.last_sent = 0.0
+
+    def __call__(self, done: int, total: int):
+        now = time.monotonic()
+        if done < total and now - self.last_sent < self.interval:
+            return
+        self.last_sent = now
+        fraction = done / total if total else 1.0
+        progress = self.start + int((self.end - self.start) * fraction)
+        self.report(progress, {"unit": self.unit, "done": done, "total": total})
+
+
+def report_progress(progress: Optional[ProgressCallback], done: int, total: int):
+    """Call an optional progress callback without letting it break the pipeline"""
+    if progress is None:
+        return
+    try:
+        progress(done, total)
+    except Exception as e:
+        print(f"⚠️  Progress callback failed: {e}")
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_job_events: Optional[JobEventBus] = None
+_singleton_lock = threading.Lock()
+
+
+def get_job_events() -> JobEventBus:
+    """Get or create the job event bus"""
+    global _job_events
+    if _job_events is None:
+        with _singleton_lock:
+            if _job_events is None:
+                _job_events = JobEventBus()
+    return _job_events
@@ -0,0 +1,366 @@
+"""
+job_queue.py
+============
+Durable local job queue (SQLite) with a bounded worker pool
+Uploads are enqueued here instead of running as request background tasks. A
+fixed number of workers lease jobs one at a time, so bursts queue up instead of
+oversubscribing CPU and memory. Leases carry a heartbeat; jobs whose worker
+died (process restart, crash) are handed out again.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class JobQueueConfig:
+    """Job queue settings (from .env)"""
+
+    DB_PATH = os.getenv("JOB_QUEUE_DB", "job_queue.db")
+    WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+    # A lease not renewed for this long is considered abandoned
+    LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+    HEARTBEAT_SECONDS = 20.0
+
+    # Leases lost this many times (worker died mid-job) fail the job
+    MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+    # Idle workers re-check the queue this often (enqueue wakes them at once)
+    POLL_SECONDS = 2.0
+
+    # Finished rows are kept this long for inspection
+    RETAIN_SECONDS = 7 * 24 * 3600
+
+
+class QueueStatus:
+    QUEUED = "queued"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_queue (
+    job_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT,
+    user_key TEXT
+);
+CREATE INDEX IF NOT EXISTS job_queue_status ON job_queue (status, enqueued_at);
+"""
+
+_USER_INDEX = "CREATE INDEX IF NOT EXISTS job_queue_user ON job_queue (user_key, status)"
+
+
+def _owner_alive(owner: str) -> bool:
+    """Whether a lease owner ("host:pid:token") is a live process on this host"""
+    try:
+        host, pid, _ = owner.split(":", 2)
+        if host != socket.gethostname():
+            return True  # Cannot tell; wait for the lease to expire
+        os.kill(int(pid), 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except (ValueError, PermissionError, OSError):
+        return True
+
+
+# ============================================================================
+# QUEUE
+# ============================================================================
+
+class DurableJobQueue:
+    """SQLite-backed FIFO of jobs with leases (safe across threads and processes)"""
+
+    def __init__(self, db_path: str = JobQueueConfig.DB_PATH, lease_seconds: float = JobQueueConfig.LEASE_SECONDS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.local = threading.local()
+        self.wakeup = threading.Condition()
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(job_queue)")}
+            if "user_key" not in columns:  # Queue created before per-user limits
+                conn.execute("ALTER TABLE job_queue ADD COLUMN user_key TEXT")
+            conn.execute(_USER_INDEX)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Per-thread connection (autocommit; transactions are explicit)"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def enqueue(self, job_id: str, payload: Dict, user_key: Optional[str] = None):
+        """Add a job; user_key groups jobs for per-user limits"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO job_queue (job_id, payload, status, enqueued_at, user_key) VALUES (?, ?, ?, ?, ?)",
+                (job_id, json.dumps(payload), QueueStatus.QUEUED, time.time(), user_key)
+            )
+        with self.wakeup:
+            self.wakeup.notify()
+
+    def lease(self, owner: str, user_max_running: Optional[int] = None) -> Optional[Tuple[str, Dict, int]]:
+        """
+        Take the oldest runnable job: (job_id, payload, attempt) or None
+
+        With user_max_running, jobs of a user who already has that many leased
+        are skipped, so one user's backlog cannot occupy every worker.
+        """
+        conn = self._connect()
+        now = time.time()
+        user_clause, params = "", [QueueStatus.QUEUED, QueueStatus.LEASED, now]
+        if user_max_running:
+            user_clause = (
+                "AND (q.user_key IS NULL OR (SELECT COUNT(*) FROM job_queue r "
+                "WHERE r.user_key = q.user_key AND r.status = ? AND r.lease_expires_at >= ?) < ?) "
+            )
+            params += [QueueStatus.LEASED, now, user_max_running]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT job_id, payload, attempts FROM job_queue q "
+                "WHERE (status = ? OR (status = ? AND lease_expires_at < ?)) "
+                + user_clause +
+                "ORDER BY enqueued_at LIMIT 1",
+                params
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE job_queue SET status = ?, attempts = attempts + 1, lease_owner = ?, "
+                "lease_expires_at = ?, started_at = ? WHERE job_id = ?",
+                (QueueStatus.LEASED, owner, now + self.lease_seconds, now, row["job_id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row["job_id"], json.loads(row["payload"]), row["attempts"] + 1
+
+    def heartbeat(self, job_id: str, owner: str) -> bool:
+        """Extend a lease; False if it was lost to another worker"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE job_queue SET lease_expires_at = ? WHERE job_id = ? AND lease_owner = ? AND status = ?",
+                (time.time() + self.lease_seconds, job_id, owner, QueueStatus.LEASED)
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id: str, owner: str, error: Optional[str] = None):
+        status = QueueStatus.FAILED if error else QueueStatus.DONE
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE job_queue SET status = ?, finished_at = ?, error = ?, lease_expires_at = NULL "
+                "WHERE job_id = ? AND lease_owner = ?",
+                (status, time.time(), error, job_id, owner)
+            )
+        # A slot may have opened for a user held back by the per-user running cap
+        with self.wakeup:
+            self.wakeup.notify()
+
+    def recover(self) -> int:
+        """Requeue jobs leased by workers that no longer exist (call at startup)"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT job_id, lease_owner FROM job_queue WHERE status = ?", (QueueStatus.LEASED,)
+            ).fetchall()
+            dead = [row["job_id"] for row in rows if not _owner_alive(row["lease_owner"] or "")]
+            for job_id in dead:
+                conn.execute(
+                    "UPDATE job_queue SET status = ?, lease_owner = NULL, lease_expires_at = NULL WHERE job_id = ?",
+                    (QueueStatus.QUEUED, job_id)
+                )
+            conn.execute(
+                "DELETE FROM job_queue WHERE status IN (?, ?) AND finished_at < ?",
+                (QueueStatus.DONE, QueueStatus.FAILED, time.time() - JobQueueConfig.RETAIN_SECONDS)
+            )
+        return len(dead)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position of a queued job (None if not waiting)"""
+        row = self._connect().execute(
+            "SELECT enqueued_at FROM job_queue WHERE job_id = ? AND status = ?", (job_id, QueueStatus.QUEUED)
+        ).fetchone()
+        if row is None:
+            return None
+        ahead = self._connect().execute(
+            "SELECT COUNT(*) FROM job_queue WHERE status = ? AND enqueued_at < ?",
+            (QueueStatus.QUEUED, row["enqueued_at"])
+        ).fetchone()[0]
+        return ahead + 1
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM job_queue GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def counts_for(self, user_key: str) -> Dict[str, int]:
+        """Queued/leased job counts of one user"""
+        rows = self._connect().execute(
+            "SELECT status, COUNT(*) FROM job_queue WHERE user_key = ? AND status IN (?, ?) GROUP BY status",
+            (user_key, QueueStatus.QUEUED, QueueStatus.LEASED)
+        ).fetchall()
+        return {status: count for status, count in rows}
+
+    def wait(self, timeout: float):
+        with self.wakeup:
+            self.wakeup.wait(timeout)
+
+
+# ============================================================================
+# WORKER POOL
+# ============================================================================
+
+class WorkerPool:
+    """Fixed number of threads running handler(job_id, payload) for leased jobs"""
+
+    def __init__(
+        self,
+        queue: DurableJobQueue,
+        handler: Callable[[str, Dict], None],
+        size: int = JobQueueConfig.WORKERS,
+        max_attempts: int = JobQueueConfig.MAX_ATTEMPTS,
+        on_abandoned: Optional[Callable[[str, Dict], None]] = None,
+        user_max_running: Optional[int] = None
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.size = max(size, 1)
+        self.max_attempts = max_attempts
+        self.on_abandoned = on_abandoned
+        self.user_max_running = user_max_running
+        self.owner_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self.threads = []
+        self.running: Dict[str, str] = {}  # job_id -> worker owner id
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.stats = {"completed": 0, "failed": 0, "abandoned": 0}
+        self.avg_job_seconds: Optional[float] = None  # Moving average of measured job durations
+
+    def start(self):
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"✓ Requeued {recovered} job(s) interrupted by a restart")
+        for i in range(self.size):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        print(f"✓ Job worker pool started ({self.size} worker(s))")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop taking new jobs (running jobs finish or are recovered on next start)"""
+        self.stopping.set()
+        with self.queue.wakeup:
+            self.queue.wakeup.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _heartbeat(self, job_id: str, owner: str, done: threading.Event):
+        while not done.wait(JobQueueConfig.HEARTBEAT_SECONDS):
+            if not self.queue.heartbeat(job_id, owner):
+                print(f"⚠️  Lease on job {job_id} was lost")
+                return
+
+    def _work(self):
+        owner = f"{self.owner_prefix}:{uuid.uuid4().hex[:8]}"
+        while not self.stopping.is_set():
+            try:
+                leased = self.queue.lease(owner, self.user_max_running)
+            except sqlite3.Error as e:
+                print(f"⚠️  Job queue unavailable: {e}")
+                leased = None
+            if leased is None:
+                self.queue.wait(JobQueueConfig.POLL_SECONDS)
+                continue
+
+            job_id, payload, attempt = leased
+            if attempt > self.max_attempts:
+                # Worker died on this job too often: do not try again
+                self.queue.finish(job_id, owner, error="Job abandoned after repeated worker failures")
+                with self.lock:
+                    self.stats["abandoned"] += 1
+                if self.on_abandoned:
+                    self.on_abandoned(job_id, payload)
+                continue
+
+            done = threading.Event()
+            threading.Thread(target=self._heartbeat, args=(job_id, owner, done), daemon=True).start()
+            with self.lock:
+                self.running[job_id] = owner
+            error = None
+            started = time.monotonic()
+            try:
+                self.handler(job_id, payload)
+            except Exception as e:
+                error = str(e)
+                print(f"❌ Job {job_id} failed in worker: {e}")
+            finally:
+                done.set()
+                elapsed = time.monotonic() - started
+                with self.lock:
+                    self.running.pop(job_id, None)
+                    self.stats["failed" if error else "completed"] += 1
+                    self.avg_job_seconds = elapsed if self.avg_job_seconds is None \
+                        else 0.8 * self.avg_job_seconds + 0.2 * elapsed
+            self.queue.finish(job_id, owner, error=error)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            running = len(self.running)
+            stats = dict(self.stats)
+            avg_seconds = self.avg_job_seconds
+        return {
+            **stats,
+            "workers": self.size,
+            "running": running,
+            "avg_job_seconds": round(avg_seconds, 1) if avg_seconds is not None else None,
+            "queue": self.queue.counts(),
+        }
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_job_queue: Optional[DurableJobQueue] = None
+_singleton_lock = threading.Lock()
+
+
+def get_job_queue() -> DurableJobQueue:
+    """Get or create the durable job queue"""
+    global _job_queue
+    if _job_queue is None:
+        with _singleton_lock:
+            if _job_queue is None:
+                _job_queue = DurableJobQueue()
+    return _job_queue
@@ -0,0 +1,370 @@
+"""
+job_store.py
+============
+Pluggable store for job state and results
+Endpoints read and the pipeline writes job state through a JobStore. The
+in-process store is a dict (single API worker); the SQLite store is a local
+file shared by every worker process on the node, so any uvicorn worker can
+answer for any job. The store also carries cache invalidations between worker
+processes (e.g. a deleted account's cached RAG sessions and answers).
+"""
+
+import abc
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from ml_pipeline.result_store import ResultRetention, ResultRetentionConfig
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class JobStoreConfig:
+    """Job store settings (from .env)"""
+
+    BACKEND = os.getenv("JOB_STORE", "memory").lower()  # memory | sqlite
+    DB_PATH = os.getenv("JOB_STORE_DB", "jobs.db")
+
+    # Decoded results kept per process by the SQLite store
+    RESULT_CACHE_SIZE = 32
+
+    # How often each worker process applies other workers' cache invalidations
+    INVALIDATION_POLL_SECONDS = float(os.getenv("JOB_STORE_INVALIDATION_POLL_SECONDS", "1"))
+    INVALIDATION_RETAIN_SECONDS = 3600
+
+
+def _owner(job: Dict) -> Optional[str]:
+    return job.get("user_id") or (job.get("result") or {}).get("user_id")
+
+
+# ============================================================================
+# STORES
+# ============================================================================
+
+class JobStore(abc.ABC):
+    """
+    Job state keyed by job id
+
+    A job is a dict of small state fields (status, stage, progress, error,
+    file_name, user_id, ...) plus an optional large "result". get() returns a
+    copy: change state through update(), never by mutating the returned dict.
+    """
+
+    @abc.abstractmethod
+    def get(self, job_id: str) -> Optional[Dict]:
+        ...
+
+    @abc.abstractmethod
+    def create(self, job_id: str, job: Dict):
+        ...
+
+    @abc.abstractmethod
+    def update(self, job_id: str, **fields):
+        """Merge fields into a job (creating it if missing)"""
+
+    @abc.abstractmethod
+    def delete(self, job_id: str):
+        ...
+
+    @abc.abstractmethod
+    def jobs_for_user(self, user_id: str) -> List[str]:
+        ...
+
+    def broadcast(self, kind: str, key: str):
+        """Ask the other worker processes to drop cached entries (none for a process-local store)"""
+
+    def invalidations(self) -> List[Tuple[str, str]]:
+        """(kind, key) invalidations broadcast by other worker processes since the last call"""
+        return []
+
+    def snapshot(self) -> Dict:
+        return {}
+
+    def setdefault(self, job_id: str, job: Dict) -> Dict:
+        existing = self.get(job_id)
+        if existing is not None:
+            return existing
+        self.create(job_id, job)
+        return copy.deepcopy(job)
+
+    def __contains__(self, job_id: str) -> bool:
+        return self.get(job_id) is not None
+
+
+class InMemoryJobStore(JobStore):
+    """
+    Process-local store (one API worker)
+
+    Job state stays in the dict; results go through ResultRetention, which
+    keeps them within a memory budget and spills the rest to local disk.
+    """
+
+    def __init__(self, retention: Optional[ResultRetention] = None):
+        self.jobs: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        self.results = retention or ResultRetention()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            job = {**job} if job is not None else None
+        if job is not None and job.pop("has_result", False):
+            # Results are written once and never mutated, so share them
+            job["result"] = self.results.get(job_id)
+        return job
+
+    def create(self, job_id: str, job: Dict):
+        state = {k: v for k, v in job.items() if k != "result"}
+        if "result" in job:
+            self.results.put(job_id, job["result"])
+            state["has_result"] = True
+            state.setdefault("user_id", _owner(job))
+        with self.lock:
+            self.jobs[job_id] = {**state, "updated_at": time.time()}
+
+    def update(self, job_id: str, **fields):
+        owner = None
+        if "result" in fields:
+            result = fields.pop("result")
+            self.results.put(job_id, result)
+            fields["has_result"] = True
+            owner = (result or {}).get("user_id")
+        with self.lock:
+            job = self.jobs.setdefault(job_id, {})
+            job.update(fields, updated_at=time.time())
+            if owner and not job.get("user_id"):
+                job["user_id"] = owner  # Keep jobs_for_user() off the (possibly spilled) result
+
+    def delete(self, job_id: str):
+        with self.lock:
+            self.jobs.pop(job_id, None)
+        self.results.delete(job_id)
+
+    def jobs_for_user(self, user_id: str) -> List[str]:
+        with self.lock:
+            return [job_id for job_id, job in self.jobs.items() if job.get("user_id") == user_id]
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            count = len(self.jobs)
+        return {"backend": "memory", "jobs": count, "results": self.results.snapshot()}
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    state TEXT NOT NULL,
+    result TEXT,
+    result_version REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id);
+CREATE TABLE IF NOT EXISTS invalidations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Node-local store shared by all API worker processes
+
+    Results older than the retention window are purged (the job state stays),
+    like spilled results of the in-process store.
+    """
+
+    def __init__(self, db_path: str = JobStoreConfig.DB_PATH):
+        self.db_path = db_path
+        self.local = threading.local()
+        self.results: "OrderedDict[str, tuple]" = OrderedDict()  # job_id -> (version, result)
+        self.results_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+        # Invalidations are applied from now on; earlier ones predate this process's caches
+        self.origin = os.getpid()
+        self.invalidation_seq = self._connect().execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM invalidations"
+        ).fetchone()[0]
+        self.invalidation_lock = threading.Lock()
+        self.last_purge: Optional[float] = None  # monotonic time of the last result purge
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _result(self, job_id: str, version: Optional[float], raw: Optional[str]) -> Optional[Dict]:
+        """Decode a result, reusing this process's copy while the version is unchanged"""
+        if raw is None:
+            return None
+        with self.results_lock:
+            cached = self.results.get(job_id)
+            if cached and cached[0] == version:
+                self.results.move_to_end(job_id)
+                return cached[1]
+        result = json.loads(raw)
+        with self.results_lock:
+            self.results[job_id] = (version, result)
+            while len(self.results) > JobStoreConfig.RESULT_CACHE_SIZE:
+                self.results.popitem(last=False)
+        return result
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT state, result_version, updated_at FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row["state"])
+        job["updated_at"] = row["updated_at"]
+        if row["result_version"] is not None:
+            with self.results_lock:
+                cached = self.results.get(job_id)
+            if cached and cached[0] == row["result_version"]:
+                job["result"] = cached[1]
+            else:
+                raw = conn.execute("SELECT result FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                job["result"] = self._result(job_id, row["result_version"], raw["result"] if raw else None)
+        return job
+
+    def create(self, job_id: str, job: Dict):
+        state = {k: v for k, v in job.items() if k != "result"}
+        now = time.time()
+        result = job.get("result")
+        self._connect().execute(
+            "INSERT OR REPLACE INTO jobs (job_id, user_id, state, result, result_version, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, _owner(job), json.dumps(state, default=str),
+             json.dumps(result, default=str) if result is not None else None,
+             now if result is not None else None, now)
+        )
+
+    def update(self, job_id: str, **fields):
+        result = fields.pop("result", None)
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            state = json.loads(row["state"]) if row else {}
+            state.update(fields)
+            user_id = state.get("user_id") or (result or {}).get("user_id")
+            if row is None:
+                conn.execute(
+                    "INSERT INTO jobs (job_id, user_id, state, updated_at) VALUES (?, ?, ?, ?)",
+                    (job_id, user_id, json.dumps(state, default=str), now)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET user_id = COALESCE(?, user_id), state = ?, updated_at = ? WHERE job_id = ?",
+                    (user_id, json.dumps(state, default=str), now, job_id)
+                )
+            if result is not None:
+                conn.execute(
+                    "UPDATE jobs SET result = ?, result_version = ? WHERE job_id = ?",
+                    (json.dumps(result, default=str), now, job_id)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, job_id: str):
+        self._connect().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        with self.results_lock:
+            self.results.pop(job_id, None)
+
+    def jobs_for_user(self, user_id: str) -> List[str]:
+        rows = self._connect().execute("SELECT job_id FROM jobs WHERE user_id = ?", (user_id,)).fetchall()
+        return [row["job_id"] for row in rows]
+
+    def broadcast(self, kind: str, key: str):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO invalidations (origin, kind, key, created_at) VALUES (?, ?, ?, ?)",
+            (self.origin, kind, key, now)
+        )
+        conn.execute(
+            "DELETE FROM invalidations WHERE created_at < ?",
+            (now - JobStoreConfig.INVALIDATION_RETAIN_SECONDS,)
+        )
+
+    def purge_results(self, max_age: float = ResultRetentionConfig.SPILL_RETENTION_SECONDS) -> int:
+        """Drop results stored more than max_age seconds ago; returns how many"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET result = NULL, result_version = NULL WHERE result_version < ?",
+            (time.time() - max_age,)
+        )
+        return cursor.rowcount
+
+    def invalidations(self) -> List[Tuple[str, str]]:
+        with self.invalidation_lock:
+            rows = self._connect().execute(
+                "SELECT seq, origin, kind, key FROM invalidations WHERE seq > ? ORDER BY seq",
+                (self.invalidation_seq,)
+            ).fetchall()
+            if rows:
+                self.invalidation_seq = rows[-1]["seq"]
+            # Every worker polls here, so this is also the periodic cleanup pass
+            purge_due = self.last_purge is None or \
+                time.monotonic() - self.last_purge >= ResultRetentionConfig.PURGE_EVERY_SECONDS
+            if purge_due:
+                self.last_purge = time.monotonic()
+        if purge_due:
+            purged = self.purge_results()
+            if purged:
+                print(f"✓ Purged {purged} job results older than the retention window")
+        return [(row["kind"], row["key"]) for row in rows if row["origin"] != self.origin]
+
+    def snapshot(self) -> Dict:
+        count = self._connect().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        with self.results_lock:
+            cached = len(self.results)
+        return {"backend": "sqlite", "jobs": count, "cached_results": cached}
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_job_store: Optional[JobStore] = None
+_singleton_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """Get or create the configured job store (JOB_STORE=memory|sqlite)"""
+    global _job_store
+    if _job_store is None:
+        with _singleton_lock:
+            if _job_store is None:
+                if JobStoreConfig.BACKEND == "sqlite":
+                    _job_store = SQLiteJobStore()
+                elif JobStoreConfig.BACKEND == "memory":
+                    _job_store = InMemoryJobStore()
+                else:
+                    raise ValueError(f"Unknown JOB_STORE '{JobStoreConfig.BACKEND}' (use memory or sqlite)")
+                print(f"✓ Job store: {JobStoreConfig.BACKEND}")
+    return _job_store
@@ -0,0 +1,251 @@
+"""
+lexical_index.py
+================
+Per-document BM25 inverted index and hybrid (lexical + vector) retrieval
+The BM25 index is built at ingestion and saved inside the FAISS index
+directory, so it travels with the vector store. Queries that name an exact
+term or clause reference are answered lexically without an embedding call.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class LexicalConfig:
+    """BM25 and hybrid retrieval settings"""
+
+    INDEX_FILE = "bm25_index.json"
+    INDEX_VERSION = 1
+
+    K1 = 1.5
+    B = 0.75
+
+    VECTOR_WEIGHT = 0.5        # Hybrid score = w * vector + (1 - w) * lexical (both min-max normalised)
+    FETCH_MULTIPLIER = 3       # Candidates fetched from each side per result
+
+    STOPWORDS = frozenset(
+        "a an and are as at be by for from has have in is it its of on or that the "
+        "this to was were will with what which who how does do i my me we our you your".split()
+    )
+
+
+# Tokens keep dotted numbers together so "9.2" is one term
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+
+# Clause references: "Section 9.2", "clause 14(b)", "Article IV", "§ 3", bare "9.2.1"
+_REFERENCE_RE = re.compile(
+    r"(?:\b(?:section|clause|article|schedule|exhibit|annex|appendix|paragraph)\s+|§\s*)"
+    r"[0-9ivxlc]+(?:\.[0-9a-z]+)*(?:\([a-z0-9]+\))?"
+    r"|\b\d+(?:\.\d+)+\b",
+    re.IGNORECASE
+)
+_QUOTED_RE = re.compile(r"[\"“‘]([^\"“”‘’]{3,})[\"”’]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word/number tokens without stopwords"""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in LexicalConfig.STOPWORDS]
+
+
+def _normalize_space(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def exact_terms(query: str) -> List[str]:
+    """Quoted phrases and clause references the user asked for verbatim"""
+    terms = [m.group(1) for m in _QUOTED_RE.finditer(query)]
+    for m in _REFERENCE_RE.finditer(query):
+        terms.append(m.group(0))
+        # Contracts often number headings without the word: "9.2 Termination"
+        number = m.group(0).split()[-1].lstrip("§")
+        if "." in number:
+            terms.append(number)
+    return [_normalize_space(t) for t in terms if t.strip()]
+
+
+def _contains_term(text: str, term: str) -> bool:
+    return re.search(r"(?<!\w)" + re.escape(term) + r"(?!\w)", text) is not None
+
+
+# ============================================================================
+# BM25 INDEX
+# ============================================================================
+
+class BM25Index:
+    """BM25 over a document's chunks; doc ids are positions in the FAISS index"""
+
+    def __init__(self, postings: Dict[str, List[List[int]]], doc_lengths: List[int],
+                 k1: float = LexicalConfig.K1, b: float = LexicalConfig.B):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, texts: List[str]) -> "BM25Index":
+        postings: Dict[str, List[List[int]]] = defaultdict(list)
+        doc_lengths = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append([doc_id, tf])
+        return cls(dict(postings), doc_lengths)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        n = len(self.doc_lengths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Top-k (doc_id, score) pairs; empty if no query term occurs"""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            entries = self.postings.get(term)
+            if not entries:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in entries:
+                norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_length or 1)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def memory_footprint(self) -> int:
+        """Approximate bytes held by the postings"""
+        return sum(len(term) + 16 * len(entries) for term, entries in self.postings.items()) \
+            + 8 * len(self.doc_lengths)
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": LexicalConfig.INDEX_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+
+    def save(self, index_dir: str) -> str:
+        path = os.path.join(index_dir, LexicalConfig.INDEX_FILE)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'), ensure_ascii=False)
+        return path
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["BM25Index"]:
+        """Load a saved index (None for vector stores built before BM25 existed)"""
+        path = os.path.join(index_dir, LexicalConfig.INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> Optional["BM25Index"]:
+        """Inverse of to_dict() (None for a missing or outdated index)"""
+        if not data or data.get("version") != LexicalConfig.INDEX_VERSION:
+            return None
+        return cls(data["postings"], data["doc_lengths"], data.get("k1", LexicalConfig.K1), data.get("b", LexicalConfig.B))
+
+
+# ============================================================================
+# HYBRID RETRIEVER
+# ============================================================================
+
+def _min_max(scores: Dict[int, float]) -> Dict[int, float]:
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {key: 1.0 for key in scores}
+    return {key: (value - low) / (high - low) for key, value in scores.items()}
+
+
+class HybridRetriever:
+    """Merge BM25 and FAISS results for one document"""
+
+    def __init__(self, vectorstore, lexical_index: Optional[BM25Index] = None,
+                 vector_weight: float = LexicalConfig.VECTOR_WEIGHT):
+        self.vectorstore = vectorstore
+        self.vector_weight = vector_weight
+        texts = [self._document(pos).page_content for pos in range(len(vectorstore.index_to_docstore_id))]
+        self.position_of = {text: pos for pos, text in enumerate(texts)}
+
+        if lexical_index is None:
+            # Legacy vector store: build the index from the stored chunk texts
+            lexical_index = BM25Index.build(texts)
+        self.lexical_index = lexical_index
+        self.stats = {"lexical_only": 0, "hybrid": 0}
+
+    def _document(self, position: int) -> Document:
+        return self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[position])
+
+    def _lexical_only(self, query: str, k: int) -> Optional[List[Document]]:
+        """Answer exact-term queries from BM25 alone (no embedding call)"""
+        terms = exact_terms(query)
+        if not terms:
+            return None
+        hits = self.lexical_index.search(query, k * LexicalConfig.FETCH_MULTIPLIER)
+        documents = []
+        for position, _ in hits:
+            document = self._document(position)
+            text = _normalize_space(document.page_content)
+            if any(_contains_term(text, term) for term in terms):
+                documents.append(document)
+            if len(documents) == k:
+                break
+        if not documents:
+            return None
+        self.stats["lexical_only"] += 1
+        return documents
+
+    def _merge(self, query: str, vector_hits: List[Tuple[Document, float]], k: int) -> List[Document]:
+        # FAISS returns L2 distances: smaller is closer
+        vector_scores = {}
+        documents = {}
+        for document, distance in vector_hits:
+            position = self.position_of.get(document.page_content)
+            if position is None:
+                continue
+            vector_scores[position] = -float(distance)
+            documents[position] = document
+
+        lexical_scores = dict(self.lexical_index.search(query, k * LexicalConfig.FETCH_MULTIPLIER))
+        vector_norm = _min_max(vector_scores)
+        lexical_norm = _min_max(lexical_scores)
+
+        combined = {
+            position: self.vector_weight * vector_norm.get(position, 0.0)
+            + (1 - self.vector_weight) * lexical_norm.get(position, 0.0)
+            for position in set(vector_norm) | set(lexical_norm)
+        }
+        ranked = sorted(combined, key=combined.get, reverse=True)[:k]
+        self.stats["hybrid"] += 1
+        return [documents.get(position) or self._document(position) for position in ranked]
+
+    def search(self, query: str, k: int = 4) -> List[Document]:
+        documents = self._lexical_only(query, k)
+        if documents is not None:
+            return documents
+        vector_hits = self.vectorstore.similarity_search_with_score(query, k=k * LexicalConfig.FETCH_MULTIPLIER)
+        return self._merge(query, vector_hits, k)
+
+    async def asearch(self, query: str, k: int = 4) -> List[Document]:
+        documents = self._lexical_only(query, k)
+        if documents is not None:
+            return documents
+        vector_hits = await self.vectorstore.asimilarity_search_with_score(query, k=k * LexicalConfig.FETCH_MULTIPLIER)
+        return self._merge(query, vector_hits, k)
@@ -0,0 +1,568 @@
+"""
+llm_client.py
+=============
+Rate-limit-aware LLM client shared by advisories, RAG chat and the assistant
+Token-bucket rate limiting, jittered retries, circuit breaking and queueing metrics
+Chat models and their keep-alive HTTP connection pools are shared process-wide
+(async pools per event loop, since a connection belongs to the loop that opened it)
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+
+load_dotenv()
+
+T = TypeVar("T")
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class LLMClientConfig:
+    """LLM client settings (from .env)"""
+
+    # Provider
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://openrouter.ai/api/v1")
+    LLM_MODEL = os.getenv("LLM_MODEL", "xiaomi/mimo-v2-flash:free")
+    REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+
+    # Shared keep-alive connection pool (TLS sessions reused across calls)
+    HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "32"))
+    HTTP_KEEPALIVE_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "90"))
+
+    # Token bucket sized to the provider quota
+    REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "20"))
+    BURST = int(os.getenv("LLM_BURST", "5"))
+    MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "60"))
+
+    # Retries
+    MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+    BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+    BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+    # Circuit breaker
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+    BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+    # A half-open probe that has not reported back by then (queue wait plus one
+    # request) is presumed lost and the circuit reopens
+    BREAKER_PROBE_TIMEOUT = MAX_QUEUE_WAIT + REQUEST_TIMEOUT
+
+
+# ============================================================================
+# ERRORS
+# ============================================================================
+
+class LLMUnavailableError(RuntimeError):
+    """LLM call rejected locally (circuit open or rate-limit queue timeout)"""
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """HTTP status of a provider error, if any"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def is_retryable(error: Exception) -> bool:
+    """429s, 5xxs, timeouts and connection errors are worth retrying"""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(error).__name__
+    return name in ("APIConnectionError", "APITimeoutError", "Timeout", "TimeoutError",
+                    "ConnectError", "ReadTimeout", "RemoteProtocolError")
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header, if the provider sent one"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+# ============================================================================
+# TOKEN BUCKET
+# ============================================================================
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second, up to `capacity` burst"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token now; return how long the caller must wait before using it"""
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def cancel(self):
+        """Give back a reserved token that will not be used"""
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+
+# ============================================================================
+# CIRCUIT BREAKER
+# ============================================================================
+
+class CircuitBreaker:
+    """
+    Opens after consecutive failures, lets one probe through after a cool-down
+
+    The probe must end in record_success(), record_failure() or
+    release_probe(); a probe that never reports back (lost thread) reopens the
+    circuit after probe_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float,
+                 probe_timeout: float = LLMClientConfig.BREAKER_PROBE_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self) -> Tuple[bool, bool]:
+        """(allowed, probe): probe is True for the one call let through while half-open"""
+        with self.lock:
+            now = time.monotonic()
+            if self.state == self.CLOSED:
+                return True, False
+            if self.state == self.HALF_OPEN and now - self.probe_started >= self.probe_timeout:
+                self._reopen(now)
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self.probe_started = now
+                return True, True
+            return False, False
+
+    def _reopen(self, now: float):
+        """Caller holds the lock"""
+        self.state = self.OPEN
+        self.opened_at = now
+
+    def release_probe(self):
+        """The probe ended without a verdict (cancelled, rejected, non-retryable error): reopen"""
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self._reopen(time.monotonic())
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"⚠️  LLM circuit opened after {self.failures} failure(s)")
+                self._reopen(time.monotonic())
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+class LLMMetrics:
+    """Counters and queueing-delay stats for LLM calls"""
+
+    def __init__(self, window: int = 500):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "requests": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "rejected": 0,
+        }
+        self.queue_delays = deque(maxlen=window)
+        self.total_queue_delay = 0.0
+
+    def incr(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe_queue_delay(self, seconds: float):
+        with self.lock:
+            self.queue_delays.append(seconds)
+            self.total_queue_delay += seconds
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            delays = sorted(self.queue_delays)
+            counters = dict(self.counters)
+            total_delay = self.total_queue_delay
+
+        def percentile(p: float) -> float:
+            if not delays:
+                return 0.0
+            return delays[min(int(p * len(delays)), len(delays) - 1)]
+
+        return {
+            **counters,
+            "queue_delay_seconds": {
+                "total": round(total_delay, 3),
+                "p50": round(percentile(0.50), 3),
+                "p95": round(percentile(0.95), 3),
+                "max": round(delays[-1], 3) if delays else 0.0,
+            },
+        }
+
+
+# ============================================================================
+# GATEWAY
+# ============================================================================
+
+class LLMGateway:
+    """Process-wide admission point for every LLM request"""
+
+    def __init__(self):
+        self.bucket = TokenBucket(
+            rate=LLMClientConfig.REQUESTS_PER_MINUTE / 60.0,
+            capacity=LLMClientConfig.BURST
+        )
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.metrics = LLMMetrics()
+        self.lock = threading.Lock()
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        """Circuit breaker for one model endpoint"""
+        with self.lock:
+            if model not in self.breakers:
+                self.breakers[model] = CircuitBreaker(
+                    LLMClientConfig.BREAKER_FAILURE_THRESHOLD,
+                    LLMClientConfig.BREAKER_RESET_SECONDS
+                )
+            return self.breakers[model]
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After"""
+        ceiling = min(LLMClientConfig.BACKOFF_MAX, LLMClientConfig.BACKOFF_BASE * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, LLMClientConfig.BACKOFF_MAX))
+        return delay
+
+    def _admit(self, model: str, breaker: CircuitBreaker, last_error: Optional[Exception]) -> Tuple[float, bool]:
+        """Check the breaker and take a rate-limit token; return (seconds to wait before sending, probe)"""
+        allowed, probe = breaker.allow()
+        if not allowed:
+            self.metrics.incr("rejected")
+            raise LLMUnavailableError(f"LLM circuit open for {model}") from last_error
+
+        wait = self.bucket.reserve()
+        if wait > LLMClientConfig.MAX_QUEUE_WAIT:
+            self.bucket.cancel()
+            if probe:
+                breaker.release_probe()
+            self.metrics.incr("rejected")
+            raise LLMUnavailableError(
+                f"LLM rate-limit queue is full (wait {wait:.1f}s > {LLMClientConfig.MAX_QUEUE_WAIT:.0f}s)"
+            )
+        self.metrics.observe_queue_delay(wait)
+        self.metrics.incr("requests")
+        return wait, probe
+
+    def _failed(self, model: str, breaker: CircuitBreaker, attempt: int, error: Exception,
+                probe: bool = False) -> Optional[float]:
+        """Record a failed attempt; return the backoff delay, or None to give up"""
+        if _status_code(error) == 429:
+            self.metrics.incr("rate_limited")
+        if not is_retryable(error):
+            if probe:
+                breaker.release_probe()
+            self.metrics.incr("failures")
+            return None
+        breaker.record_failure()
+        if attempt == LLMClientConfig.MAX_RETRIES:
+            self.metrics.incr("failures")
+            return None
+        delay = self._backoff(attempt, error)
+        self.metrics.incr("retries")
+        print(f"⚠️  LLM call to {model} failed ({error}); retrying in {delay:.1f}s")
+        return delay
+
+    def _succeeded(self, breaker: CircuitBreaker):
+        breaker.record_success()
+        self.metrics.incr("successes")
+
+    def call(self, model: str, fn: Callable[[], T]) -> T:
+        """Run fn under rate limiting, retries and the model's circuit breaker"""
+        breaker = self.breaker(model)
+        last_error: Optional[Exception] = None
+
+        for attempt in range(LLMClientConfig.MAX_RETRIES + 1):
+            wait, probe = self._admit(model, breaker, last_error)
+            try:
+                if wait > 0:
+                    time.sleep(wait)
+                result = fn()
+            except Exception as e:
+                last_error = e
+                delay = self._failed(model, breaker, attempt, e, probe)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                if probe:
+                    breaker.release_probe()
+                raise
+
+            self._succeeded(breaker)
+            return result
+
+    async def acall(self, model: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Async call(): waits with asyncio.sleep so no thread is held while queued"""
+        breaker = self.breaker(model)
+        last_error: Optional[Exception] = None
+
+        for attempt in range(LLMClientConfig.MAX_RETRIES + 1):
+            wait, probe = self._admit(model, breaker, last_error)
+            try:
+                if wait > 0:
+                    try:
+                        await asyncio.sleep(wait)
+                    except asyncio.CancelledError:
+                        self.bucket.cancel()
+                        raise
+                result = await fn()
+            except asyncio.CancelledError:
+                # A losing hedge or a disconnected client; a probe must not stay outstanding
+                if probe:
+                    breaker.release_probe()
+                raise
+            except Exception as e:
+                last_error = e
+                delay = self._failed(model, breaker, attempt, e, probe)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            self._succeeded(breaker)
+            return result
+
+    def stream(self, model: str, fn: Callable[[], Iterator[T]]) -> Iterator[T]:
+        """Stream fn's output under the gateway; retries only happen before the first chunk"""
+        def start():
+            iterator = iter(fn())
+            return next(iterator, _EMPTY), iterator
+
+        first, iterator = self.call(model, start)
+        if first is _EMPTY:
+            return
+        yield first
+        yield from iterator
+
+    async def astream(self, model: str, fn: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """Async stream(); retries only happen before the first chunk"""
+        async def start():
+            iterator = fn().__aiter__()
+            try:
+                first = await iterator.__anext__()
+            except StopAsyncIteration:
+                first = _EMPTY
+            return first, iterator
+
+        first, iterator = await self.acall(model, start)
+        if first is _EMPTY:
+            return
+        yield first
+        async for chunk in iterator:
+            yield chunk
+
+
+_EMPTY = object()
+
+
+# ============================================================================
+# CHAT MODEL
+# ============================================================================
+
+class ResilientChatModel:
+    """ChatOpenAI wrapper whose calls go through the shared LLM gateway"""
+
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        api_key: Optional[str] = None,
+        api_base: Optional[str] = None
+    ):
+        self.model = model or LLMClientConfig.LLM_MODEL
+        self.settings = dict(
+            model=self.model,
+            openai_api_key=api_key or LLMClientConfig.OPENAI_API_KEY,
+            openai_api_base=api_base or LLMClientConfig.OPENAI_API_BASE,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            max_retries=0,  # Retries are handled by the gateway
+            timeout=LLMClientConfig.REQUEST_TIMEOUT
+        )
+        self.llm = ChatOpenAI(**self.settings, http_client=get_http_clients()[0])
+        self.async_llms: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ChatOpenAI]" = \
+            weakref.WeakKeyDictionary()
+        self.async_lock = threading.Lock()
+
+    def _async_llm(self) -> ChatOpenAI:
+        """The model bound to the running event loop's connection pool"""
+        loop = asyncio.get_running_loop()
+        llm = self.async_llms.get(loop)
+        if llm is None:
+            with self.async_lock:
+                llm = self.async_llms.get(loop)
+                if llm is None:
+                    llm = ChatOpenAI(**self.settings, http_async_client=get_async_http_client())
+                    self.async_llms[loop] = llm
+        return llm
+
+    def invoke(self, messages):
+        """Invoke the model with rate limiting, retries and circuit breaking"""
+        return get_llm_gateway().call(self.model, lambda: self.llm.invoke(messages))
+
+    def stream(self, messages) -> Iterator:
+        """Stream response chunks; rate limiting and retries apply until the first chunk"""
+        return get_llm_gateway().stream(self.model, lambda: self.llm.stream(messages))
+
+    async def ainvoke(self, messages):
+        """Async invoke() on the provider's async HTTP client"""
+        llm = self._async_llm()
+        return await get_llm_gateway().acall(self.model, lambda: llm.ainvoke(messages))
+
+    def astream(self, messages) -> AsyncIterator:
+        """Async stream()"""
+        llm = self._async_llm()
+        return get_llm_gateway().astream(self.model, lambda: llm.astream(messages))
+
+
+# ============================================================================
+# SINGLETON INSTANCES
+# ============================================================================
+
+_llm_gateway: Optional[LLMGateway] = None
+_http_client: Optional[httpx.Client] = None
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = \
+    weakref.WeakKeyDictionary()
+_chat_models: Dict[tuple, ResilientChatModel] = {}
+_gateway_lock = threading.Lock()
+_chat_models_lock = threading.Lock()  # Separate: building a model takes _gateway_lock
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Get or create the process-wide LLM gateway"""
+    global _llm_gateway
+    if _llm_gateway is None:
+        with _gateway_lock:
+            if _llm_gateway is None:
+                _llm_gateway = LLMGateway()
+    return _llm_gateway
+
+
+def _http_settings() -> Dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=LLMClientConfig.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLMClientConfig.HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=LLMClientConfig.HTTP_KEEPALIVE_SECONDS
+        ),
+        "timeout": httpx.Timeout(LLMClientConfig.REQUEST_TIMEOUT),
+    }
+
+
+def get_http_clients() -> Tuple[httpx.Client, Optional[httpx.AsyncClient]]:
+    """
+    Get or create the shared sync HTTP client, and the async one for the running loop
+
+    Every chat model sends through these pools, so pipeline jobs and chat
+    requests reuse warm keep-alive connections instead of opening (and
+    TLS-handshaking) new ones per client. Outside an event loop the async
+    client is None.
+    """
+    global _http_client
+    if _http_client is None:
+        with _gateway_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(**_http_settings())
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return _http_client, None
+    return _http_client, get_async_http_client()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Async HTTP client for the running event loop (the API loop and the pipeline loop each get one)"""
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        with _gateway_lock:
+            client = _async_http_clients.get(loop)
+            if client is None:
+                client = httpx.AsyncClient(**_http_settings())
+                _async_http_clients[loop] = client
+    return client
+
+
+def get_chat_model(
+    model: Optional[str] = None,
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    api_key: Optional[str] = None,
+    api_base: Optional[str] = None
+) -> ResilientChatModel:
+    """Get or create the shared chat model for these settings (models are stateless and thread-safe)"""
+    key = (model or LLMClientConfig.LLM_MODEL, temperature, max_tokens, api_key, api_base)
+    chat_model = _chat_models.get(key)
+    if chat_model is None:
+        with _chat_models_lock:
+            chat_model = _chat_models.get(key)
+            if chat_model is None:
+                chat_model = ResilientChatModel(*key)
+                _chat_models[key] = chat_model
+    return chat_model
@@ -0,0 +1,408 @@
+"""
+llm_router.py
+=============
+Multi-model routing for LLM calls
+Ordered fallback across models/endpoints, hedged async requests and per-model latency histograms
+"""
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+from typing import AsyncIterator, Awaitable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from dotenv import load_dotenv
+
+from ml_pipeline.llm_client import LLMClientConfig, ResilientChatModel, get_chat_model
+
+load_dotenv()
+
+T = TypeVar("T")
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+def _parse_routes(value: str) -> List[Tuple[str, Optional[str]]]:
+    """Parse "model[@api_base],model[@api_base],..." into (model, api_base) pairs"""
+    routes = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        model, _, api_base = entry.partition("@")
+        routes.append((model.strip(), api_base.strip() or None))
+    return routes
+
+
+class RouterConfig:
+    """LLM routing settings (from .env)"""
+
+    # Ordered list of models; the first is the primary
+    # (repeat a model, e.g. "a,a", to hedge against the same model)
+    ROUTES = _parse_routes(os.getenv("LLM_MODELS", "")) or [(LLMClientConfig.LLM_MODEL, None)]
+
+    # Send a hedged async request to the next model after this many seconds (0 disables)
+    HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "8"))
+
+    # In-flight LLM calls across all routers (one semaphore for sync calls, one per event loop for async ones)
+    MAX_CONCURRENT_CALLS = int(os.getenv("LLM_MAX_CONCURRENT_CALLS", "16"))
+
+    # Latency histogram bucket upper bounds (seconds)
+    LATENCY_BUCKETS = (0.5, 1, 2, 4, 8, 16, 32, 64)
+
+
+# ============================================================================
+# LATENCY HISTOGRAMS
+# ============================================================================
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, buckets=RouterConfig.LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                **{f"le_{bound}": n for bound, n in zip(self.buckets, self.counts)},
+                "le_inf": self.counts[-1],
+            },
+        }
+
+
+class RouterMetrics:
+    """Per-model latency histograms and routing outcome counters"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.outcomes: Dict[str, Dict[str, int]] = {}
+
+    def _outcomes(self, model: str) -> Dict[str, int]:
+        if model not in self.outcomes:
+            self.outcomes[model] = {"wins": 0, "errors": 0, "hedges": 0, "fallbacks": 0}
+        return self.outcomes[model]
+
+    def observe(self, model: str, seconds: float, ok: bool):
+        with self.lock:
+            self.latency.setdefault(model, LatencyHistogram()).observe(seconds)
+            if not ok:
+                self._outcomes(model)["errors"] += 1
+
+    def incr(self, model: str, outcome: str):
+        with self.lock:
+            self._outcomes(model)[outcome] += 1
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            models = set(self.latency) | set(self.outcomes)
+            return {
+                model: {
+                    "latency_seconds": self.latency[model].snapshot() if model in self.latency else None,
+                    **self._outcomes(model),
+                }
+                for model in sorted(models)
+            }
+
+
+# ============================================================================
+# ROUTER
+# ============================================================================
+
+class LLMRouter:
+    """
+    Route a chat call across an ordered list of models
+
+    The primary model is called first. If a model fails, the next one is
+    tried straight away. Async calls are also hedged: if the primary has not
+    answered after HEDGE_AFTER_SECONDS, a request goes to the next model, the
+    first answer wins and the loser is cancelled. Sync calls are not hedged,
+    since a running sync call cannot be cancelled and a discarded loser would
+    keep its rate-limit token and a thread until it finished. Sync code that
+    wants hedging (e.g. advisory generation in a worker thread) runs its
+    async calls on the pipeline loop with run_on_llm_loop().
+    """
+
+    def __init__(
+        self,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        routes: Optional[List[Tuple[str, Optional[str]]]] = None,
+        api_key: Optional[str] = None,
+        api_base: Optional[str] = None,
+        hedge_after: Optional[float] = None
+    ):
+        self.endpoints = [
+            get_chat_model(
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                api_key=api_key,
+                api_base=route_base or api_base
+            )
+            for model, route_base in (routes or RouterConfig.ROUTES)
+        ]
+        self.model = self.endpoints[0].model
+        self.hedge_after = RouterConfig.HEDGE_AFTER_SECONDS if hedge_after is None else hedge_after
+
+    def _timed_invoke(self, endpoint: ResilientChatModel, messages):
+        with _get_sync_call_limiter():
+            started = time.monotonic()
+            try:
+                result = endpoint.invoke(messages)
+            except Exception:
+                get_router_metrics().observe(endpoint.model, time.monotonic() - started, ok=False)
+                raise
+            get_router_metrics().observe(endpoint.model, time.monotonic() - started, ok=True)
+            return result
+
+    def invoke(self, messages):
+        """Invoke with ordered fallback (no hedging); return the first successful response"""
+        metrics = get_router_metrics()
+        last_error: Optional[Exception] = None
+
+        for index, endpoint in enumerate(self.endpoints):
+            if index:
+                metrics.incr(endpoint.model, "fallbacks")
+            try:
+                result = self._timed_invoke(endpoint, messages)
+            except Exception as e:
+                last_error = e
+                print(f"⚠️  LLM route {endpoint.model} failed: {e}")
+                continue
+
+            metrics.incr(endpoint.model, "wins")
+            return result
+
+        raise last_error
+
+    def stream(self, messages) -> Iterator:
+        """
+        Stream from the first model that produces output
+
+        Falls back to the next model if one fails before its first chunk.
+        Streams are not hedged: time to first token already bounds the wait.
+        """
+        metrics = get_router_metrics()
+        last_error: Optional[Exception] = None
+
+        for index, endpoint in enumerate(self.endpoints):
+            if index:
+                metrics.incr(endpoint.model, "fallbacks")
+            started = time.monotonic()
+            produced = False
+            try:
+                for chunk in endpoint.stream(messages):
+                    if not produced:
+                        # Latency histogram tracks time to first token for streams
+                        metrics.observe(endpoint.model, time.monotonic() - started, ok=True)
+                        produced = True
+                    yield chunk
+            except Exception as e:
+                if produced:
+                    raise
+                metrics.observe(endpoint.model, time.monotonic() - started, ok=False)
+                last_error = e
+                print(f"⚠️  LLM route {endpoint.model} failed: {e}")
+                continue
+
+            metrics.incr(endpoint.model, "wins")
+            return
+
+        raise last_error
+
+
+    async def _atimed_invoke(self, endpoint: ResilientChatModel, messages):
+        async with _get_call_limiter():
+            started = time.monotonic()
+            try:
+                result = await endpoint.ainvoke(messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                get_router_metrics().observe(endpoint.model, time.monotonic() - started, ok=False)
+                raise
+            get_router_metrics().observe(endpoint.model, time.monotonic() - started, ok=True)
+            return result
+
+    async def ainvoke(self, messages):
+        """Async invoke(); losing hedged requests are cancelled, not just discarded"""
+        metrics = get_router_metrics()
+        pending = {}
+        next_index = 0
+        last_error: Optional[Exception] = None
+
+        def launch(reason: Optional[str] = None):
+            nonlocal next_index
+            endpoint = self.endpoints[next_index]
+            next_index += 1
+            if reason:
+                metrics.incr(endpoint.model, reason)
+            pending[asyncio.ensure_future(self._atimed_invoke(endpoint, messages))] = endpoint
+
+        launch()
+        try:
+            while pending:
+                can_hedge = self.hedge_after > 0 and next_index < len(self.endpoints)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_after if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    launch("hedges")
+                    continue
+
+                for task in done:
+                    endpoint = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = e
+                        print(f"⚠️  LLM route {endpoint.model} failed: {e}")
+                        continue
+
+                    metrics.incr(endpoint.model, "wins")
+                    return result
+
+                if not pending and next_index < len(self.endpoints):
+                    launch("fallbacks")
+        finally:
+            # Losers (or everything, if the caller was cancelled) stop here
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    async def astream(self, messages) -> AsyncIterator:
+        """Async stream(); same fallback rules"""
+        metrics = get_router_metrics()
+        last_error: Optional[Exception] = None
+
+        for index, endpoint in enumerate(self.endpoints):
+            if index:
+                metrics.incr(endpoint.model, "fallbacks")
+            produced = False
+            async with _get_call_limiter():
+                started = time.monotonic()
+                try:
+                    async for chunk in endpoint.astream(messages):
+                        if not produced:
+                            metrics.observe(endpoint.model, time.monotonic() - started, ok=True)
+                            produced = True
+                        yield chunk
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if produced:
+                        raise
+                    metrics.observe(endpoint.model, time.monotonic() - started, ok=False)
+                    last_error = e
+                    print(f"⚠️  LLM route {endpoint.model} failed: {e}")
+                    continue
+
+            metrics.incr(endpoint.model, "wins")
+            return
+
+        raise last_error
+
+
+# ============================================================================
+# SINGLETON INSTANCES
+# ============================================================================
+
+_router_metrics: Optional[RouterMetrics] = None
+_sync_call_limiter: Optional[threading.BoundedSemaphore] = None
+_call_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+    weakref.WeakKeyDictionary()
+_llm_loop: Optional[asyncio.AbstractEventLoop] = None
+_singleton_lock = threading.Lock()
+
+
+def get_router_metrics() -> RouterMetrics:
+    """Get or create the process-wide routing metrics"""
+    global _router_metrics
+    if _router_metrics is None:
+        with _singleton_lock:
+            if _router_metrics is None:
+                _router_metrics = RouterMetrics()
+    return _router_metrics
+
+
+def _get_sync_call_limiter() -> threading.BoundedSemaphore:
+    """Shared semaphore bounding in-flight sync LLM calls"""
+    global _sync_call_limiter
+    if _sync_call_limiter is None:
+        with _singleton_lock:
+            if _sync_call_limiter is None:
+                _sync_call_limiter = threading.BoundedSemaphore(RouterConfig.MAX_CONCURRENT_CALLS)
+    return _sync_call_limiter
+
+
+def _get_call_limiter() -> asyncio.Semaphore:
+    """Semaphore bounding in-flight async LLM calls on the running event loop"""
+    loop = asyncio.get_running_loop()
+    limiter = _call_limiters.get(loop)
+    if limiter is None:
+        with _singleton_lock:
+            limiter = _call_limiters.get(loop)
+            if limiter is None:
+                limiter = asyncio.Semaphore(RouterConfig.MAX_CONCURRENT_CALLS)
+                _call_limiters[loop] = limiter
+    return limiter
+
+
+def _get_llm_loop() -> asyncio.AbstractEventLoop:
+    """Long-lived event loop (own thread) for async LLM calls made from sync pipeline code"""
+    global _llm_loop
+    if _llm_loop is None:
+        with _singleton_lock:
+            if _llm_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+                _llm_loop = loop
+    return _llm_loop
+
+
+def run_on_llm_loop(coro: Awaitable[T]) -> T:
+    """
+    Run a coroutine on the pipeline LLM loop and wait for its result (from sync code only)
+
+    One shared loop, rather than asyncio.run() per job, keeps a single warm
+    async connection pool for all pipeline jobs.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_llm_loop()).result()
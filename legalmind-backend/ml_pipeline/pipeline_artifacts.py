@@ -0,0 +1,170 @@
+"""
+pipeline_artifacts.py
+=====================
+Which pipeline intermediates are written to local disk
+By default every stage saves its output (raw chunks, FAISS directory, risky /
+safe chunk JSON, report JSON) as before. In zero-disk mode the stages hand
+their output to the next one in memory, the vector store is serialized
+straight to the archive uploaded to Supabase, and only the artifacts listed
+in PIPELINE_KEEP_ARTIFACTS are written locally. A vector store that was not
+written stays in memory for its job, so chat does not need a local copy.
+"""
+
+import io
+import json
+import os
+import pickle
+import threading
+import zipfile
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import faiss
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class ArtifactConfig:
+    """Local artifact settings (from .env)"""
+
+    ARTIFACTS = ("chunks", "vector_store", "risk_results", "report")
+
+    ZERO_DISK = os.getenv("PIPELINE_ZERO_DISK", "false").lower() == "true"
+
+    # Artifacts still written in zero-disk mode, e.g. "vector_store,report"
+    KEEP = {name.strip() for name in os.getenv("PIPELINE_KEEP_ARTIFACTS", "").split(",") if name.strip()}
+
+    # Unsaved vector stores kept in memory for chat (least recently used dropped first)
+    MEMORY_STORE_SLOTS = int(os.getenv("PIPELINE_MEMORY_STORE_SLOTS", "16"))
+
+    # File names inside a FAISS directory (as written by FAISS.save_local)
+    FAISS_INDEX_FILE = "index.faiss"
+    FAISS_DOCSTORE_FILE = "index.pkl"
+
+
+_unknown = ArtifactConfig.KEEP - set(ArtifactConfig.ARTIFACTS)
+if _unknown:
+    print(f"⚠️  Ignoring unknown PIPELINE_KEEP_ARTIFACTS: {', '.join(sorted(_unknown))} "
+          f"(use {', '.join(ArtifactConfig.ARTIFACTS)})")
+
+
+def keep_artifact(name: str) -> bool:
+    """Whether the pipeline writes this artifact to local disk"""
+    return not ArtifactConfig.ZERO_DISK or name in ArtifactConfig.KEEP
+
+
+def transient_artifacts() -> bool:
+    """Whether written intermediates are deleted when the job ends (default mode; kept ones were asked for)"""
+    return not ArtifactConfig.ZERO_DISK
+
+
+# ============================================================================
+# IN-MEMORY VECTOR STORE
+# ============================================================================
+
+class VectorStoreBundle:
+    """
+    A FAISS vector store plus the sidecar files that travel with it
+    (BM25 index, risk digest), held in memory
+
+    to_archive() produces the same zip as zipping a save_local() directory,
+    so stores uploaded from memory download and load exactly like before.
+    """
+
+    def __init__(self, store, files: Optional[Dict[str, bytes]] = None):
+        self.store = store
+        self.files: Dict[str, bytes] = dict(files or {})
+
+    def add_json(self, name: str, data: Dict):
+        self.files[name] = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    def json(self, name: str) -> Optional[Dict]:
+        data = self.files.get(name)
+        return json.loads(data) if data is not None else None
+
+    def to_archive(self) -> bytes:
+        """Zip of index.faiss, index.pkl and the sidecar files, built without touching disk"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(ArtifactConfig.FAISS_INDEX_FILE, faiss.serialize_index(self.store.index).tobytes())
+            archive.writestr(
+                ArtifactConfig.FAISS_DOCSTORE_FILE,
+                pickle.dumps((self.store.docstore, self.store.index_to_docstore_id))
+            )
+            for name, data in self.files.items():
+                archive.writestr(name, data)
+        return buffer.getvalue()
+
+    def save(self, path: str) -> str:
+        """Write the store and its sidecar files as a local FAISS directory"""
+        self.store.save_local(path)
+        for name, data in self.files.items():
+            with open(os.path.join(path, name), 'wb') as f:
+                f.write(data)
+        return path
+
+
+class InMemoryVectorStores:
+    """
+    Per-job slots for vector stores that were never written to disk
+
+    Chat on a zero-disk job builds its RAG system from the slot. A job whose
+    slot was dropped (or that ran in another API worker) falls back to the
+    copy in Supabase.
+    """
+
+    def __init__(self, max_slots: int = ArtifactConfig.MEMORY_STORE_SLOTS):
+        self.max_slots = max(max_slots, 0)
+        self.slots: "OrderedDict[str, Tuple[VectorStoreBundle, Optional[str]]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, job_id: str, bundle: VectorStoreBundle, user_id: Optional[str] = None):
+        with self.lock:
+            self.slots[job_id] = (bundle, user_id)
+            self.slots.move_to_end(job_id)
+            while len(self.slots) > self.max_slots:
+                self.slots.popitem(last=False)
+
+    def get(self, job_id: str) -> Optional[VectorStoreBundle]:
+        with self.lock:
+            slot = self.slots.get(job_id)
+            if slot is None:
+                return None
+            self.slots.move_to_end(job_id)
+            return slot[0]
+
+    def invalidate(self, job_id: str):
+        with self.lock:
+            self.slots.pop(job_id, None)
+
+    def invalidate_user(self, user_id: str):
+        with self.lock:
+            for job_id in [j for j, (_, owner) in self.slots.items() if owner == user_id]:
+                del self.slots[job_id]
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {"slots": len(self.slots), "max_slots": self.max_slots}
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_memory_vector_stores: Optional[InMemoryVectorStores] = None
+_singleton_lock = threading.Lock()
+
+
+def get_memory_vector_stores() -> InMemoryVectorStores:
+    """Get or create the process-wide in-memory vector store slots"""
+    global _memory_vector_stores
+    if _memory_vector_stores is None:
+        with _singleton_lock:
+            if _memory_vector_stores is None:
+                _memory_vector_stores = InMemoryVectorStores()
+    return _memory_vector_stores
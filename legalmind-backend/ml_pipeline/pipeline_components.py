@@ -0,0 +1,136 @@
+"""
+pipeline_components.py
+======================
+Long-lived pipeline components shared by every job
+The ingestion pipeline (chunker, embedding client) and the advisory pipeline
+(LLM router) are built once per process and reused by all jobs; chat shares
+the same pooled LLM and embedding clients. Settings can be changed at runtime:
+a new set of components is built and swapped in atomically, and jobs already
+running finish on the components they started with.
+"""
+
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, fields, replace
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+from ml_pipeline.Document_loader import IngestionPipeline, PipelineConfig
+from ml_pipeline.LLM_advisory import AdvisoryGenerator, AdvisoryPipeline
+from ml_pipeline.pipeline_artifacts import keep_artifact
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+@dataclass(frozen=True)
+class PipelineSettings:
+    """Runtime-tunable pipeline settings (initial values from .env)"""
+
+    chunk_size: int = int(os.getenv("PIPELINE_CHUNK_SIZE", "1000"))
+    chunk_overlap: int = int(os.getenv("PIPELINE_CHUNK_OVERLAP", "200"))
+    embedding_model: str = os.getenv("PIPELINE_EMBEDDING_MODEL", "google/embeddinggemma-300m")
+    embedding_batch_size: int = int(os.getenv("PIPELINE_EMBEDDING_BATCH_SIZE", "32"))
+    advisory_temperature: float = float(os.getenv("ADVISORY_TEMPERATURE", "0.7"))
+    advisory_max_tokens: int = int(os.getenv("ADVISORY_MAX_TOKENS", "800"))
+
+    def validate(self):
+        if self.chunk_size <= 0 or self.embedding_batch_size <= 0 or self.advisory_max_tokens <= 0:
+            raise ValueError("chunk_size, embedding_batch_size and advisory_max_tokens must be positive")
+        if not 0 <= self.chunk_overlap < self.chunk_size:
+            raise ValueError("chunk_overlap must be between 0 and chunk_size")
+        if not 0 <= self.advisory_temperature <= 2:
+            raise ValueError("advisory_temperature must be between 0 and 2")
+
+
+class PipelineComponents:
+    """One generation of shared pipeline components (never mutated after construction)"""
+
+    def __init__(self, settings: PipelineSettings, generation: int):
+        self.settings = settings
+        self.generation = generation
+        self.created_at = time.time()
+
+        self.ingestion = IngestionPipeline(PipelineConfig(
+            chunk_size=settings.chunk_size,
+            chunk_overlap=settings.chunk_overlap,
+            embedding_model=settings.embedding_model,
+            embedding_batch_size=settings.embedding_batch_size,
+            save_vector_store=keep_artifact("vector_store"),
+            save_chunks=keep_artifact("chunks")
+        ))
+        self.advisory = AdvisoryPipeline(AdvisoryGenerator(
+            temperature=settings.advisory_temperature,
+            max_tokens=settings.advisory_max_tokens
+        ))
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_components: Optional[PipelineComponents] = None
+_singleton_lock = threading.Lock()
+_reconfigure_lock = threading.Lock()  # One rebuild at a time; readers never wait on it
+
+
+def get_pipeline_components() -> PipelineComponents:
+    """
+    Get or create the current pipeline components
+
+    A job should call this once and keep the returned object for its whole
+    run, so a concurrent reconfiguration cannot mix settings within one job.
+    """
+    global _components
+    if _components is None:
+        with _singleton_lock:
+            if _components is None:
+                _components = PipelineComponents(PipelineSettings(), generation=1)
+                print("✓ Pipeline components ready (generation 1)")
+    return _components
+
+
+def reconfigure_pipeline(**changes) -> PipelineComponents:
+    """
+    Rebuild the components with some settings changed and swap them in
+
+    Unknown setting names or invalid values raise ValueError and leave the
+    current components in place. The rebuild happens outside the singleton
+    lock, so jobs starting meanwhile keep getting the current components.
+    """
+    global _components
+    allowed = {f.name for f in fields(PipelineSettings)}
+    unknown = set(changes) - allowed
+    if unknown:
+        raise ValueError(f"Unknown pipeline settings: {', '.join(sorted(unknown))}")
+
+    with _reconfigure_lock:
+        current = get_pipeline_components()
+        try:
+            changes = {name: type(getattr(current.settings, name))(value) for name, value in changes.items()}
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid pipeline setting: {e}")
+        settings = replace(current.settings, **changes)
+        settings.validate()
+        components = PipelineComponents(settings, generation=current.generation + 1)
+        with _singleton_lock:
+            _components = components
+    print(f"✓ Pipeline reconfigured (generation {components.generation}): {changes}")
+    return components
+
+
+def pipeline_snapshot() -> Dict:
+    """Current settings and generation (for metrics and the admin endpoint)"""
+    components = _components
+    if components is None:
+        return {"generation": 0, "settings": asdict(PipelineSettings())}
+    return {
+        "generation": components.generation,
+        "created_at": components.created_at,
+        "settings": asdict(components.settings),
+    }
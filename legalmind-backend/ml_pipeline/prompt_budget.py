@@ -0,0 +1,215 @@
+"""
+prompt_budget.py
+================
+Token-budgeted prompt construction shared by advisory and RAG prompts
+Counts tokens with a real tokenizer and fits risks, context and history into a budget
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+    print("⚠️  tiktoken not installed. Token counts will be approximate. Install with: pip install tiktoken")
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class BudgetConfig:
+    """Prompt budget settings (from .env)"""
+
+    # Tokenizer
+    ENCODING = os.getenv("PROMPT_TOKEN_ENCODING", "cl100k_base")
+
+    # Total tokens for a RAG chat prompt (system + history + question)
+    CHAT_PROMPT_TOKENS = int(os.getenv("CHAT_PROMPT_TOKENS", "6000"))
+
+    # Max tokens of clause text sent for a single advisory
+    ADVISORY_CLAUSE_TOKENS = int(os.getenv("ADVISORY_CLAUSE_TOKENS", "400"))
+
+    # Relative share of the chat budget per section
+    SECTION_WEIGHTS = {
+        "risks": 0.5,
+        "context": 0.3,
+        "history": 0.2,
+    }
+
+    # Items squeezed below this many tokens are dropped instead
+    MIN_ITEM_TOKENS = 24
+
+
+# ============================================================================
+# TOKEN COUNTING
+# ============================================================================
+
+class TokenCounter:
+    """Count and truncate text by tokens"""
+
+    # Rough chars-per-token ratio used when tiktoken is missing
+    APPROX_CHARS_PER_TOKEN = 4
+
+    def __init__(self, encoding_name: str = BudgetConfig.ENCODING):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                print(f"⚠️  Could not load tokenizer '{encoding_name}': {e}")
+
+    def count(self, text: str) -> int:
+        """Number of tokens in text"""
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return (len(text) + self.APPROX_CHARS_PER_TOKEN - 1) // self.APPROX_CHARS_PER_TOKEN
+
+    def truncate(self, text: str, max_tokens: int, suffix: str = "...") -> str:
+        """Cut text down to at most max_tokens tokens (suffix included)"""
+        if max_tokens <= 0 or not text:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+
+        keep = max(max_tokens - self.count(suffix), 1)
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return self.encoding.decode(tokens[:keep]).rstrip() + suffix
+        return text[:keep * self.APPROX_CHARS_PER_TOKEN].rstrip() + suffix
+
+
+# ============================================================================
+# BUDGET ALLOCATION
+# ============================================================================
+
+@dataclass
+class PromptItem:
+    """A piece of prompt content competing for budget"""
+
+    text: str
+    priority: float = 0.0
+    summary: Optional[str] = None  # Compressed form used when over budget
+
+
+class PromptBudget:
+    """Split a token budget across prompt sections and fit items into it"""
+
+    def __init__(self, total_tokens: int, counter: Optional[TokenCounter] = None):
+        self.total_tokens = total_tokens
+        self.counter = counter or get_token_counter()
+
+    def allocate(
+        self,
+        demands: Dict[str, int],
+        reserved: int = 0,
+        weights: Optional[Dict[str, float]] = None
+    ) -> Dict[str, int]:
+        """
+        Allocate the budget (minus reserved tokens) across sections
+
+        Each section gets its weighted share; sections needing less than their
+        share hand the surplus to the sections that still need more.
+        """
+        weights = weights or BudgetConfig.SECTION_WEIGHTS
+        available = max(self.total_tokens - reserved, 0)
+        allocation = {name: 0 for name in demands}
+        pending = {name for name, need in demands.items() if need > 0}
+
+        while pending and available > 0:
+            total_weight = sum(weights.get(name, 1.0) for name in pending)
+            satisfied = set()
+            grants = {}
+            for name in pending:
+                share = int(available * weights.get(name, 1.0) / total_weight)
+                need = demands[name] - allocation[name]
+                if need <= share:
+                    grants[name] = need
+                    satisfied.add(name)
+
+            if not satisfied:
+                # Nobody fits inside their share: hand out the shares and stop
+                for name in pending:
+                    allocation[name] += int(available * weights.get(name, 1.0) / total_weight)
+                break
+
+            for name, grant in grants.items():
+                allocation[name] += grant
+                available -= grant
+            pending -= satisfied
+
+        return allocation
+
+    def fit_items(self, items: Sequence[PromptItem], budget: int) -> Tuple[List[str], int]:
+        """
+        Fit items into budget tokens, compressing lowest priority first
+
+        Returns (texts in original order, number of items dropped)
+        """
+        if not items:
+            return [], 0
+        if budget <= 0:
+            return [], len(items)
+
+        texts = [item.text for item in items]
+        costs = [self.counter.count(text) for text in texts]
+        by_priority = sorted(range(len(items)), key=lambda i: items[i].priority)
+
+        # 1. Swap in summaries, lowest priority first
+        for i in by_priority:
+            if sum(costs) <= budget:
+                break
+            summary = items[i].summary
+            if summary:
+                summary_cost = self.counter.count(summary)
+                if summary_cost < costs[i]:
+                    texts[i], costs[i] = summary, summary_cost
+
+        # 2. Drop items, lowest priority first (always keep the top one)
+        dropped = set()
+        for i in by_priority[:-1]:
+            if sum(costs) <= budget:
+                break
+            dropped.add(i)
+            costs[i] = 0
+
+        # 3. Truncate whatever is left if still over
+        for i in by_priority:
+            overflow = sum(costs) - budget
+            if overflow <= 0:
+                break
+            if i in dropped:
+                continue
+            target = costs[i] - overflow
+            if target < BudgetConfig.MIN_ITEM_TOKENS and len(dropped) < len(items) - 1:
+                dropped.add(i)
+                costs[i] = 0
+            else:
+                texts[i] = self.counter.truncate(texts[i], max(target, BudgetConfig.MIN_ITEM_TOKENS))
+                costs[i] = self.counter.count(texts[i])
+
+        kept = [text for i, text in enumerate(texts) if i not in dropped]
+        return kept, len(dropped)
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_token_counter: Optional[TokenCounter] = None
+
+
+def get_token_counter() -> TokenCounter:
+    """Get or create the shared token counter"""
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = TokenCounter()
+    return _token_counter
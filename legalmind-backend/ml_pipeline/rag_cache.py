@@ -0,0 +1,177 @@
+"""
+rag_cache.py
+============
+Per-document cache of EnhancedRAGSystem instances
+LRU eviction with an idle TTL and a total memory budget, so follow-up chat
+messages skip LLM/embedding client setup and FAISS loading
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class RAGCacheConfig:
+    """RAG session cache settings (from .env)"""
+
+    MAX_SESSIONS = int(os.getenv("RAG_CACHE_MAX_SESSIONS", "32"))
+    IDLE_TTL_SECONDS = float(os.getenv("RAG_CACHE_IDLE_TTL", "1800"))
+    MEMORY_BUDGET_MB = float(os.getenv("RAG_CACHE_MEMORY_MB", "512"))
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+@dataclass
+class _Session:
+    rag: object
+    version: Optional[str]
+    user_id: Optional[str]
+    size_bytes: int
+    last_used: float
+
+
+class RAGSessionCache:
+    """Thread-safe LRU of RAG systems keyed by document id"""
+
+    def __init__(
+        self,
+        max_sessions: int = RAGCacheConfig.MAX_SESSIONS,
+        idle_ttl: float = RAGCacheConfig.IDLE_TTL_SECONDS,
+        memory_budget_mb: float = RAGCacheConfig.MEMORY_BUDGET_MB
+    ):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.build_locks: Dict[str, threading.Lock] = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def _drop(self, document_id: str, reason: str):
+        session = self.sessions.pop(document_id, None)
+        if session:
+            self.total_bytes -= session.size_bytes
+            self.stats[reason] += 1
+
+    def _sweep(self):
+        """Expire idle sessions, then evict LRU until within limits"""
+        now = time.monotonic()
+        for document_id in [d for d, s in self.sessions.items() if now - s.last_used > self.idle_ttl]:
+            self._drop(document_id, "expirations")
+        while self.sessions and (
+            len(self.sessions) > self.max_sessions or self.total_bytes > self.memory_budget
+        ):
+            self._drop(next(iter(self.sessions)), "evictions")
+
+    def _lookup(self, document_id: str, version: Optional[str]):
+        session = self.sessions.get(document_id)
+        if session is None:
+            return None
+        if session.version != version:
+            self._drop(document_id, "evictions")
+            return None
+        if time.monotonic() - session.last_used > self.idle_ttl:
+            self._drop(document_id, "expirations")
+            return None
+        session.last_used = time.monotonic()
+        self.sessions.move_to_end(document_id)
+        return session.rag
+
+    def get_or_create(
+        self,
+        document_id: str,
+        factory: Callable[[], object],
+        version: Optional[str] = None,
+        user_id: Optional[str] = None
+    ):
+        """Return the cached RAG system for a document, building it once if missing"""
+        with self.lock:
+            rag = self._lookup(document_id, version)
+            if rag is not None:
+                self.stats["hits"] += 1
+                return rag
+            build_lock = self.build_locks.setdefault(document_id, threading.Lock())
+
+        # Only one request builds a given document; others wait and reuse it
+        with build_lock:
+            with self.lock:
+                rag = self._lookup(document_id, version)
+                if rag is not None:
+                    self.stats["hits"] += 1
+                    return rag
+                self.stats["misses"] += 1
+
+            try:
+                rag = factory()
+            except BaseException:
+                with self.lock:
+                    self.build_locks.pop(document_id, None)  # Next request retries with a fresh lock
+                raise
+            size = rag.memory_footprint() if hasattr(rag, "memory_footprint") else 0
+
+            with self.lock:
+                self._drop(document_id, "evictions")
+                self.sessions[document_id] = _Session(
+                    rag=rag,
+                    version=version,
+                    user_id=user_id,
+                    size_bytes=size,
+                    last_used=time.monotonic()
+                )
+                self.total_bytes += size
+                self._sweep()
+                self.build_locks.pop(document_id, None)
+            return rag
+
+    def invalidate(self, document_id: str):
+        """Drop a document's session (e.g. document deleted or re-analysed)"""
+        with self.lock:
+            session = self.sessions.pop(document_id, None)
+            if session:
+                self.total_bytes -= session.size_bytes
+
+    def invalidate_user(self, user_id: str):
+        """Drop every session belonging to a user"""
+        with self.lock:
+            for document_id in [d for d, s in self.sessions.items() if s.user_id == user_id]:
+                session = self.sessions.pop(document_id)
+                self.total_bytes -= session.size_bytes
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            self._sweep()
+            return {
+                **self.stats,
+                "sessions": len(self.sessions),
+                "memory_bytes": self.total_bytes,
+                "memory_budget_bytes": self.memory_budget,
+            }
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_rag_cache: Optional[RAGSessionCache] = None
+
+
+def get_rag_cache() -> RAGSessionCache:
+    """Get or create the RAG session cache"""
+    global _rag_cache
+    if _rag_cache is None:
+        _rag_cache = RAGSessionCache()
+    return _rag_cache
@@ -0,0 +1,390 @@
+"""
+report_renderer.py
+==================
+Structured analysis reports with on-demand rendering
+Reports are stored as compact data (risks, advisories, metadata) and rendered
+to markdown, HTML or plain text when requested, with a bounded render cache
+"""
+
+import hashlib
+import html
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+REPORT_SCHEMA_VERSION = 1
+
+FORMATS = ("markdown", "html", "text")
+
+DISCLAIMER = (
+    "**This is an AI-generated legal analysis.** While the system has been trained on "
+    "extensive legal documentation and achieves high accuracy in identifying common "
+    "contract risks, it should not be considered a substitute for professional legal counsel."
+)
+
+SAFE_DISCLAIMER = (
+    "This is an AI-generated analysis based on automated risk detection models. While the "
+    "system has high accuracy in identifying common legal risks, it is recommended to consult "
+    "with a qualified legal professional for a complete review of this contract. AI analysis "
+    "complements but does not replace professional legal advice."
+)
+
+RECOMMENDATIONS = [
+    ("Review with Legal Professional", "Consult with a qualified attorney licensed in your jurisdiction"),
+    ("Negotiate Key Terms", "Use the identified risks as a starting point for negotiations"),
+    ("Verify Compliance", "Ensure all recommendations comply with applicable laws and regulations"),
+    ("Consider Context", "This analysis is automated and may not account for specific business relationships or industry practices"),
+]
+
+SAFE_POINTS = [
+    ("No unilateral termination clauses", "Termination terms appear balanced"),
+    ("No unlimited liability provisions", "Liability exposure is capped appropriately"),
+    ("No excessive non-compete restrictions", "Restrictions are reasonable in scope"),
+]
+
+
+# ============================================================================
+# REPORT DATA
+# ============================================================================
+
+def build_report_data(advisories: List[Dict], total_chunks: int, source_name: str) -> Dict:
+    """Build the structured report from advisories (empty list = safe contract)"""
+    risks = []
+    for advisory in advisories:
+        detection = advisory.get('risk_detection', {})
+        risk = {
+            "chunk_id": advisory.get('chunk_id'),
+            "risk_type": detection.get('risk_type', 'Unknown Risk'),
+            "confidence": detection.get('confidence', 0.0),
+            "original_clause": advisory.get('original_clause', 'N/A'),
+        }
+        if advisory.get('duplicate_chunk_ids'):
+            risk["duplicate_chunk_ids"] = advisory['duplicate_chunk_ids']
+        if 'error' in advisory:
+            risk["error"] = advisory['error']
+        else:
+            risk["llm_analysis"] = advisory.get('llm_analysis', '')
+        risks.append(risk)
+
+    return {
+        "version": REPORT_SCHEMA_VERSION,
+        "source_name": source_name,
+        "generated_at": datetime.now().isoformat(),
+        "total_chunks": total_chunks,
+        "status": "risky" if risks else "safe",
+        "risks": risks,
+    }
+
+
+def report_etag(report_data: Dict) -> str:
+    """Stable content hash of a structured report"""
+    canonical = json.dumps(report_data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+def _generated_at(report_data: Dict) -> datetime:
+    try:
+        return datetime.fromisoformat(report_data.get("generated_at", ""))
+    except ValueError:
+        return datetime.now()
+
+
+def _risk_level(confidence: float) -> str:
+    return "HIGH" if confidence > 0.8 else "MEDIUM" if confidence > 0.6 else "ELEVATED"
+
+
+def _reference_ids(risk: Dict) -> str:
+    """Chunk id of a risk plus any near-duplicate chunks it covers"""
+    ids = [risk.get('chunk_id')] + risk.get('duplicate_chunk_ids', [])
+    return ", ".join(str(chunk_id) for chunk_id in ids)
+
+
+def _analysis_lines(llm_analysis: str) -> List[str]:
+    """Normalise LLM analysis lines into bullet-point formatting"""
+    lines = []
+    for line in llm_analysis.strip().split('\n'):
+        # If line starts with a number followed by period or a bullet already, keep it
+        if line.strip().startswith(('1.', '2.', '3.', '4.', '5.', '•', '-')):
+            lines.append(line)
+        # If line contains ** (header), keep it
+        elif '**' in line:
+            lines.append(line)
+        # Add bullet to plain lines
+        elif line.strip() and not line.startswith(' '):
+            lines.append(f"• {line.strip()}")
+        else:
+            lines.append(line)
+    return lines
+
+
+# ============================================================================
+# RENDERERS
+# ============================================================================
+
+def render_markdown(report_data: Dict) -> str:
+    """Render report as markdown (the original report format)"""
+    generated = _generated_at(report_data)
+    risks = report_data.get("risks", [])
+
+    if report_data.get("status") == "safe":
+        points = "\n".join(f"- **{title}** - {detail}" for title, detail in SAFE_POINTS)
+        return f"""## CONTRACT RISK ANALYSIS REPORT
+
+**Generated:** {generated.strftime('%B %d, %Y at %I:%M %p')}  
+**Total Chunks Analyzed:** {report_data.get('total_chunks', 0)}
+
+---
+
+## ✅ RESULT: SAFE CONTRACT
+
+### 🎉 Good News!
+
+No significant risks detected in this contract.
+
+### What This Means:
+
+{points}
+
+---
+
+### ⚖️ Disclaimer
+
+{SAFE_DISCLAIMER}
+
+---
+"""
+
+    lines = []
+
+    # Header
+    lines.append("## CONTRACT RISK ANALYSIS REPORT")
+    lines.append(f"**Generated:** {generated.strftime('%B %d, %Y at %I:%M %p')}")
+    lines.append(f"**Total Risks Found:** {len(risks)}")
+    lines.append("")
+    lines.append("---")
+    lines.append("")
+
+    # Risk Summary Section
+    lines.append("## 🚨 IDENTIFIED RISKS")
+    lines.append("")
+    lines.append(f"This contract contains **{len(risks)} significant risk(s)** that require attention:")
+    lines.append("")
+
+    for i, risk in enumerate(risks, 1):
+        if 'error' not in risk:
+            confidence = risk['confidence']
+            lines.append(f"**{i}. {risk['risk_type']}** [{_risk_level(confidence)} CONFIDENCE: {confidence:.1%}]")
+
+    lines.append("")
+    lines.append("---")
+    lines.append("")
+
+    # Detailed Risk Analysis
+    lines.append("## 📋 DETAILED RISK ANALYSIS")
+    lines.append("")
+
+    for i, risk in enumerate(risks, 1):
+        lines.append(f"### Risk #{i}: {risk['risk_type']}")
+        lines.append("")
+
+        if 'error' in risk:
+            lines.append(f"⚠️ **Analysis Status:** {risk['error']}")
+            lines.append("")
+            lines.append("---")
+            lines.append("")
+            continue
+
+        lines.append(f"**Confidence Level:** {risk['confidence']:.1%}")
+        lines.append(f"**Reference ID:** {_reference_ids(risk)}")
+        lines.append("")
+
+        lines.append("#### 📄 Original Risky Clause")
+        lines.append("")
+        lines.append("```")
+        lines.append(risk['original_clause'])
+        lines.append("```")
+        lines.append("")
+
+        lines.append("#### 🔍 Detailed Analysis")
+        lines.append("")
+        lines.extend(_analysis_lines(risk.get('llm_analysis', '')))
+
+        lines.append("")
+        lines.append("---")
+        lines.append("")
+
+    # Conclusion
+    lines.append("## ⚖️ Important Disclaimer")
+    lines.append("")
+    lines.append(DISCLAIMER)
+    lines.append("")
+    lines.append("### Recommendations:")
+    for title, detail in RECOMMENDATIONS:
+        lines.append(f"• {title} - {detail}")
+    lines.append("")
+    lines.append("---")
+    lines.append(f"**Report Generated:** {generated.strftime('%B %d, %Y at %I:%M %p UTC')}")
+
+    return "\n".join(lines)
+
+
+def _html_inline(text: str) -> str:
+    """Escape text and turn **bold** spans into <strong>"""
+    parts = html.escape(text).split("**")
+    return "".join(f"<strong>{part}</strong>" if i % 2 else part for i, part in enumerate(parts))
+
+
+def render_html(report_data: Dict) -> str:
+    """Render report as a self-contained HTML fragment"""
+    generated = _generated_at(report_data).strftime('%B %d, %Y at %I:%M %p')
+    risks = report_data.get("risks", [])
+    out = ['<article class="risk-report">', "<h2>Contract Risk Analysis Report</h2>"]
+
+    if report_data.get("status") == "safe":
+        out.append(f"<p><strong>Generated:</strong> {generated}<br>"
+                   f"<strong>Total Chunks Analyzed:</strong> {report_data.get('total_chunks', 0)}</p>")
+        out.append("<h2>✅ Result: Safe Contract</h2>")
+        out.append("<p>No significant risks detected in this contract.</p><ul>")
+        out.extend(f"<li><strong>{html.escape(t)}</strong> - {html.escape(d)}</li>" for t, d in SAFE_POINTS)
+        out.append("</ul>")
+        out.append(f"<h3>⚖️ Disclaimer</h3><p>{html.escape(SAFE_DISCLAIMER)}</p>")
+        out.append("</article>")
+        return "\n".join(out)
+
+    out.append(f"<p><strong>Generated:</strong> {generated}<br>"
+               f"<strong>Total Risks Found:</strong> {len(risks)}</p>")
+    out.append("<h2>🚨 Identified Risks</h2><ol>")
+    for risk in risks:
+        if 'error' not in risk:
+            confidence = risk['confidence']
+            out.append(f"<li><strong>{html.escape(risk['risk_type'])}</strong> "
+                       f"[{_risk_level(confidence)} CONFIDENCE: {confidence:.1%}]</li>")
+    out.append("</ol>")
+
+    out.append("<h2>📋 Detailed Risk Analysis</h2>")
+    for i, risk in enumerate(risks, 1):
+        out.append(f"<section><h3>Risk #{i}: {html.escape(risk['risk_type'])}</h3>")
+        if 'error' in risk:
+            out.append(f"<p>⚠️ <strong>Analysis Status:</strong> {html.escape(risk['error'])}</p></section>")
+            continue
+        out.append(f"<p><strong>Confidence Level:</strong> {risk['confidence']:.1%}<br>"
+                   f"<strong>Reference ID:</strong> {html.escape(_reference_ids(risk))}</p>")
+        out.append("<h4>📄 Original Risky Clause</h4>")
+        out.append(f"<pre>{html.escape(risk['original_clause'])}</pre>")
+        out.append("<h4>🔍 Detailed Analysis</h4>")
+        for line in _analysis_lines(risk.get('llm_analysis', '')):
+            if line.strip():
+                out.append(f"<p>{_html_inline(line.strip())}</p>")
+        out.append("</section>")
+
+    out.append(f"<h2>⚖️ Important Disclaimer</h2><p>{_html_inline(DISCLAIMER)}</p>")
+    out.append("<h3>Recommendations:</h3><ul>")
+    out.extend(f"<li>{html.escape(t)} - {html.escape(d)}</li>" for t, d in RECOMMENDATIONS)
+    out.append("</ul></article>")
+    return "\n".join(out)
+
+
+def render_text(report_data: Dict) -> str:
+    """Render report as plain text (no markup)"""
+    lines = []
+    for line in render_markdown(report_data).split("\n"):
+        stripped = line.lstrip("#").strip() if line.startswith("#") else line
+        if stripped in ("```", "---"):
+            stripped = "" if stripped == "```" else "-" * 70
+        lines.append(stripped.replace("**", ""))
+    return "\n".join(lines)
+
+
+RENDERERS = {
+    "markdown": render_markdown,
+    "html": render_html,
+    "text": render_text,
+}
+
+
+def render_report(report_data: Dict, fmt: str = "markdown") -> str:
+    """Render structured report data in the requested format"""
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unsupported report format: {fmt}")
+    return RENDERERS[fmt](report_data)
+
+
+# ============================================================================
+# RENDER CACHE
+# ============================================================================
+
+class ReportCache:
+    """
+    Bounded LRU of structured reports and their rendered outputs
+
+    Reports are immutable once generated, so entries are keyed by document id
+    and validated by the report's content hash (ETag).
+    """
+
+    def __init__(self, max_documents: int = 256, max_rendered_bytes: int = 64 * 1024 * 1024):
+        self.max_documents = max_documents
+        self.max_rendered_bytes = max_rendered_bytes
+        self.reports: "OrderedDict[str, Tuple[str, Dict]]" = OrderedDict()
+        self.rendered: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self.rendered_bytes = 0
+        self.lock = threading.Lock()
+
+    def put_report(self, document_id: str, report_data: Dict) -> str:
+        """Cache structured report data; return its ETag"""
+        etag = report_etag(report_data)
+        with self.lock:
+            self.reports[document_id] = (etag, report_data)
+            self.reports.move_to_end(document_id)
+            while len(self.reports) > self.max_documents:
+                self.reports.popitem(last=False)
+        return etag
+
+    def get_report(self, document_id: str) -> Optional[Tuple[str, Dict]]:
+        """Cached (etag, report_data) for a document, if any"""
+        with self.lock:
+            entry = self.reports.get(document_id)
+            if entry:
+                self.reports.move_to_end(document_id)
+            return entry
+
+    def render(self, etag: str, report_data: Dict, fmt: str) -> str:
+        """Rendered report, from cache when this version was rendered before"""
+        key = (etag, fmt)
+        with self.lock:
+            if key in self.rendered:
+                self.rendered.move_to_end(key)
+                return self.rendered[key]
+
+        output = render_report(report_data, fmt)
+
+        with self.lock:
+            if key not in self.rendered:
+                self.rendered[key] = output
+                self.rendered_bytes += len(output)
+            while self.rendered_bytes > self.max_rendered_bytes and len(self.rendered) > 1:
+                _, evicted = self.rendered.popitem(last=False)
+                self.rendered_bytes -= len(evicted)
+        return output
+
+    def invalidate(self, document_id: str):
+        """Forget a document's report (rendered outputs age out by ETag)"""
+        with self.lock:
+            self.reports.pop(document_id, None)
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_report_cache: Optional[ReportCache] = None
+
+
+def get_report_cache() -> ReportCache:
+    """Get or create the report cache"""
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = ReportCache()
+    return _report_cache
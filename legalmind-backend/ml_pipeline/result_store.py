@@ -0,0 +1,252 @@
+"""
+result_store.py
+===============
+Memory-bounded retention of job results
+Completed job results (report data, risky and safe chunks) are kept hot in
+memory under a byte budget and a TTL; least recently used results beyond
+either are spilled to compressed files on local disk and loaded back
+transparently on the next read. Idle results are swept on a timer, so they
+spill even when no job is being read or written.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class ResultRetentionConfig:
+    """Job result retention settings (from .env)"""
+
+    MEMORY_BUDGET_MB = float(os.getenv("JOB_RESULTS_MEMORY_MB", "256"))
+    HOT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "1800"))  # Idle time before spilling
+
+    SPILL_DIR = os.getenv("JOB_RESULT_SPILL_DIR", "job_results")
+    SPILL_RETENTION_SECONDS = float(os.getenv("JOB_RESULT_RETENTION_DAYS", "7")) * 24 * 3600
+    SWEEP_SECONDS = float(os.getenv("JOB_RESULT_SWEEP_SECONDS", "60"))  # TTL sweep (and hourly purge) timer
+    PURGE_EVERY_SECONDS = 3600
+    COMPRESSION_LEVEL = 6
+
+    # Python objects take several times their compact JSON size
+    MEMORY_FACTOR = 4
+
+
+# ============================================================================
+# SPILL STORE
+# ============================================================================
+
+class ResultSpillStore:
+    """One zlib-compressed JSON file per result"""
+
+    SUFFIX = ".json.z"
+
+    def __init__(self, root: str = ResultRetentionConfig.SPILL_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.root, f"{job_id}{self.SUFFIX}")
+
+    def put(self, job_id: str, encoded: bytes) -> int:
+        """Write compact JSON bytes (atomically); returns bytes on disk"""
+        data = zlib.compress(encoded, ResultRetentionConfig.COMPRESSION_LEVEL)
+        tmp_path = os.path.join(self.root, f".tmp-{job_id}-{uuid.uuid4().hex[:8]}")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(job_id))
+        return len(data)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        try:
+            with open(self._path(job_id), 'rb') as f:
+                return json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, job_id: str):
+        try:
+            os.remove(self._path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def purge(self, max_age: float = ResultRetentionConfig.SPILL_RETENTION_SECONDS) -> int:
+        """Delete spilled results older than max_age seconds (and leftover temp files)"""
+        removed = 0
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if name.startswith(".tmp-") or os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+# ============================================================================
+# RETENTION
+# ============================================================================
+
+class ResultRetention:
+    """
+    Hot results in LRU order, bounded by bytes and idle time
+
+    put()/get() are the only way in and out; a result that is not hot is read
+    back from the spill store (and becomes hot again). A result being spilled
+    stays readable from memory until its file is written.
+    """
+
+    def __init__(
+        self,
+        memory_budget_mb: float = ResultRetentionConfig.MEMORY_BUDGET_MB,
+        hot_ttl: float = ResultRetentionConfig.HOT_TTL_SECONDS,
+        spill_store: Optional[ResultSpillStore] = None,
+        sweep_seconds: float = ResultRetentionConfig.SWEEP_SECONDS
+    ):
+        self.budget = int(memory_budget_mb * 1024 * 1024)
+        self.hot_ttl = hot_ttl
+        self.spill = spill_store or ResultSpillStore()
+        self.hot: "OrderedDict[str, tuple]" = OrderedDict()  # job_id -> (result, bytes, last_access)
+        self.spilling: Dict[str, Dict] = {}  # Left hot, spill file not written yet
+        self.on_disk = set()  # Results with an up-to-date spill file (results never change)
+        self.hot_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {"spills": 0, "reloads": 0, "spill_bytes": 0}
+        self.spill.purge()
+        self.stopping = threading.Event()
+        if sweep_seconds > 0:
+            threading.Thread(
+                target=self._sweep, args=(sweep_seconds,), name="result-sweep", daemon=True
+            ).start()
+
+    def _sweep(self, interval: float):
+        """Spill idle results (and purge old spill files) on a timer"""
+        last_purge = time.monotonic()
+        while not self.stopping.wait(interval):
+            try:
+                self._evict()
+                if time.monotonic() - last_purge >= ResultRetentionConfig.PURGE_EVERY_SECONDS:
+                    last_purge = time.monotonic()
+                    self.spill.purge()
+            except Exception as e:
+                print(f"⚠️  Result sweep failed: {e}")
+
+    def stop(self):
+        self.stopping.set()
+
+    def _admit(self, job_id: str, result: Dict, size: int):
+        """Caller holds the lock"""
+        old = self.hot.pop(job_id, None)
+        if old:
+            self.hot_bytes -= old[1]
+        self.hot[job_id] = (result, size, time.monotonic())
+        self.hot_bytes += size
+
+    def _evict(self):
+        """Spill idle or over-budget results, least recently used first"""
+        now = time.monotonic()
+        while True:
+            with self.lock:
+                if not self.hot:
+                    return
+                job_id, (result, size, last_access) = next(iter(self.hot.items()))
+                over_budget = self.hot_bytes > self.budget and len(self.hot) > 1
+                if not over_budget and now - last_access < self.hot_ttl:
+                    return
+                del self.hot[job_id]
+                self.hot_bytes -= size
+                if job_id in self.on_disk:
+                    continue  # Spilled before and reloaded: the file is still current
+                # get() keeps finding it here until the file is written
+                self.spilling[job_id] = result
+            try:
+                written = self.spill.put(job_id, json.dumps(result, separators=(',', ':'), default=str).encode('utf-8'))
+            except OSError as e:
+                print(f"⚠️  Could not spill result for {job_id}: {e}")
+                with self.lock:
+                    if self.spilling.get(job_id) is result:
+                        del self.spilling[job_id]
+                        self._admit(job_id, result, size)  # Keep it rather than lose it
+                return
+            with self.lock:
+                current = self.spilling.get(job_id) is result
+                if current:
+                    del self.spilling[job_id]
+                    self.on_disk.add(job_id)
+                    self.stats["spills"] += 1
+                    self.stats["spill_bytes"] += written
+                # Replaced or deleted while writing: the file is stale unless a newer one owns it
+                stale = not current and job_id not in self.hot and job_id not in self.spilling \
+                    and job_id not in self.on_disk
+            if stale:
+                self.spill.delete(job_id)
+
+    def put(self, job_id: str, result: Dict):
+        size = len(json.dumps(result, separators=(',', ':'), default=str)) * ResultRetentionConfig.MEMORY_FACTOR
+        with self.lock:
+            self.on_disk.discard(job_id)
+            self.spilling.pop(job_id, None)
+            self._admit(job_id, result, size)
+        self.spill.delete(job_id)
+        self._evict()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self.lock:
+            entry = self.hot.get(job_id)
+            if entry is not None:
+                self.hot[job_id] = (entry[0], entry[1], time.monotonic())
+                self.hot.move_to_end(job_id)
+                result = entry[0]
+            else:
+                result = self.spilling.get(job_id)
+        if entry is not None:
+            self._evict()
+            return result
+        if result is not None:
+            return result  # Spill in progress
+
+        result = self.spill.get(job_id)
+        if result is None:
+            with self.lock:
+                self.on_disk.discard(job_id)  # Purged
+            return None
+        size = len(json.dumps(result, separators=(',', ':'), default=str)) * ResultRetentionConfig.MEMORY_FACTOR
+        with self.lock:
+            self.on_disk.add(job_id)
+            self._admit(job_id, result, size)
+            self.stats["reloads"] += 1
+        self._evict()
+        return result
+
+    def delete(self, job_id: str):
+        with self.lock:
+            entry = self.hot.pop(job_id, None)
+            if entry:
+                self.hot_bytes -= entry[1]
+            self.on_disk.discard(job_id)
+            self.spilling.pop(job_id, None)
+        self.spill.delete(job_id)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                **self.stats,
+                "hot_results": len(self.hot),
+                "hot_bytes_estimate": self.hot_bytes,
+                "memory_budget_bytes": self.budget,
+                "spilled_results": len(self.on_disk - self.hot.keys()),
+                "spilling_results": len(self.spilling),
+            }
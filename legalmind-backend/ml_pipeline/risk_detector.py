@@ -9,10 +9,13 @@ import json
 import os
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import sys
 from huggingface_hub import snapshot_download
 
+from ml_pipeline.clause_dedup import mark_shared_overlaps
+from ml_pipeline.job_events import ProgressCallback, report_progress
+
 
 # ============================================================================
 # CONFIGURATION
@@ -34,6 +37,7 @@ class Config:
     
     # Risk Detection Settings
     CONFIDENCE_THRESHOLD = 0.70
+    CLASSIFY_BATCH_SIZE = 32  # Chunks per predict_batch() call, when the ensemble has one
     
     @classmethod
     def setup_directories(cls):
@@ -104,35 +108,114 @@ class RiskDetectionPipeline:
         print("✓ Model loaded successfully\n")
 
     
-    def process_chunks(self, chunks_file: str) -> Dict:
+    def classify(self, texts: List[str], progress: Optional[ProgressCallback] = None) -> List[Dict]:
+        """
+        Predict a label for each text
+        
+        Uses the ensemble's predict_batch() in batches of CLASSIFY_BATCH_SIZE
+        when it has one, and per-text predict() otherwise.
+        """
+        predict_batch = getattr(self.ensemble, "predict_batch", None)
+        results = []
+        if predict_batch is None:
+            for text in texts:
+                results.append(self.ensemble.predict(text))
+                report_progress(progress, len(results), len(texts))
+            return results
+        
+        for start in range(0, len(texts), Config.CLASSIFY_BATCH_SIZE):
+            results.extend(predict_batch(texts[start:start + Config.CLASSIFY_BATCH_SIZE]))
+            report_progress(progress, len(results), len(texts))
+        return results
+    
+    def process_chunks(self, chunks_file: str, progress: Optional[ProgressCallback] = None) -> Dict:
         """
         Load chunks, detect risks, save results
         
         Args:
             chunks_file: Path to chunks JSON from Document_loader.py
+            progress: Optional callback receiving (classified, total) per chunk
         
         Returns:
             Dictionary with file paths and statistics
         """
-        print(f"{'='*70}")
-        print("RISK DETECTION PIPELINE")
-        print(f"{'='*70}\n")
-        
         # Load chunks
         with open(chunks_file, 'r', encoding='utf-8') as f:
             chunks = json.load(f)
         
+        result = self.detect(chunks, self._doc_name(chunks_file), progress)
+        self._remove_chunks_file(chunks_file)
+        return result
+    
+    def detect(self, chunks: List[Dict], doc_name: str, progress: Optional[ProgressCallback] = None,
+               save: bool = True) -> Dict:
+        """
+        Detect risks in chunks already in memory
+        
+        The result carries the split chunks ('risky_chunks', 'safe_chunks');
+        with save, they are also written to the results directories.
+        """
+        print(f"{'='*70}")
+        print("RISK DETECTION PIPELINE")
+        print(f"{'='*70}\n")
+        
         print(f"Loaded {len(chunks)} chunks\n")
         
         # Detect risks
+        print("Analyzing chunks...")
+        predictions = self.classify([chunk['text'] for chunk in chunks], progress)
+        return self._save_results(doc_name, chunks, predictions, save)
+    
+    def process_chunk_files(self, chunks_files: List[str], progress: Optional[ProgressCallback] = None) -> List[Dict]:
+        """
+        process_chunks() for several documents, classifying their chunks in shared batches
+        
+        Returns one result per file, in order.
+        """
+        documents = []
+        for chunks_file in chunks_files:
+            with open(chunks_file, 'r', encoding='utf-8') as f:
+                documents.append((self._doc_name(chunks_file), json.load(f)))
+        
+        results = self.detect_batch(documents, progress)
+        for chunks_file in chunks_files:
+            self._remove_chunks_file(chunks_file)
+        return results
+    
+    def detect_batch(self, documents: List[Tuple[str, List[Dict]]], progress: Optional[ProgressCallback] = None,
+                     save: bool = True) -> List[Dict]:
+        """detect() for several (doc_name, chunks) documents, classifying in shared batches"""
+        print(f"{'='*70}")
+        print(f"RISK DETECTION PIPELINE (BATCH OF {len(documents)})")
+        print(f"{'='*70}\n")
+        
+        texts = [chunk['text'] for _, chunks in documents for chunk in chunks]
+        print(f"Loaded {len(texts)} chunks from {len(documents)} documents\n")
+        
+        print("Analyzing chunks...")
+        predictions = self.classify(texts, progress)
+        
+        results, offset = [], 0
+        for doc_name, chunks in documents:
+            results.append(self._save_results(doc_name, chunks, predictions[offset:offset + len(chunks)], save))
+            offset += len(chunks)
+        return results
+    
+    @staticmethod
+    def _doc_name(chunks_file: str) -> str:
+        return Path(chunks_file).stem.replace('_chunks', '')
+    
+    @staticmethod
+    def _remove_chunks_file(chunks_file: str):
+        os.remove(chunks_file)
+        print(f"✓ Deleted original chunks file: {chunks_file}")
+    
+    def _save_results(self, doc_name: str, chunks: List[Dict], predictions: List[Dict], save: bool = True) -> Dict:
+        """Split one document's chunks into risky/safe by prediction (and save both)"""
         risky_chunks = []
         safe_chunks = []
         
-        print("Analyzing chunks...")
-        for i, chunk in enumerate(chunks):
-            # Predict
-            result = self.ensemble.predict(chunk['text'])
-            
+        for i, (chunk, result) in enumerate(zip(chunks, predictions)):
             # Add prediction to chunk
             chunk['prediction'] = {
                 'label': result['label'],
@@ -152,8 +235,22 @@ class RiskDetectionPipeline:
         
         print(f"\n✓ Analysis complete: {len(risky_chunks)} risky, {len(safe_chunks)} safe\n")
         
+        # Risky neighbours may share one clause through the splitter overlap
+        mark_shared_overlaps(risky_chunks, self.classify, Config.CONFIDENCE_THRESHOLD)
+        
+        result = {
+            'risky_chunks': risky_chunks,
+            'safe_chunks': safe_chunks,
+            'risky_chunks_file': None,
+            'safe_chunks_file': None,
+            'risky_count': len(risky_chunks),
+            'safe_count': len(safe_chunks),
+            'total_chunks': len(chunks)
+        }
+        if not save:
+            return result
+        
         # Save results
-        doc_name = Path(chunks_file).stem.replace('_chunks', '')
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
         # Save risky chunks
@@ -172,23 +269,15 @@ class RiskDetectionPipeline:
         with open(safe_path, 'w', encoding='utf-8') as f:
             json.dump(safe_chunks, f, indent=2, ensure_ascii=False)
         
-        # Delete original chunks file
-        os.remove(chunks_file)
-        print(f"✓ Deleted original chunks file: {chunks_file}")
-        
         print(f"\n{'='*70}")
         print("RESULTS SAVED")
         print(f"{'='*70}")
         print(f"Risky chunks: {risky_path}")
         print(f"Safe chunks:  {safe_path}\n")
         
-        return {
-            'risky_chunks_file': risky_path,
-            'safe_chunks_file': safe_path,
-            'risky_count': len(risky_chunks),
-            'safe_count': len(safe_chunks),
-            'total_chunks': len(chunks)
-        }
+        result['risky_chunks_file'] = risky_path
+        result['safe_chunks_file'] = safe_path
+        return result
 
 
 # ============================================================================
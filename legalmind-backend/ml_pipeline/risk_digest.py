@@ -0,0 +1,188 @@
+"""
+risk_digest.py
+==============
+Compact, ranked digest of a document's detected risks for risk questions
+Built once when analysis completes and saved inside the FAISS index directory
+(so it is uploaded to and hydrated from Supabase with the vector store). Each
+entry is a short line per risk with a pointer (rank + chunk id) back to the
+full clause and analysis, and the whole digest fits a token budget.
+"""
+
+import json
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from ml_pipeline.prompt_budget import PromptItem, get_token_counter
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class DigestConfig:
+    """Risk digest settings (from .env)"""
+
+    DIGEST_FILE = "risk_digest.json"
+    DIGEST_VERSION = 1
+
+    # Whole digest and per-entry token bounds
+    MAX_TOKENS = int(os.getenv("RISK_DIGEST_MAX_TOKENS", "1500"))
+    CLAUSE_TOKENS = 60
+    KEY_POINT_TOKENS = 50
+
+
+# Asks for the full text of one digest entry ("risk #2", "chunk 14")
+_RISK_REF = re.compile(r"\brisk\s*(?:#|no\.?|number)?\s*(\d+)\b", re.IGNORECASE)
+_CHUNK_REF = re.compile(r"\bchunk\s*(?:id\s*)?#?\s*([\w-]+)\b", re.IGNORECASE)
+
+
+def _normalize_risk(risk: Dict) -> Optional[Dict]:
+    """
+    Common fields of a full advisory, a raw risky chunk or a report risk
+
+    Returns None for failed advisories and for chunks folded into a duplicate.
+    """
+    if "error" in risk or risk.get("duplicate_of") is not None:
+        return None
+    detection = risk.get("risk_detection") or {}
+    prediction = risk.get("prediction") or {}
+    return {
+        "chunk_id": risk.get("chunk_id", risk.get("id")),
+        "risk_type": risk.get("risk_type") or detection.get("risk_type") or prediction.get("label", "Unknown"),
+        "confidence": float(risk.get("confidence", detection.get("confidence", prediction.get("confidence", 0.0))) or 0.0),
+        "clause": risk.get("original_clause") or risk.get("text") or "",
+        "analysis": risk.get("llm_analysis") or "",
+        "covers": risk.get("duplicate_chunk_ids", []),
+    }
+
+
+def _key_point(analysis: str) -> str:
+    """First substantive line of an LLM analysis, without markdown"""
+    for line in analysis.splitlines():
+        line = re.sub(r"[*#`_]+", "", line).strip(" -•\t")
+        line = re.sub(r"^\d+[.)]\s*", "", line)
+        # Skip bare headings such as "Risk Explanation:"
+        if len(line) > 30:
+            return line
+    return ""
+
+
+# ============================================================================
+# DIGEST
+# ============================================================================
+
+@dataclass
+class DigestEntry:
+    rank: int                    # 1 = highest confidence
+    chunk_id: Optional[object]   # Pointer to the full clause/analysis
+    risk_type: str
+    confidence: float
+    clause_excerpt: str
+    key_point: str
+    covers: List = field(default_factory=list)
+
+    def line(self) -> str:
+        text = f"RISK #{self.rank}: {self.risk_type} ({self.confidence:.0%}) [chunk {self.chunk_id}]"
+        if self.clause_excerpt:
+            text += f"\n  Clause: \"{self.clause_excerpt}\""
+        if self.key_point:
+            text += f"\n  Why: {self.key_point}"
+        return text
+
+    def short_line(self) -> str:
+        return f"RISK #{self.rank}: {self.risk_type} ({self.confidence:.0%}) [chunk {self.chunk_id}]"
+
+
+class RiskDigest:
+    """Ranked, token-bounded risk summary for one analysed document"""
+
+    def __init__(self, entries: List[DigestEntry], total_risks: int, omitted: int = 0):
+        self.entries = entries
+        self.total_risks = total_risks
+        self.omitted = omitted
+
+    @classmethod
+    def build(cls, risks: List[Dict], max_tokens: int = DigestConfig.MAX_TOKENS) -> "RiskDigest":
+        """Rank risks by confidence and keep as many compact entries as fit max_tokens (at least one)"""
+        counter = get_token_counter()
+        normalized = [r for r in (_normalize_risk(risk) for risk in risks) if r is not None]
+        normalized.sort(key=lambda r: r["confidence"], reverse=True)
+
+        entries, used = [], 0
+        for rank, risk in enumerate(normalized, 1):
+            entry = DigestEntry(
+                rank=rank,
+                chunk_id=risk["chunk_id"],
+                risk_type=risk["risk_type"],
+                confidence=risk["confidence"],
+                clause_excerpt=counter.truncate(" ".join(str(risk["clause"]).split()), DigestConfig.CLAUSE_TOKENS),
+                key_point=counter.truncate(_key_point(risk["analysis"]), DigestConfig.KEY_POINT_TOKENS),
+                covers=list(risk["covers"]),
+            )
+            cost = counter.count(entry.line())
+            if entries and used + cost > max_tokens:
+                break
+            entries.append(entry)
+            used += cost
+
+        return cls(entries, total_risks=len(normalized), omitted=len(normalized) - len(entries))
+
+    def prompt_items(self) -> List[PromptItem]:
+        """Digest entries as budget items (the short line is the over-budget fallback)"""
+        items = [
+            PromptItem(text=entry.line(), priority=entry.confidence, summary=entry.short_line())
+            for entry in self.entries
+        ]
+        if self.omitted:
+            items.append(PromptItem(
+                text=f"({self.omitted} lower-confidence risk(s) not listed)", priority=-1.0
+            ))
+        return items
+
+    def referenced(self, query: str) -> List[DigestEntry]:
+        """Entries the query points at by rank ("risk #2") or chunk id ("chunk 14")"""
+        ranks = {int(m) for m in _RISK_REF.findall(query)}
+        chunk_ids = {m.lower() for m in _CHUNK_REF.findall(query)}
+        return [
+            entry for entry in self.entries
+            if entry.rank in ranks or str(entry.chunk_id).lower() in chunk_ids
+        ]
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": DigestConfig.DIGEST_VERSION,
+            "total_risks": self.total_risks,
+            "omitted": self.omitted,
+            "entries": [asdict(entry) for entry in self.entries],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> Optional["RiskDigest"]:
+        if not data or data.get("version") != DigestConfig.DIGEST_VERSION:
+            return None
+        entries = [DigestEntry(**entry) for entry in data.get("entries", [])]
+        return cls(entries, total_risks=data.get("total_risks", len(entries)), omitted=data.get("omitted", 0))
+
+    def save(self, index_dir: str) -> str:
+        path = os.path.join(index_dir, DigestConfig.DIGEST_FILE)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, separators=(',', ':'), ensure_ascii=False)
+        return path
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["RiskDigest"]:
+        """Load a saved digest (None for vector stores saved before digests existed)"""
+        path = os.path.join(index_dir, DigestConfig.DIGEST_FILE)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
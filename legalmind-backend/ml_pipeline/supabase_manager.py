@@ -5,9 +5,12 @@ Handles all Supabase database and storage operations
 Optimized for memory efficiency with streaming and cleanup
 """
 
+import asyncio
 import json
 import os
 import io
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
@@ -18,6 +21,11 @@ try:
 except ImportError:
     print("⚠️  Supabase client not installed. Install with: pip install supabase")
 
+try:
+    from supabase import acreate_client, AsyncClient
+except ImportError:
+    acreate_client = None
+
 load_dotenv()
 
 
@@ -38,6 +46,12 @@ class SupabaseManager:
         client_key = self.service_role_key if self.service_role_key else self.supabase_key
         self.client: Client = create_client(self.supabase_url, client_key)
         
+        # Async client for request handlers, created on first use inside the event loop
+        self._client_key = client_key
+        self._async_client = None
+        self._async_client_lock = asyncio.Lock()
+        self._async_limit = asyncio.Semaphore(int(os.getenv("SUPABASE_MAX_CONCURRENCY", "32")))
+        
         # Also keep anon client for auth operations
         if self.supabase_key != client_key:
             self.anon_client: Client = create_client(self.supabase_url, self.supabase_key)
@@ -188,7 +202,7 @@ class SupabaseManager:
                     "risk_label": chunk.get('prediction', {}).get('label', 'Unknown'),
                     "confidence_score": confidence,
                     "severity": severity,
-                    "llm_analysis": None,  # Will be updated later if available
+                    "llm_analysis": chunk.get('llm_analysis'),  # Shared by near-duplicate chunks
                 })
             
             # Batch insert
@@ -334,15 +348,20 @@ class SupabaseManager:
         self,
         document_id: str,
         user_id: str,
-        vector_store_path: str
+        vector_store_path: Optional[str] = None,
+        archive: Optional[bytes] = None
     ) -> str:
-        """Upload FAISS vector store to Supabase storage"""
+        """Upload FAISS vector store to Supabase storage (a local path, or an already zipped archive)"""
         try:
             import zipfile
             from io import BytesIO
             
+            if archive is not None:
+                # Serialized in memory (zero-disk pipeline): same layout as a zipped directory
+                file_data = archive
+                remote_path = f"documents/{user_id}/{document_id}/vector_store.zip"
             # Check if path is a directory (FAISS index directory)
-            if os.path.isdir(vector_store_path):
+            elif os.path.isdir(vector_store_path):
                 # Zip the entire directory
                 zip_buffer = BytesIO()
                 with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
@@ -443,6 +462,45 @@ class SupabaseManager:
             print(f"❌ Error uploading report: {e}")
             raise
     
+    def upload_report_data(
+        self,
+        document_id: str,
+        user_id: str,
+        report_data: Dict
+    ) -> str:
+        """Upload structured report (compact JSON) to Supabase storage"""
+        try:
+            file_data = json.dumps(report_data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            remote_path = f"documents/{user_id}/{document_id}/report.json"
+            
+            self.client.storage.from_("reports").upload(
+                remote_path,
+                file_data,
+                {"cacheControl": "3600", "contentType": "application/json"}
+            )
+            
+            print(f"✓ Report data uploaded: {remote_path}")
+            return remote_path
+            
+        except Exception as e:
+            print(f"❌ Error uploading report data: {e}")
+            raise
+    
+    def get_report_data(
+        self,
+        document_id: str,
+        user_id: str
+    ) -> Optional[Dict]:
+        """Retrieve structured report from Supabase storage (None for legacy text reports)"""
+        try:
+            remote_path = f"documents/{user_id}/{document_id}/report.json"
+            response = self.client.storage.from_("reports").download(remote_path)
+            return json.loads(response.decode('utf-8'))
+            
+        except Exception as e:
+            print(f"⚠️  Structured report not found for {document_id}: {e}")
+            return None
+    
     def get_report(
         self,
         document_id: str,
@@ -463,6 +521,154 @@ class SupabaseManager:
             print(f"❌ Error retrieving report: {e}")
             return None
     
+    # ========================================================================
+    # ANALYSIS PERSISTENCE
+    # ========================================================================
+    
+    def save_analysis_results(
+        self,
+        user_id: str,
+        document_id: str,
+        filename: str,
+        risk_score: float,
+        risky_chunks_count: int,
+        total_chunks: int,
+        risky_chunks: List[Dict],
+        vector_store_path: Optional[str],
+        report_data: Dict,
+        vector_store_archive: Optional[bytes] = None
+    ) -> Dict:
+        """
+        Persist a completed analysis, running independent writes concurrently
+        
+        risky_chunks rows reference the documents row, so they are inserted
+        after the metadata write; the vector store and report uploads do not
+        depend on it and run alongside. A failed write does not stop the
+        others. Returns {"wall_seconds": s, "writes": {name: {"ok", "seconds",
+        "error"?}}}. The vector store is uploaded from vector_store_archive
+        when given, else from vector_store_path.
+        """
+        writes: Dict[str, Dict] = {}
+        
+        def timed(name: str, write, **kwargs):
+            start = time.perf_counter()
+            try:
+                write(**kwargs)
+                writes[name] = {"ok": True, "seconds": round(time.perf_counter() - start, 3)}
+            except Exception as e:
+                writes[name] = {"ok": False, "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+        
+        def metadata_then_chunks():
+            timed(
+                "document_metadata", self.save_document_metadata,
+                user_id=user_id,
+                filename=filename,
+                document_id=document_id,
+                risk_score=risk_score,
+                risky_chunks_count=risky_chunks_count,
+                total_chunks=total_chunks,
+                status="completed"
+            )
+            if not risky_chunks:
+                return
+            if writes["document_metadata"]["ok"]:
+                timed("risky_chunks", self.save_risky_chunks_batch, document_id=document_id, chunks=risky_chunks)
+            else:
+                writes["risky_chunks"] = {"ok": False, "seconds": 0.0, "error": "Skipped: document metadata not saved"}
+        
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="supabase-write") as pool:
+            futures = [
+                pool.submit(metadata_then_chunks),
+                pool.submit(
+                    timed, "vector_store", self.upload_vector_store,
+                    document_id=document_id, user_id=user_id,
+                    vector_store_path=vector_store_path, archive=vector_store_archive
+                ),
+                pool.submit(
+                    timed, "report_data", self.upload_report_data,
+                    document_id=document_id, user_id=user_id, report_data=report_data
+                ),
+            ]
+            for future in futures:
+                future.result()
+        
+        return {"wall_seconds": round(time.perf_counter() - start, 3), "writes": writes}
+    
+    # ========================================================================
+    # ASYNC READ OPERATIONS (used by async request handlers)
+    # ========================================================================
+    
+    async def get_async_client(self) -> "AsyncClient":
+        """Get or create the async Supabase client"""
+        if self._async_client is None:
+            if acreate_client is None:
+                raise RuntimeError("Installed supabase client has no async support. Upgrade with: pip install -U supabase")
+            async with self._async_client_lock:
+                if self._async_client is None:
+                    self._async_client = await acreate_client(self.supabase_url, self._client_key)
+        return self._async_client
+    
+    async def aget_document(self, document_id: str, columns: str = "*") -> Optional[Dict]:
+        """Async get_document()"""
+        try:
+            client = await self.get_async_client()
+            async with self._async_limit:
+                response = await client.table("documents") \
+                    .select(columns) \
+                    .eq("id", document_id) \
+                    .single() \
+                    .execute()
+            
+            return response.data
+            
+        except Exception as e:
+            print(f"❌ Error retrieving document: {e}")
+            return None
+    
+    async def alist_documents(self, user_id: str, columns: str = "*") -> Optional[List[Dict]]:
+        """Completed documents owned by a user (None if they could not be listed)"""
+        try:
+            client = await self.get_async_client()
+            async with self._async_limit:
+                response = await client.table("documents") \
+                    .select(columns) \
+                    .eq("user_id", user_id) \
+                    .eq("status", "completed") \
+                    .execute()
+            
+            return response.data or []
+            
+        except Exception as e:
+            print(f"❌ Error listing documents: {e}")
+            return None
+    
+    async def aget_report_data(self, document_id: str, user_id: str) -> Optional[Dict]:
+        """Async get_report_data()"""
+        try:
+            client = await self.get_async_client()
+            remote_path = f"documents/{user_id}/{document_id}/report.json"
+            async with self._async_limit:
+                response = await client.storage.from_("reports").download(remote_path)
+            return json.loads(response.decode('utf-8'))
+            
+        except Exception as e:
+            print(f"⚠️  Structured report not found for {document_id}: {e}")
+            return None
+    
+    async def aget_report(self, document_id: str, user_id: str) -> Optional[str]:
+        """Async get_report()"""
+        try:
+            client = await self.get_async_client()
+            remote_path = f"documents/{user_id}/{document_id}/report.txt"
+            async with self._async_limit:
+                response = await client.storage.from_("reports").download(remote_path)
+            return response.decode('utf-8')
+            
+        except Exception as e:
+            print(f"❌ Error retrieving report: {e}")
+            return None
+    
     # ========================================================================
     # CLEANUP OPERATIONS
     # ========================================================================
@@ -482,10 +688,13 @@ class SupabaseManager:
             except:
                 pass
             
-            # Delete report
+            # Delete report (structured and legacy text)
             try:
                 self.client.storage.from_("reports").remove(
-                    [f"documents/{user_id}/{document_id}/report.txt"]
+                    [
+                        f"documents/{user_id}/{document_id}/report.json",
+                        f"documents/{user_id}/{document_id}/report.txt",
+                    ]
                 )
             except:
                 pass
@@ -0,0 +1,239 @@
+"""
+upload_stream.py
+================
+Streaming ingestion of PDF uploads
+The multipart request body is parsed as it arrives and each file part is
+written to disk asynchronously in chunks, in a single pass that also enforces
+the size limit, computes a SHA-256 of the content (dedup and integrity) and
+checks the PDF header as soon as the first bytes are in. Nothing is spooled
+in memory or to a temporary file first.
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiofiles
+from dotenv import load_dotenv
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class UploadStreamConfig:
+    """Streaming upload settings"""
+
+    FIELD_NAME = "file"
+
+    # PDF readers accept the "%PDF-" marker anywhere in the first 1024 bytes
+    PDF_MAGIC = b"%PDF-"
+    HEADER_SCAN_BYTES = 1024
+
+    # Room for multipart boundaries and part headers when checking Content-Length
+    MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+    HASH_READ_BYTES = 1024 * 1024
+
+
+class UploadRejected(Exception):
+    """Upload refused; status_code is the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    filename: str
+    size: int
+    sha256: str
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file on disk (integrity check before processing)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(UploadStreamConfig.HASH_READ_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ============================================================================
+# STREAMING WRITER
+# ============================================================================
+
+class _PdfPartWriter:
+    """Size, hash and header checks for the file part, fed chunk by chunk"""
+
+    def __init__(self, path: str, max_bytes: int, filename: str):
+        self.path = path
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.head = b""
+        self.header_ok = False
+        self.finished = False
+        self.file = None
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejected(413, f"'{self.filename}' is too large. Max {self.max_bytes // 1024 // 1024}MB allowed")
+
+        if not self.header_ok:
+            self.head += data[:UploadStreamConfig.HEADER_SCAN_BYTES]
+            if UploadStreamConfig.PDF_MAGIC in self.head[:UploadStreamConfig.HEADER_SCAN_BYTES]:
+                self.header_ok = True
+            elif len(self.head) >= UploadStreamConfig.HEADER_SCAN_BYTES:
+                raise UploadRejected(400, f"'{self.filename}' is not a valid PDF (missing %PDF header)")
+
+        self.digest.update(data)
+        if self.file is None:
+            self.file = await aiofiles.open(self.path, 'wb')
+        await self.file.write(data)
+
+    async def finish(self):
+        """End of the part: close the file and apply the whole-file checks"""
+        await self._close()
+        if self.size == 0:
+            raise UploadRejected(400, f"'{self.filename}' is empty. Please upload a valid PDF")
+        if not self.header_ok:
+            raise UploadRejected(400, f"'{self.filename}' is not a valid PDF (missing %PDF header)")
+        self.finished = True
+
+    async def discard(self):
+        await self._close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    async def _close(self):
+        if self.file is not None:
+            await self.file.close()
+            self.file = None
+
+
+# ============================================================================
+# REQUEST PARSING
+# ============================================================================
+
+async def stream_pdf_uploads(request, path_for: Callable[[int], str], max_bytes: int, max_files: int,
+                             field_name: str = UploadStreamConfig.FIELD_NAME) -> List[StoredUpload]:
+    """
+    Stream every PDF part named field_name of a multipart/form-data body to disk
+
+    path_for(i) gives the destination of the i-th file; max_bytes applies to
+    each file. Raises UploadRejected for a malformed request, no file, too
+    many files, or any non-PDF, empty or oversized file; no partial files are
+    left behind.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadRejected(400, "Expected a multipart/form-data upload")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() \
+            and int(content_length) > max_bytes * max_files + UploadStreamConfig.MULTIPART_OVERHEAD_BYTES:
+        raise UploadRejected(413, f"Upload too large. Max {max_bytes // 1024 // 1024}MB per file allowed")
+
+    # Parser callbacks are synchronous: they queue (writer, data) pairs, which
+    # are written after each feed; data None marks the end of a file part
+    part: Dict = {}
+    pending: List[Tuple[_PdfPartWriter, Optional[bytes]]] = []
+    writers: List[_PdfPartWriter] = []
+    header = {"field": b"", "value": b""}
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, writer=None)
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][header["field"].lower()] = header["value"]
+        header["field"], header["value"] = b"", b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = disposition.get(b"filename")
+        if name != field_name or filename is None:
+            return
+        filename = os.path.basename(filename.decode("utf-8", "replace").replace("\\", "/"))
+        if not filename.lower().endswith(".pdf"):
+            raise UploadRejected(400, f"Only PDF files allowed. '{filename}' must end with .pdf")
+        if len(writers) >= max_files:
+            raise UploadRejected(400, f"Too many files. Max {max_files} per upload")
+        part["writer"] = _PdfPartWriter(path_for(len(writers)), max_bytes, filename)
+        writers.append(part["writer"])
+
+    def on_part_data(data, start, end):
+        if part.get("writer"):
+            pending.append((part["writer"], bytes(data[start:end])))
+
+    def on_part_end():
+        if part.get("writer"):
+            pending.append((part["writer"], None))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except UploadRejected:
+                raise
+            except Exception as e:
+                raise UploadRejected(400, f"Malformed upload: {e}")
+            for writer, data in pending:
+                if data is None:
+                    await writer.finish()
+                else:
+                    await writer.write(data)
+            pending.clear()
+
+        if not writers:
+            raise UploadRejected(400, "No file provided")
+        if not all(writer.finished for writer in writers):
+            raise UploadRejected(400, "Malformed upload: incomplete file part")
+    except BaseException:
+        for writer in writers:
+            await writer.discard()
+        raise
+
+    return [
+        StoredUpload(path=writer.path, filename=writer.filename, size=writer.size, sha256=writer.digest.hexdigest())
+        for writer in writers
+    ]
+
+
+async def stream_pdf_upload(request, dest_path: str, max_bytes: int,
+                            field_name: str = UploadStreamConfig.FIELD_NAME) -> StoredUpload:
+    """Stream the single PDF in a multipart/form-data request body to dest_path"""
+    uploads = await stream_pdf_uploads(request, lambda i: dest_path, max_bytes, 1, field_name)
+    return uploads[0]
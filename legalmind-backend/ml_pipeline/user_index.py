@@ -0,0 +1,415 @@
+"""
+user_index.py
+=============
+Per-user aggregate vector index for cross-document search
+Every processed document's chunk vectors are added to its owner's index, so a
+question like "which of my contracts have auto-renewal?" is one search instead
+of loading every per-document index. Flat (exact) search is used for small
+collections; above a vector-count threshold the index is rebuilt as HNSW.
+Every API worker keeps its own loaded copy: writes are serialized across
+processes with a lock file and reload the index first if another worker saved
+it since, and reads reload a copy that is older than the one on disk.
+"""
+
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock (run a single API worker)
+    fcntl = None
+
+load_dotenv()
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class UserIndexConfig:
+    """Per-user index settings (from .env)"""
+
+    INDEX_DIR = os.getenv("USER_INDEX_DIR", "user_indexes")
+    MAX_LOADED_USERS = int(os.getenv("USER_INDEX_MAX_LOADED", "8"))
+
+    # Switch from exact to HNSW search at this many vectors (back to flat below half of it)
+    ANN_THRESHOLD = int(os.getenv("USER_INDEX_ANN_THRESHOLD", "20000"))
+    HNSW_M = 32
+    HNSW_EF_CONSTRUCTION = 80
+    HNSW_EF_SEARCH = 64
+
+    # HNSW cannot delete in place: deleted ids are filtered at search time
+    # and the index is rebuilt once they exceed this share of all vectors
+    MAX_TOMBSTONE_RATIO = 0.2
+
+    SNIPPET_CHARS = 300
+
+
+# ============================================================================
+# USER INDEX
+# ============================================================================
+
+class UserVectorIndex:
+    """One user's vectors from all of their documents"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index = None  # faiss.IndexIDMap2 over IndexFlatL2 or IndexHNSWFlat
+        self.dim: Optional[int] = None
+        self.entries: Dict[int, Dict] = {}      # vector id -> {document_id, chunk_id, text}
+        self.documents: Dict[str, Dict] = {}    # document_id -> {name, ids}
+        self.deleted = set()
+        self.next_id = 0
+        self.version = None  # disk_version() of the files this copy was loaded from or saved to
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def disk_version(path: str) -> Optional[Tuple[int, int]]:
+        """Identity of the saved index (every save replaces meta.json with a new file)"""
+        try:
+            stat = os.stat(os.path.join(path, "meta.json"))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    @property
+    def is_ann(self) -> bool:
+        return self.index is not None and isinstance(faiss.downcast_index(self.index.index), faiss.IndexHNSWFlat)
+
+    def _new_index(self, ann: bool):
+        if ann:
+            base = faiss.IndexHNSWFlat(self.dim, UserIndexConfig.HNSW_M)
+            base.hnsw.efConstruction = UserIndexConfig.HNSW_EF_CONSTRUCTION
+            base.hnsw.efSearch = UserIndexConfig.HNSW_EF_SEARCH
+        else:
+            base = faiss.IndexFlatL2(self.dim)
+        return faiss.IndexIDMap2(base)
+
+    def add_document(self, document_id: str, name: str, vectors: np.ndarray, chunks: List[Dict]):
+        """Add (or replace) a document's vectors"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self.lock:
+            self._remove(document_id)
+            if self.index is None:
+                self.dim = vectors.shape[1]
+                self.index = self._new_index(ann=False)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+
+            ids = np.arange(self.next_id, self.next_id + len(vectors), dtype=np.int64)
+            self.next_id += len(vectors)
+            self.index.add_with_ids(vectors, ids)
+
+            for vector_id, chunk in zip(ids.tolist(), chunks):
+                self.entries[vector_id] = {
+                    "document_id": document_id,
+                    "chunk_id": chunk.get("chunk_id"),
+                    "text": chunk.get("text", "")[:UserIndexConfig.SNIPPET_CHARS],
+                }
+            self.documents[document_id] = {"name": name, "ids": ids.tolist()}
+            self._maybe_rebuild()
+
+    def remove_document(self, document_id: str) -> bool:
+        with self.lock:
+            removed = self._remove(document_id)
+            if removed:
+                self._maybe_rebuild()
+            return removed
+
+    def _remove(self, document_id: str) -> bool:
+        document = self.documents.pop(document_id, None)
+        if not document:
+            return False
+        ids = document["ids"]
+        for vector_id in ids:
+            self.entries.pop(vector_id, None)
+        if self.is_ann:
+            self.deleted.update(ids)
+        elif ids:
+            self.index.remove_ids(np.array(ids, dtype=np.int64))
+        return True
+
+    def _maybe_rebuild(self):
+        live = len(self.entries)
+        if self.is_ann:
+            want_ann = live >= UserIndexConfig.ANN_THRESHOLD // 2
+        else:
+            want_ann = live >= UserIndexConfig.ANN_THRESHOLD
+        too_many_tombstones = self.deleted and \
+            len(self.deleted) > UserIndexConfig.MAX_TOMBSTONE_RATIO * self.index.ntotal
+        if want_ann != self.is_ann or too_many_tombstones:
+            self._rebuild(want_ann)
+
+    def _rebuild(self, ann: bool):
+        ids = np.array(sorted(self.entries), dtype=np.int64)
+        index = self._new_index(ann)
+        if ids.size:
+            vectors = np.vstack([self.index.reconstruct(int(vector_id)) for vector_id in ids])
+            index.add_with_ids(vectors, ids)
+        self.index = index
+        self.deleted.clear()
+        print(f"✓ Rebuilt user index as {'HNSW' if ann else 'flat'} ({ids.size} vectors)")
+
+    def search(self, vector: List[float], k: int) -> List[Dict]:
+        """Nearest chunks across all documents (smaller distance is closer)"""
+        with self.lock:
+            if self.index is None or not self.entries:
+                return []
+            fetch = min(k + len(self.deleted), self.index.ntotal)
+            distances, ids = self.index.search(np.array([vector], dtype=np.float32), fetch)
+
+            hits = []
+            for distance, vector_id in zip(distances[0].tolist(), ids[0].tolist()):
+                entry = self.entries.get(vector_id)
+                if vector_id < 0 or entry is None:
+                    continue
+                hits.append({
+                    **entry,
+                    "document_name": self.documents[entry["document_id"]]["name"],
+                    "distance": round(distance, 4),
+                })
+                if len(hits) == k:
+                    break
+            return hits
+
+    def save(self):
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            if self.index is not None:
+                faiss.write_index(self.index, os.path.join(self.path, "index.faiss.tmp"))
+                os.replace(os.path.join(self.path, "index.faiss.tmp"), os.path.join(self.path, "index.faiss"))
+            meta = {
+                "dim": self.dim,
+                "next_id": self.next_id,
+                "deleted": sorted(self.deleted),
+                "documents": self.documents,
+                "entries": {str(k): v for k, v in self.entries.items()},
+            }
+            with open(os.path.join(self.path, "meta.json.tmp"), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, separators=(',', ':'), ensure_ascii=False)
+            os.replace(os.path.join(self.path, "meta.json.tmp"), os.path.join(self.path, "meta.json"))
+            self.version = self.disk_version(self.path)
+
+    @classmethod
+    def load(cls, path: str) -> "UserVectorIndex":
+        user_index = cls(path)
+        meta_path = os.path.join(path, "meta.json")
+        index_path = os.path.join(path, "index.faiss")
+        if not (os.path.exists(meta_path) and os.path.exists(index_path)):
+            return user_index
+        user_index.version = cls.disk_version(path)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        user_index.index = faiss.read_index(index_path)
+        user_index.dim = meta["dim"]
+        user_index.next_id = meta["next_id"]
+        user_index.deleted = set(meta["deleted"])
+        user_index.documents = meta["documents"]
+        user_index.entries = {int(k): v for k, v in meta["entries"].items()}
+        return user_index
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                "documents": len(self.documents),
+                "vectors": len(self.entries),
+                "type": "hnsw" if self.is_ann else "flat",
+                "tombstones": len(self.deleted),
+            }
+
+
+# ============================================================================
+# MANAGER
+# ============================================================================
+
+def _read_vector_store(vector_db_path: str) -> Tuple[np.ndarray, List[Dict]]:
+    """Vectors and chunk metadata from a saved per-document FAISS store"""
+    from langchain_community.vectorstores import FAISS
+    from ml_pipeline.embedding_cache import get_query_embeddings
+
+    return _store_contents(
+        FAISS.load_local(vector_db_path, get_query_embeddings(), allow_dangerous_deserialization=True)
+    )
+
+
+def _store_contents(store) -> Tuple[np.ndarray, List[Dict]]:
+    """Vectors and chunk metadata of a loaded (or in-memory) FAISS store"""
+    vectors = store.index.reconstruct_n(0, store.index.ntotal)
+    chunks = []
+    for position in range(store.index.ntotal):
+        document = store.docstore.search(store.index_to_docstore_id[position])
+        chunks.append({"chunk_id": document.metadata.get("chunk_id", position), "text": document.page_content})
+    return vectors, chunks
+
+
+class UserIndexManager:
+    """Loads, updates and persists per-user indexes (LRU of loaded users)"""
+
+    def __init__(self, root: str = UserIndexConfig.INDEX_DIR,
+                 max_loaded: int = UserIndexConfig.MAX_LOADED_USERS):
+        self.root = root
+        self.max_loaded = max_loaded
+        self.loaded: "OrderedDict[str, UserVectorIndex]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.write_locks: Dict[str, threading.Lock] = {}
+        self.backfilling = set()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _write_lock(self, user_id: str) -> threading.Lock:
+        with self.lock:
+            return self.write_locks.setdefault(user_id, threading.Lock())
+
+    @contextmanager
+    def _writing(self, user_id: str):
+        """Exclusive write access to a user's index, within this process and across API workers"""
+        with self._write_lock(user_id):
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, f"{user_id}.lock"), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, user_id: str) -> UserVectorIndex:
+        with self.lock:
+            path = os.path.join(self.root, user_id)
+            user_index = self.loaded.get(user_id)
+            # Reload when another API worker has saved the index since it was loaded here
+            if user_index is None or user_index.version != UserVectorIndex.disk_version(path):
+                user_index = UserVectorIndex.load(path)
+                self.loaded[user_id] = user_index
+            self.loaded.move_to_end(user_id)
+
+            # Never unload an index with a write in progress (it would be reloaded stale)
+            for other in list(self.loaded):
+                if len(self.loaded) <= self.max_loaded:
+                    break
+                write_lock = self.write_locks.get(other)
+                if other != user_id and not (write_lock and write_lock.locked()):
+                    del self.loaded[other]
+            return user_index
+
+    def add_document_from_path(self, user_id: str, document_id: str, vector_db_path: str, name: str):
+        """Add (or replace) a processed document's vectors in its owner's index"""
+        self._add_document(user_id, document_id, name, *_read_vector_store(vector_db_path))
+
+    def add_document_from_store(self, user_id: str, document_id: str, store, name: str):
+        """add_document_from_path() for a FAISS store still in memory"""
+        self._add_document(user_id, document_id, name, *_store_contents(store))
+
+    def _add_document(self, user_id: str, document_id: str, name: str, vectors: np.ndarray, chunks: List[Dict]):
+        with self._writing(user_id):
+            user_index = self.get(user_id)
+            user_index.add_document(document_id, name, vectors, chunks)
+            user_index.save()
+        print(f"✓ Added {len(chunks)} vectors from {document_id} to user index")
+
+    def remove_document(self, user_id: str, document_id: str):
+        with self._writing(user_id):
+            user_index = self.get(user_id)
+            if user_index.remove_document(document_id):
+                user_index.save()
+
+    def prune(self, user_id: str, document_ids: Iterable[str]) -> List[str]:
+        """Remove indexed documents that are not in document_ids (deleted elsewhere); returns their ids"""
+        keep = set(document_ids)
+        user_index = self.get(user_id)
+        with user_index.lock:
+            stale = [document_id for document_id in user_index.documents if document_id not in keep]
+        if not stale:
+            return []
+
+        with self._writing(user_id):
+            user_index = self.get(user_id)
+            removed = [document_id for document_id in stale if user_index.remove_document(document_id)]
+            if removed:
+                user_index.save()
+        print(f"✓ Removed {len(removed)} deleted documents from user index")
+        return removed
+
+    def remove_user(self, user_id: str):
+        with self._writing(user_id):
+            with self.lock:
+                self.loaded.pop(user_id, None)
+            shutil.rmtree(os.path.join(self.root, user_id), ignore_errors=True)
+
+    def search(self, user_id: str, vector: List[float], k: int) -> List[Dict]:
+        return self.get(user_id).search(vector, k)
+
+    def backfill(self, user_id: str, documents: List[Dict]) -> int:
+        """
+        Index documents processed before the user index existed (in the background)
+
+        documents: [{"id": ..., "filename": ...}] owned by user_id.
+        Returns how many documents are still waiting to be indexed.
+        """
+        from ml_pipeline.vector_store_cache import get_vector_store_cache
+
+        user_index = self.get(user_id)
+        with user_index.lock:
+            missing = [doc for doc in documents if doc["id"] not in user_index.documents]
+        if not missing:
+            return 0
+
+        with self.lock:
+            if user_id in self.backfilling:
+                return len(missing)
+            self.backfilling.add(user_id)
+
+        def run():
+            try:
+                for doc in missing:
+                    try:
+                        get_vector_store_cache().load(
+                            doc["id"],
+                            user_id,
+                            lambda path: self.add_document_from_path(user_id, doc["id"], path, doc.get("filename") or "document")
+                        )
+                    except Exception as e:
+                        print(f"⚠️  Could not index {doc['id']} for cross-document search: {e}")
+            finally:
+                with self.lock:
+                    self.backfilling.discard(user_id)
+
+        threading.Thread(target=run, daemon=True).start()
+        return len(missing)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            loaded = dict(self.loaded)
+            backfilling = len(self.backfilling)
+        return {
+            "loaded_users": len(loaded),
+            "backfilling_users": backfilling,
+            "vectors_loaded": sum(index.snapshot()["vectors"] for index in loaded.values()),
+        }
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_user_index_manager: Optional[UserIndexManager] = None
+_singleton_lock = threading.Lock()
+
+
+def get_user_index_manager() -> UserIndexManager:
+    """Get or create the per-user index manager"""
+    global _user_index_manager
+    if _user_index_manager is None:
+        with _singleton_lock:
+            if _user_index_manager is None:
+                _user_index_manager = UserIndexManager()
+    return _user_index_manager
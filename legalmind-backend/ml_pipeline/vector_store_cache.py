@@ -0,0 +1,231 @@
+"""
+vector_store_cache.py
+=====================
+Read-through local disk cache of persisted FAISS vector stores
+On first chat about a document that is not on local disk, its index is
+downloaded from Supabase storage and unpacked here, then reused. Bounded by a
+disk budget with LRU eviction; concurrent requests for one document share a
+single download.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+T = TypeVar("T")
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+class VectorStoreCacheConfig:
+    """Vector store disk cache settings (from .env)"""
+
+    CACHE_DIR = os.getenv("VECTOR_CACHE_DIR", "vector_cache")
+    DISK_BUDGET_MB = float(os.getenv("VECTOR_CACHE_DISK_MB", "2048"))
+    META_FILE = ".cache_meta.json"
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+class VectorStoreDiskCache:
+    """LRU of unpacked vector store directories, keyed by document id"""
+
+    def __init__(
+        self,
+        root: str = VectorStoreCacheConfig.CACHE_DIR,
+        disk_budget_mb: float = VectorStoreCacheConfig.DISK_BUDGET_MB
+    ):
+        self.root = root
+        self.disk_budget = int(disk_budget_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.doc_locks: Dict[str, threading.Lock] = {}
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()  # document_id -> {size, user_id}
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "downloads": 0, "download_failures": 0, "evictions": 0}
+
+        os.makedirs(self.root, exist_ok=True)
+        self._scan()
+
+    def _path(self, document_id: str) -> str:
+        return os.path.join(self.root, document_id)
+
+    def _scan(self):
+        """Rebuild the LRU from disk (oldest access first) so the cache survives restarts"""
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".tmp-"):
+                shutil.rmtree(path, ignore_errors=True)  # Interrupted download
+                continue
+            meta_path = os.path.join(path, VectorStoreCacheConfig.META_FILE)
+            if not os.path.isdir(path) or not os.path.exists(meta_path):
+                continue
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            found.append((os.path.getmtime(meta_path), name, _dir_size(path), meta.get("user_id")))
+
+        for _, document_id, size, user_id in sorted(found):
+            self.entries[document_id] = {"size": size, "user_id": user_id}
+            self.total_bytes += size
+
+    def _doc_lock(self, document_id: str) -> threading.Lock:
+        with self.lock:
+            return self.doc_locks.setdefault(document_id, threading.Lock())
+
+    def _touch(self, document_id: str):
+        with self.lock:
+            if document_id in self.entries:
+                self.entries.move_to_end(document_id)
+        try:
+            os.utime(os.path.join(self._path(document_id), VectorStoreCacheConfig.META_FILE))
+        except OSError:
+            pass
+
+    def _download(self, document_id: str, user_id: str) -> bool:
+        """Download and unpack into a temp dir, then move into place atomically"""
+        from ml_pipeline.supabase_manager import get_supabase_manager
+
+        tmp_path = os.path.join(self.root, f".tmp-{document_id}-{uuid.uuid4().hex[:8]}")
+        started = time.monotonic()
+        try:
+            ok = get_supabase_manager().download_vector_store(document_id, user_id, tmp_path)
+            if not ok or not os.path.isdir(tmp_path) or \
+                    not os.path.exists(os.path.join(tmp_path, "index.faiss")):
+                return False
+
+            with open(os.path.join(tmp_path, VectorStoreCacheConfig.META_FILE), 'w', encoding='utf-8') as f:
+                json.dump({"user_id": user_id, "downloaded_at": time.time()}, f)
+            size = _dir_size(tmp_path)
+            shutil.rmtree(self._path(document_id), ignore_errors=True)  # Stale, untracked copy
+            os.replace(tmp_path, self._path(document_id))
+        finally:
+            if os.path.isdir(tmp_path):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)  # Legacy single-file store (not loadable)
+
+        with self.lock:
+            self.entries[document_id] = {"size": size, "user_id": user_id}
+            self.total_bytes += size
+        print(f"✓ Vector store for {document_id} cached locally "
+              f"({size / 1024 / 1024:.1f} MB in {time.monotonic() - started:.1f}s)")
+        self._evict(keep=document_id)
+        return True
+
+    def _evict(self, keep: Optional[str] = None):
+        """Drop least recently used stores until within the disk budget"""
+        busy = set()
+        while True:
+            with self.lock:
+                if self.total_bytes <= self.disk_budget:
+                    return
+                victim = next((d for d in self.entries if d != keep and d not in busy), None)
+                if victim is None:
+                    return
+                doc_lock = self.doc_locks.setdefault(victim, threading.Lock())
+                # Skip stores that are being loaded right now
+                if not doc_lock.acquire(blocking=False):
+                    busy.add(victim)
+                    continue
+                entry = self.entries.pop(victim)
+                self.total_bytes -= entry["size"]
+                self.stats["evictions"] += 1
+            try:
+                shutil.rmtree(self._path(victim), ignore_errors=True)
+            finally:
+                doc_lock.release()
+
+    def load(self, document_id: str, user_id: str, loader: Callable[[str], T]) -> Optional[T]:
+        """
+        Run loader(local_path) for a document's vector store, downloading it first if needed
+
+        Returns None if the store is neither cached nor downloadable.
+        """
+        with self._doc_lock(document_id):
+            with self.lock:
+                cached = document_id in self.entries
+            if cached:
+                with self.lock:
+                    self.stats["hits"] += 1
+            else:
+                if not self._download(document_id, user_id):
+                    with self.lock:
+                        self.stats["download_failures"] += 1
+                    return None
+                with self.lock:
+                    self.stats["downloads"] += 1
+
+            self._touch(document_id)
+            # Loading happens under the document lock so eviction cannot race it
+            return loader(self._path(document_id))
+
+    def invalidate(self, document_id: str):
+        """Remove a document's cached store (e.g. document deleted)"""
+        with self._doc_lock(document_id):
+            with self.lock:
+                entry = self.entries.pop(document_id, None)
+                if entry:
+                    self.total_bytes -= entry["size"]
+            shutil.rmtree(self._path(document_id), ignore_errors=True)
+
+    def invalidate_user(self, user_id: str):
+        """Remove every cached store belonging to a user"""
+        with self.lock:
+            owned = [d for d, entry in self.entries.items() if entry.get("user_id") == user_id]
+        for document_id in owned:
+            self.invalidate(document_id)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                **self.stats,
+                "documents": len(self.entries),
+                "disk_bytes": self.total_bytes,
+                "disk_budget_bytes": self.disk_budget,
+            }
+
+
+# ============================================================================
+# SINGLETON INSTANCE
+# ============================================================================
+
+_vector_store_cache: Optional[VectorStoreDiskCache] = None
+_singleton_lock = threading.Lock()
+
+
+def get_vector_store_cache() -> VectorStoreDiskCache:
+    """Get or create the vector store disk cache"""
+    global _vector_store_cache
+    if _vector_store_cache is None:
+        with _singleton_lock:
+            if _vector_store_cache is None:
+                _vector_store_cache = VectorStoreDiskCache()
+    return _vector_store_cache
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import ml_pipeline the way main.py does (backend directory on the path)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
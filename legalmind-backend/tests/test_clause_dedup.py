@@ -0,0 +1,80 @@
+"""Near-duplicate collapsing of risky chunks produced by the real chunker"""
+
+import re
+
+import pytest
+
+from ml_pipeline.clause_dedup import collapse_near_duplicates, mark_shared_overlaps, overlap_text
+
+Document_loader = pytest.importorskip("ml_pipeline.Document_loader")
+
+LABEL = "Uncapped Liability"
+THRESHOLD = 0.7
+
+
+def _chunks():
+    text = " ".join(
+        f"Clause {n} sets out ordinary obligation number {n} of the parties to this agreement."
+        for n in range(1, 80)
+    )
+    config = Document_loader.PipelineConfig(save_vector_store=False, save_chunks=False)
+    documents = Document_loader.LegalDocumentChunker(config).chunk_document(text, "contract.pdf")
+    return [
+        {'chunk_id': d.metadata['chunk_id'], 'start_index': d.metadata['start_index'], 'text': d.page_content}
+        for d in documents
+    ]
+
+
+def _clauses(text):
+    return set(re.findall(r"Clause (\d+) sets out ordinary obligation number \1 of the parties", text))
+
+
+def _detect(chunks, risky_clauses):
+    """What the risk detector does, with a classifier that flags the given clauses"""
+    def classify(texts):
+        return [
+            {'label': LABEL, 'label_id': 3, 'confidence': 0.95} if _clauses(t) & risky_clauses
+            else {'label': 'Safe', 'label_id': 0, 'confidence': 0.95}
+            for t in texts
+        ]
+
+    risky = []
+    for chunk, result in zip(chunks, classify([c['text'] for c in chunks])):
+        chunk['prediction'] = {'label': result['label'], 'label_id': result['label_id'],
+                               'confidence': result['confidence']}
+        if result['label_id'] != 0:
+            risky.append(chunk)
+    mark_shared_overlaps(risky, classify, THRESHOLD)
+    return risky
+
+
+def test_clause_in_overlap_collapses_neighbours():
+    chunks = _chunks()
+    shared = _clauses(overlap_text(chunks[0], chunks[1]))
+    assert shared, "chunker produced no complete clause in the overlap"
+
+    risky = _detect(chunks, {sorted(shared)[0]})
+    assert [c['chunk_id'] for c in risky] == [0, 1]
+
+    groups = collapse_near_duplicates(risky)
+    assert len(groups) == 1
+    assert groups[0].chunk_ids == [0, 1]
+
+
+def test_neighbours_risky_outside_overlap_stay_apart():
+    chunks = _chunks()
+    shared = _clauses(overlap_text(chunks[0], chunks[1]))
+    only_first = _clauses(chunks[0]['text']) - shared
+    only_second = _clauses(chunks[1]['text']) - shared - _clauses(chunks[2]['text'])
+
+    risky = _detect(chunks, {sorted(only_first)[0], sorted(only_second)[0]})
+    assert [c['chunk_id'] for c in risky] == [0, 1]
+    assert len(collapse_near_duplicates(risky)) == 2
+
+
+def test_risky_run_does_not_chain():
+    chunks = _chunks()[:5]
+    every = set().union(*(_clauses(c['text']) for c in chunks))
+
+    groups = collapse_near_duplicates(_detect(chunks, every))
+    assert all(len(group.members) <= 2 for group in groups)
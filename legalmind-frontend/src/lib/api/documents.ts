@@ -1,4 +1,5 @@
 import { supabase } from "@/integrations/supabase/client";
+import { notifyDocumentDeleted } from "@/lib/api/legalBackend";
 
 export interface Document {
   id: string;
@@ -198,5 +199,12 @@ export async function deleteDocument(documentId: string): Promise<void> {
     console.error("Error deleting document:", error);
     throw error;
   }
+
+  // Best effort: the backend also forgets documents it finds missing later
+  try {
+    await notifyDocumentDeleted(documentId);
+  } catch (notifyError) {
+    console.error("Error notifying backend of document deletion:", notifyError);
+  }
 }
 
@@ -20,10 +20,22 @@ async function getAuthHeaders(): Promise<Record<string, string>> {
   return {};
 }
 
+// Per-tab conversation id; lets the backend keep signed-out users' chat summaries apart
+function getChatSessionId(): string {
+  const key = "legalmind-chat-session";
+  let id = sessionStorage.getItem(key);
+  if (!id) {
+    id = crypto.randomUUID();
+    sessionStorage.setItem(key, id);
+  }
+  return id;
+}
+
 export interface UploadResponse {
   job_id: string;
   status: "pending" | "processing" | "completed" | "failed";
   message: string;
+  queue_position?: number | null;
 }
 
 export interface JobResult {
@@ -41,6 +53,12 @@ export interface JobResult {
   safe_file: string;
 }
 
+export interface JobProgressDetail {
+  unit: "pages" | "chunks" | "clauses" | string;
+  done: number;
+  total: number;
+}
+
 export interface JobStatusResponse {
   job_id: string;
   status: "pending" | "processing" | "completed" | "failed";
@@ -48,8 +66,42 @@ export interface JobStatusResponse {
   stage: string;
   result: JobResult | null;
   error: string | null;
+  queue_position?: number | null;
+  detail?: JobProgressDetail | null;
+}
+
+export interface BatchUploadResponse {
+  batch_id: string;
+  status: "pending" | "processing" | "completed" | "failed";
+  message: string;
+  documents: { job_id: string; file_name: string }[];
+  queue_position?: number | null;
 }
 
+export interface BatchDocumentStatus {
+  job_id: string;
+  file_name: string;
+  status: "pending" | "processing" | "completed" | "failed";
+  progress: number;
+  stage: string;
+  error: string | null;
+}
+
+export interface BatchStatusResponse {
+  batch_id: string;
+  status: "pending" | "processing" | "completed" | "failed";
+  progress: number;
+  stage: string;
+  documents: BatchDocumentStatus[];
+  completed: number;
+  failed: number;
+  queue_position?: number | null;
+  detail?: JobProgressDetail | null;
+}
+
+// Pushed job state (same fields as JobStatusResponse, without the result)
+export type JobProgressEvent = Omit<JobStatusResponse, "result">;
+
 export interface DocumentSummary extends JobResult {
   id: string;
   document_id: string;
@@ -80,6 +132,7 @@ export interface ChatRequest {
   document_id: string;
   message: string;
   chat_history: ChatHistoryItem[];
+  session_id?: string;
 }
 
 export interface ChatResponse {
@@ -101,6 +154,7 @@ export interface ChatbotRequest {
   message: string;
   chat_history?: ChatHistoryItem[];
   document_id?: string;
+  session_id?: string;
 }
 
 export interface ChatbotHealthResponse {
@@ -123,6 +177,8 @@ async function handleResponse<T>(response: Response): Promise<T> {
         message = data.error;
       } else if (typeof data?.message === "string") {
         message = data.message;
+      } else if (typeof data?.detail === "string") {
+        message = data.detail;
       }
     } catch {
       // ignore JSON parse errors
@@ -150,6 +206,32 @@ export async function uploadDocument(file: File, userId?: string): Promise<Uploa
   return handleResponse<UploadResponse>(response);
 }
 
+export async function uploadDocumentsBatch(files: File[], userId?: string): Promise<BatchUploadResponse> {
+  const formData = new FormData();
+  files.forEach((file) => formData.append("files", file));
+
+  const headers = await getAuthHeaders();
+  if (userId) {
+    headers["user-id"] = userId;
+  }
+
+  const response = await fetch(`${API_BASE_URL}/api/v1/upload/batch`, {
+    method: "POST",
+    headers,
+    body: formData,
+  });
+
+  return handleResponse<BatchUploadResponse>(response);
+}
+
+export async function getBatchStatus(batchId: string): Promise<BatchStatusResponse> {
+  const headers = await getAuthHeaders();
+  const response = await fetch(`${API_BASE_URL}/api/v1/batch/${batchId}`, {
+    headers,
+  });
+  return handleResponse<BatchStatusResponse>(response);
+}
+
 export async function getJobStatus(jobId: string): Promise<JobStatusResponse> {
   const headers = await getAuthHeaders();
   const response = await fetch(`${API_BASE_URL}/api/v1/job/${jobId}`, {
@@ -158,6 +240,53 @@ export async function getJobStatus(jobId: string): Promise<JobStatusResponse> {
   return handleResponse<JobStatusResponse>(response);
 }
 
+/**
+ * Subscribe to pushed job progress (Server-Sent Events).
+ * onEnd fires once with the final state; onUnavailable fires if the stream
+ * cannot be used, so the caller can fall back to polling getJobStatus.
+ * Returns a function that closes the stream.
+ */
+export function subscribeJobStatus(
+  jobId: string,
+  handlers: {
+    onProgress: (event: JobProgressEvent) => void;
+    onEnd: (event: JobProgressEvent) => void;
+    onUnavailable: () => void;
+  }
+): () => void {
+  if (typeof EventSource === "undefined") {
+    handlers.onUnavailable();
+    return () => {};
+  }
+
+  const source = new EventSource(`${API_BASE_URL}/api/v1/job/${jobId}/events`);
+  let finished = false;
+  const finish = () => {
+    finished = true;
+    source.close();
+  };
+
+  source.addEventListener("progress", (e) => {
+    handlers.onProgress(JSON.parse((e as MessageEvent).data));
+  });
+  for (const name of ["completed", "failed"]) {
+    source.addEventListener(name, (e) => {
+      finish();
+      handlers.onEnd(JSON.parse((e as MessageEvent).data));
+    });
+  }
+  source.onerror = () => {
+    if (finished) return;
+    finish();
+    handlers.onUnavailable();
+  };
+
+  return () => {
+    finished = true;
+    source.close();
+  };
+}
+
 export async function getDocuments(): Promise<DocumentSummary[]> {
   const headers = await getAuthHeaders();
   const response = await fetch(`${API_BASE_URL}/api/v1/documents`, {
@@ -207,6 +336,7 @@ export async function chatWithDocument(
     document_id: documentId,
     message,
     chat_history: chatHistory,
+    session_id: getChatSessionId(),
   };
 
   const headers = await getAuthHeaders();
@@ -242,6 +372,7 @@ export async function chatWithBot(
     message,
     chat_history: chatHistory,
     document_id: documentId,
+    session_id: getChatSessionId(),
   };
 
   const headers = await getAuthHeaders();
@@ -332,6 +463,17 @@ export async function deleteChatHistory(
   return handleResponse<{ status: string }>(response);
 }
 
+// Lets the backend drop its cached copies of a document deleted from Supabase
+export async function notifyDocumentDeleted(documentId: string): Promise<void> {
+  const headers = await getAuthHeaders();
+  const response = await fetch(`${API_BASE_URL}/api/v1/document/${documentId}`, {
+    method: "DELETE",
+    headers,
+  });
+
+  await handleResponse<{ status: string }>(response);
+}
+
 export async function deleteAccount(): Promise<{ status: string; message: string }> {
   const headers = await getAuthHeaders();
   const response = await fetch(
@@ -18,6 +18,8 @@ import { useAuth } from "@/contexts/AuthContext";
 import {
   uploadDocument,
   getJobStatus,
+  subscribeJobStatus,
+  type JobProgressEvent,
   type JobStatusResponse,
 } from "@/lib/api/legalBackend";
 
@@ -28,7 +30,7 @@ interface UploadFile {
   status: "pending" | "uploading" | "processing" | "complete" | "error";
   error?: string;
   jobId?: string;
-  jobStatus?: JobStatusResponse;
+  jobStatus?: JobStatusResponse | JobProgressEvent;
 }
 
 const SUPPORTED_FORMATS = [".pdf"];
@@ -43,35 +45,39 @@ const UploadDocument = () => {
   const [uploading, setUploading] = useState(false);
   const [activeJobId, setActiveJobId] = useState<string | null>(null);
 
-  // Poll job status every 2 seconds while processing
+  // Follow job progress: pushed over SSE, polling every 2 seconds as a fallback
   useEffect(() => {
     if (!activeJobId) return;
 
     let isCancelled = false;
 
+    const applyStatus = (status: JobStatusResponse | JobProgressEvent) => {
+      setFiles((prev) =>
+        prev.map((f) =>
+          f.jobId === activeJobId
+            ? {
+                ...f,
+                progress: status.progress ?? f.progress,
+                status:
+                  status.status === "completed"
+                    ? "complete"
+                    : status.status === "failed"
+                    ? "error"
+                    : "processing",
+                jobStatus: status,
+              }
+            : f,
+        ),
+      );
+    };
+
     const poll = async () => {
       try {
         const status = await getJobStatus(activeJobId);
 
         if (isCancelled) return;
 
-        setFiles((prev) =>
-          prev.map((f) =>
-            f.jobId === activeJobId
-              ? {
-                  ...f,
-                  progress: status.progress ?? f.progress,
-                  status:
-                    status.status === "completed"
-                      ? "complete"
-                      : status.status === "failed"
-                      ? "error"
-                      : "processing",
-                  jobStatus: status,
-                }
-              : f,
-          ),
-        );
+        applyStatus(status);
 
         if (status.status === "completed" && status.result?.document_id) {
           toast({
@@ -106,10 +112,22 @@ const UploadDocument = () => {
       }
     };
 
-    poll();
+    const unsubscribe = subscribeJobStatus(activeJobId, {
+      onProgress: (event) => {
+        if (!isCancelled) applyStatus(event);
+      },
+      // The final state (and the result on success) comes from one status request
+      onEnd: () => {
+        if (!isCancelled) poll();
+      },
+      onUnavailable: () => {
+        if (!isCancelled) poll();
+      },
+    });
 
     return () => {
       isCancelled = true;
+      unsubscribe();
     };
   }, [activeJobId, navigate, toast]);
 
@@ -237,11 +255,13 @@ const UploadDocument = () => {
   const hasErrors = files.some(f => f.status === "error");
   const activeFile = files.find(f => f.jobId === activeJobId) || files[0];
   const stage = activeFile?.jobStatus?.stage;
+  const detail = activeFile?.jobStatus?.detail;
 
   const getStageIndex = () => {
     if (!stage) return 0;
     switch (stage) {
       case "Extracting text from PDF":
+      case "Embedding document chunks":
         return 1;
       case "Detecting risks with AI model":
         return 2;
@@ -355,6 +375,7 @@ const UploadDocument = () => {
                   />
                   <p className="text-xs text-muted-foreground">
                     {stage ?? "Waiting for analysis to start..."}
+                    {detail && detail.total > 0 && ` (${detail.done}/${detail.total} ${detail.unit})`}
                   </p>
                 </div>
               </CardContent>